@@ -0,0 +1,80 @@
+# Artwork sources: folder sidecar images and embedded tag pictures
+import os
+from typing import Iterable, List, Optional
+
+# Sidecar file stems in order of preference, and accepted image types
+SIDECAR_NAMES = ("cover", "folder", "front", "album", "albumart", "albumartlarge", "artwork")
+SIDECAR_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def find_sidecar(directory: str, files: List[str]) -> Optional[str]:
+    """Pick the best sidecar image from a directory listing (no extra syscalls)."""
+    best = None
+    best_rank = None
+    for file in files:
+        stem, ext = os.path.splitext(file)
+        ext = ext.lower()
+        stem = stem.lower()
+        if ext not in SIDECAR_EXTENSIONS or stem not in SIDECAR_NAMES:
+            continue
+        rank = (SIDECAR_NAMES.index(stem), SIDECAR_EXTENSIONS.index(ext))
+        if best_rank is None or rank < best_rank:
+            best, best_rank = file, rank
+    return os.path.join(directory, best) if best else None
+
+
+def embedded_picture(audio) -> Optional[bytes]:
+    """Return the first picture from an already-parsed (non-easy) Mutagen file."""
+    if audio is None:
+        return None
+    from mutagen.id3 import ID3
+    from mutagen.flac import FLAC
+    from mutagen.mp4 import MP4
+
+    # MP3 with ID3 tags
+    if isinstance(audio, ID3) or (hasattr(audio, 'tags') and isinstance(audio.tags, ID3)):
+        for key in audio.tags.keys():
+            if key.startswith('APIC'):
+                return audio.tags[key].data
+
+    # FLAC
+    elif isinstance(audio, FLAC) and audio.pictures:
+        return audio.pictures[0].data
+
+    # MP4/M4A
+    elif isinstance(audio, MP4) and audio.tags and 'covr' in audio.tags:
+        return bytes(audio.tags['covr'][0])
+
+    return None
+
+
+def extract_embedded_art(paths: Iterable[str]) -> Optional[bytes]:
+    """Return the first embedded picture found in the given audio files."""
+    # Imported on first use: tag parsing is not needed to start serving
+    from mutagen import File as MutagenFile
+    for path in paths:
+        if not os.path.exists(path): continue
+        try:
+            image_data = embedded_picture(MutagenFile(path))
+            if image_data:
+                return image_data
+        except Exception:
+            continue
+    return None
+
+
+def has_embedded_art(path: str, parsed=None) -> bool:
+    """
+    True if the file carries an embedded picture. `parsed` is a Mutagen file
+    already opened for `path`; it is reused unless it is an easy-mode wrapper
+    (EasyID3/EasyMP4 tags hide the pictures), which costs one more open.
+    """
+    if parsed is not None:
+        from mutagen.easyid3 import EasyID3
+        from mutagen.easymp4 import EasyMP4Tags
+        if not isinstance(parsed.tags, (EasyID3, EasyMP4Tags)):
+            try:
+                return embedded_picture(parsed) is not None
+            except Exception:
+                return False
+    return extract_embedded_art([path]) is not None
@@ -29,30 +29,42 @@ a = Analysis(
         'starlette',
         'pydantic',
         'mutagen',
-        'watchdog',
-        'watchdog.observers',
-        'watchdog.events',
         # App modules
         'main',
         'database',
         'models',
         'scanner',
         'scanner_progress',
-        'streamer',
+        'search_index',
+        'changelog',
+        'user_data_buffer',
+        'cover_store',
+        'artwork',
+        'lyrics',
+        'stream_cache',
+        'm3u',
+        'smart_rules',
+        'metrics',
+        'log_setup',
+        'sampling_profiler',
+        'migrate_db',
         'router',
         'router.library',
         'router.stream',
         'router.media',
         'router.playlists',
+        'router.smart_playlists',
         'PIL',
         'PIL.Image',
         'PIL.JpegImagePlugin',
         'PIL.PngImagePlugin',
+        'PIL.WebPImagePlugin',
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Unused GUI toolkit: less for the one-file bootloader to unpack on every launch
+    excludes=['tkinter'],
     noarchive=False,
     optimize=0,
 )
@@ -69,7 +81,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-packed libraries are decompressed on every launch; startup beats size here
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,  # Hide console window in production
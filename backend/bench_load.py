@@ -0,0 +1,442 @@
+"""
+Load benchmark for the hot API endpoints at library scale.
+
+Generates a synthetic library (music.db plus a small pool of dummy audio
+files and sidecar covers) in its own data directory, starts the backend on
+it, and drives each endpoint with concurrent keep-alive clients. Reports
+p50/p99 latency, throughput and the server's RSS per endpoint.
+
+    uv run python bench_load.py generate --songs 500000
+    uv run python bench_load.py run --concurrency 8 --duration 10 --json after.json
+    uv run python bench_load.py run --compare before.json
+
+Data is seeded, so the same --songs/--seed always produce the same library.
+The cover cache is cleared before every run so runs start from the same state.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BACKEND_DIR, "bench_data")
+META_FILE = "bench_meta.json"
+ENDPOINTS = ("songs", "search", "albums", "genres", "covers", "stream")
+
+INSERT_BATCH = 10000
+READY_TIMEOUT = 300.0
+RSS_SAMPLE_INTERVAL = 0.1
+STREAM_RANGE_BYTES = 64 * 1024
+
+SYLLABLES = ("ka", "lo", "mi", "ra", "ven", "tor", "sa", "el", "qui", "dan", "bra", "zu",
+             "no", "fi", "gar", "lin", "mo", "rek", "sha", "tu", "vi", "wen", "yo", "xel")
+GENRES = ("Rock", "Pop", "Jazz", "Electronic", "Hip-Hop", "Classical", "Folk", "Metal", "Blues",
+          "Soul", "Reggae", "Country", "Ambient", "Punk", "Funk", "Indie", "R&B", "Techno")
+
+
+# --- GENERATION ---
+def _words(rng: random.Random, count: int):
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize())
+    return sorted(words)
+
+
+def _phrase(rng: random.Random, vocabulary, low: int, high: int) -> str:
+    return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(low, high)))
+
+
+def _write_media(media_dir: str, count: int, size_kb: int):
+    """Dummy MP3s: repeated silent MPEG frames (streamed, never parsed)."""
+    frame = b"\xff\xfb\x90\x64" + b"\x00" * 413
+    data = (frame * (size_kb * 1024 // len(frame) + 1))[:size_kb * 1024]
+    paths = []
+    for i in range(count):
+        path = os.path.join(media_dir, "audio", f"{i:05d}.mp3")
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+
+def _write_covers(media_dir: str, count: int, rng: random.Random):
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        path = os.path.join(media_dir, "covers", f"cover_{i:03d}.jpg")
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        Image.new("RGB", (800, 800), color).save(path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def generate(args):
+    data_dir = os.path.abspath(args.data_dir)
+    if os.path.exists(data_dir):
+        if not args.force:
+            sys.exit(f"{data_dir} exists; pass --force to replace it")
+        shutil.rmtree(data_dir)
+    media_dir = os.path.join(data_dir, "media")
+    os.makedirs(os.path.join(media_dir, "audio"))
+    os.makedirs(os.path.join(media_dir, "covers"))
+
+    # The app resolves music.db/covers/logs from here; must be set before importing it
+    os.environ["TREMORS_DATA_DIR"] = data_dir
+    sys.path.insert(0, BACKEND_DIR)
+    from sqlalchemy import insert
+    from database import engine, create_db_and_tables
+    from migrate_db import migrate
+    from models import Album, Song
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    create_db_and_tables()
+    migrate()
+
+    vocabulary = _words(rng, 400)
+    n_albums = max(1, args.songs // 12)
+    n_artists = max(1, args.songs // 40)
+    artists = [_phrase(rng, vocabulary, 1, 2) for _ in range(n_artists)]
+    audio_paths = _write_media(media_dir, min(args.media_files, args.songs), args.media_kb)
+    cover_paths = _write_covers(media_dir, args.cover_images, rng)
+    cover_albums = min(args.cover_albums, n_albums)
+
+    albums = []
+    for album_id in range(1, n_albums + 1):
+        albums.append(dict(
+            id=album_id,
+            title=_phrase(rng, vocabulary, 1, 4),
+            artist=rng.choice(artists),
+            year=rng.randint(1960, 2025),
+            genre=rng.choice(GENRES),
+            cover_path=cover_paths[album_id % len(cover_paths)] if album_id <= cover_albums else None,
+        ))
+    with engine.begin() as conn:
+        for i in range(0, len(albums), INSERT_BATCH):
+            conn.execute(insert(Album.__table__), albums[i:i + INSERT_BATCH])
+
+    epoch = datetime(2020, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for song_id in range(1, args.songs + 1):
+            album = albums[rng.randrange(n_albums)]
+            genre = album["genre"] if rng.random() < 0.8 else f"{album['genre']}, {rng.choice(GENRES)}"
+            path = audio_paths[song_id - 1] if song_id <= len(audio_paths) else os.path.join(media_dir, "missing", f"{song_id:07d}.mp3")
+            batch.append(dict(
+                title=_phrase(rng, vocabulary, 1, 4),
+                artist=album["artist"] if rng.random() < 0.9 else rng.choice(artists),
+                album_id=album["id"],
+                path=path,
+                track_number=rng.randint(1, 14),
+                disc_number=1,
+                genre=genre,
+                year=album["year"],
+                duration=rng.uniform(90, 480),
+                file_size=rng.randint(2_000_000, 12_000_000),
+                bitrate=rng.choice((128, 192, 256, 320)),
+                sample_rate=44100,
+                channels=2,
+                format="mp3",
+                codec="MPEGInfo",
+                date_added=(epoch + timedelta(minutes=song_id)).isoformat(),
+                play_count=rng.choice((0, 0, 0, 1, 2, 5, 12)),
+                rating=rng.choice((None, None, None, 3, 4, 5)),
+            ))
+            if len(batch) >= INSERT_BATCH:
+                conn.execute(insert(Song.__table__), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Song.__table__), batch)
+    engine.dispose()
+
+    meta = {
+        "songs": args.songs,
+        "albums": n_albums,
+        "artists": n_artists,
+        "media_files": len(audio_paths),
+        "media_bytes": args.media_kb * 1024,
+        "cover_albums": cover_albums,
+        "seed": args.seed,
+        "vocabulary": vocabulary,
+    }
+    with open(os.path.join(data_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    print(f"Generated {args.songs} songs, {n_albums} albums, {len(audio_paths)} media files "
+          f"in {time.perf_counter() - started:.1f}s -> {data_dir}")
+
+
+# --- LOAD ---
+def _scenarios(meta):
+    """Endpoint -> function(rng) returning (path, headers)."""
+    songs, albums, vocabulary = meta["songs"], meta["albums"], meta["vocabulary"]
+
+    def stream(rng):
+        start = rng.randrange(max(1, meta["media_bytes"] - STREAM_RANGE_BYTES))
+        return f"/stream/{rng.randint(1, meta['media_files'])}", {"Range": f"bytes={start}-{start + STREAM_RANGE_BYTES - 1}"}
+
+    return {
+        "songs": lambda rng: (f"/library/songs?offset={rng.randrange(max(1, songs - 100))}&limit=100", {}),
+        "search": lambda rng: (f"/library/search?q={rng.choice(vocabulary)[:rng.randint(3, 6)]}&limit=20", {}),
+        "albums": lambda rng: (f"/library/albums?offset={rng.randrange(max(1, albums - 50))}&limit=50", {}),
+        "genres": lambda rng: ("/library/genres", {}),
+        "covers": lambda rng: (f"/covers/{rng.randint(1, max(1, meta['cover_albums']))}?size=300&format=jpeg", {}),
+        "stream": stream,
+    }
+
+
+def _rss_bytes(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def _percentile(ordered, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _request(conn, path, headers):
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def _attempt(conn, port: int, path, headers):
+    """One request; a broken connection counts as status 599 and is replaced. Returns (conn, status)."""
+    try:
+        return conn, _request(conn, path, headers)
+    except (OSError, http.client.HTTPException):
+        conn.close()
+        return http.client.HTTPConnection("127.0.0.1", port, timeout=60), 599
+
+
+def drive(port: int, pid: int, scenario, concurrency: int, duration: float, warmup: int, seed: int):
+    """Run one endpoint scenario; returns its latency/throughput/RSS summary."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    peak_rss = [_rss_bytes(pid)]
+    stop = threading.Event()
+
+    def sample_rss():
+        while not stop.wait(RSS_SAMPLE_INTERVAL):
+            rss = _rss_bytes(pid)
+            if rss is not None and (peak_rss[0] is None or rss > peak_rss[0]):
+                peak_rss[0] = rss
+
+    # The clock starts once every client has finished its warm-up
+    window = []
+    ready = threading.Barrier(concurrency, action=lambda: window.append(time.perf_counter()))
+
+    def client(index: int):
+        rng = random.Random(seed * 1000 + index)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        local, failed = [], 0
+        try:
+            # Unmeasured requests first (connection setup, first-hit caches)
+            for _ in range(warmup):
+                conn, _ = _attempt(conn, port, *scenario(rng))
+            ready.wait()
+        except threading.BrokenBarrierError:
+            # Another client failed: nobody measures
+            conn.close()
+            return
+        except BaseException:
+            # Release the clients already waiting instead of leaving them blocked
+            ready.abort()
+            conn.close()
+            raise
+        deadline = window[0] + duration
+        while time.perf_counter() < deadline:
+            path, headers = scenario(rng)
+            started = time.perf_counter()
+            conn, status = _attempt(conn, port, path, headers)
+            local.append(time.perf_counter() - started)
+            if status >= 400:
+                failed += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stop.set()
+    sampler.join()
+    if not window:
+        raise RuntimeError("A client failed during warm-up; nothing was measured")
+    elapsed = time.perf_counter() - window[0]
+
+    latencies.sort()
+    rss = _rss_bytes(pid)
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p99_ms": _percentile(latencies, 0.99) * 1000 if latencies else None,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else None,
+        "max_ms": latencies[-1] * 1000 if latencies else None,
+        "rss_mb": rss / 2**20 if rss is not None else None,
+        "peak_rss_mb": peak_rss[0] / 2**20 if peak_rss[0] is not None else None,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port: int, proc, vocabulary):
+    """Until the server answers and the background warm-up (suggestion index) is done."""
+    probe = f"/library/suggest?q={vocabulary[0][:2]}"
+    started = time.perf_counter()
+    while time.perf_counter() - started < READY_TIMEOUT:
+        if proc.poll() is not None:
+            sys.exit(f"Backend exited with status {proc.returncode}")
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            conn.request("GET", probe)
+            response = conn.getresponse()
+            if response.status == 200 and json.loads(response.read()):
+                return time.perf_counter() - started
+        except (OSError, http.client.HTTPException, ValueError):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.1)
+    sys.exit(f"Backend not ready within {READY_TIMEOUT:.0f}s")
+
+
+def _fmt(value, spec: str = ".1f") -> str:
+    return "n/a" if value is None else format(value, spec)
+
+
+def _delta(new, old) -> str:
+    if new is None or not old:
+        return ""
+    return f" ({new / old - 1:+.0%})"
+
+
+def report(results, baseline=None):
+    header = f"{'endpoint':<8} {'reqs':>7} {'errors':>6} {'req/s':>9} {'p50 ms':>14} {'p99 ms':>14} {'max ms':>9} {'rss MB':>8} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        old = (baseline or {}).get(name, {})
+        p50 = _fmt(r["p50_ms"], ".2f") + _delta(r["p50_ms"], old.get("p50_ms"))
+        p99 = _fmt(r["p99_ms"], ".2f") + _delta(r["p99_ms"], old.get("p99_ms"))
+        rps = _fmt(r["throughput"], ".0f") + _delta(r["throughput"], old.get("throughput"))
+        print(f"{name:<8} {r['requests']:>7} {r['errors']:>6} {rps:>9} {p50:>14} {p99:>14} "
+              f"{_fmt(r['max_ms'], '.1f'):>9} {_fmt(r['rss_mb']):>8} {_fmt(r['peak_rss_mb']):>8}")
+
+
+def run(args):
+    data_dir = os.path.abspath(args.data_dir)
+    try:
+        with open(os.path.join(data_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    except OSError:
+        sys.exit(f"No generated library in {data_dir}; run `bench_load.py generate` first")
+    endpoints = args.endpoints.split(",") if args.endpoints else list(ENDPOINTS)
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        sys.exit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    # Same starting state every run: covers are rendered from scratch
+    shutil.rmtree(os.path.join(data_dir, "covers"), ignore_errors=True)
+    port = _free_port()
+    env = dict(os.environ, TREMORS_DATA_DIR=data_dir, TREMORS_PORT=str(port))
+    proc = subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, "backend_build.py")], cwd=BACKEND_DIR,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = _wait_ready(port, proc, meta["vocabulary"])
+        print(f"{meta['songs']} songs, concurrency {args.concurrency}, {args.duration:.0f}s per endpoint "
+              f"(ready in {ready:.1f}s, idle RSS {_fmt((_rss_bytes(proc.pid) or 0) / 2**20)} MB)")
+        scenarios = _scenarios(meta)
+        results = {}
+        for name in endpoints:
+            results[name] = drive(port, proc.pid, scenarios[name], args.concurrency, args.duration, args.warmup, args.seed)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["endpoints"]
+    report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "songs": meta["songs"],
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "python": sys.version.split()[0],
+                "platform": sys.platform,
+                "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "endpoints": results,
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="create the synthetic library")
+    gen.add_argument("--songs", type=int, default=500000)
+    gen.add_argument("--media-files", type=int, default=200, help="songs backed by a real (dummy) audio file")
+    gen.add_argument("--media-kb", type=int, default=256, help="size of each dummy audio file")
+    gen.add_argument("--cover-images", type=int, default=20, help="distinct sidecar cover images")
+    gen.add_argument("--cover-albums", type=int, default=500, help="albums pointing at a sidecar cover")
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    gen.add_argument("--force", action="store_true", help="replace an existing data directory")
+    gen.set_defaults(func=generate)
+
+    load = sub.add_parser("run", help="drive the endpoints and report")
+    load.add_argument("--endpoints", help=f"comma-separated subset of {','.join(ENDPOINTS)}")
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    load.add_argument("--warmup", type=int, default=5, help="unmeasured requests per client first")
+    load.add_argument("--seed", type=int, default=42)
+    load.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    load.add_argument("--json", help="write results here")
+    load.add_argument("--compare", help="results JSON from an earlier run to diff against")
+    load.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Cold-start benchmark for the backend sidecar.
+
+Launches the backend repeatedly (against the app directory's music.db, like
+a normal launch) and measures the time from process start until `GET /`
+answers, then compares the median with a stored baseline.
+
+    uv run python bench_startup.py                          # script (backend_build.py)
+    uv run python bench_startup.py --frozen dist/tremorsmusic.exe
+    uv run python bench_startup.py --update-baseline        # record current numbers
+
+Exits with status 1 when the median is more than --tolerance slower than the
+baseline, or slower than --budget-ms. Baselines are machine-specific and kept
+in startup_baseline.json next to this script (not committed).
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BACKEND_DIR, "startup_baseline.json")
+READY_TIMEOUT = 60.0
+POLL_INTERVAL = 0.01
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _answers(port: int) -> bool:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+    try:
+        conn.request("GET", "/")
+        return conn.getresponse().status == 200
+    except OSError:
+        return False
+    finally:
+        conn.close()
+
+
+def measure_once(command) -> float:
+    """Seconds from spawning `command` until GET / returns 200."""
+    port = _free_port()
+    env = dict(os.environ, TREMORS_PORT=str(port))
+    started = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < READY_TIMEOUT:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Backend exited with status {proc.returncode} before answering")
+            if _answers(port):
+                return time.perf_counter() - started
+            time.sleep(POLL_INTERVAL)
+        raise RuntimeError(f"Backend did not answer within {READY_TIMEOUT:.0f}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def _load_baselines() -> dict:
+    try:
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frozen", metavar="EXE", help="benchmark a PyInstaller build instead of the script")
+    parser.add_argument("--runs", type=int, default=5, help="measured launches (default 5)")
+    parser.add_argument("--warmup", type=int, default=1, help="unmeasured launches first, to settle the OS file cache (default 1)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown over the baseline median (default 0.25 = 25%%)")
+    parser.add_argument("--budget-ms", type=float, help="absolute limit for the median, independent of the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="store this run's median as the new baseline")
+    args = parser.parse_args()
+
+    if args.frozen:
+        kind, command = "frozen", [os.path.abspath(args.frozen)]
+    else:
+        kind, command = "script", [sys.executable, os.path.join(BACKEND_DIR, "backend_build.py")]
+
+    for _ in range(args.warmup):
+        measure_once(command)
+    samples = [measure_once(command) * 1000 for _ in range(args.runs)]
+    median = statistics.median(samples)
+    print(f"{kind}: median {median:.0f}ms, min {min(samples):.0f}ms, max {max(samples):.0f}ms over {len(samples)} runs")
+
+    baselines = _load_baselines()
+    failed = False
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"FAIL: median {median:.0f}ms exceeds the {args.budget_ms:.0f}ms budget")
+        failed = True
+
+    baseline = baselines.get(kind)
+    if args.update_baseline or baseline is None:
+        baselines[kind] = {"median_ms": round(median, 1), "runs": len(samples), "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Baseline for {kind} recorded: {median:.0f}ms")
+    else:
+        limit = baseline["median_ms"] * (1 + args.tolerance)
+        change = median / baseline["median_ms"] - 1
+        print(f"Baseline {baseline['median_ms']:.0f}ms ({change:+.0%}), limit {limit:.0f}ms")
+        if median > limit:
+            print(f"FAIL: startup regressed by {change:.0%} (tolerance {args.tolerance:.0%})")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
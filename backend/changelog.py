@@ -0,0 +1,81 @@
+# Library change log for client-side delta sync
+from typing import Iterable, Optional
+from sqlalchemy import event, insert, delete
+from sqlmodel import Session, select, func
+from models import Song, Album, LibraryChange
+
+TRACKED_ENTITIES = {Song: "song", Album: "album"}
+
+
+def record_changes(session: Session, entity: str, ids: Iterable[int], op: str = "upsert", user_data: bool = False):
+    """
+    Append change rows for mutations the ORM flush hook can't see (bulk UPDATE/DELETE statements).
+    `user_data` marks changes limited to play counts, last_played and ratings.
+    """
+    rows = [{"entity": entity, "entity_id": i, "op": op, "user_data": user_data} for i in ids]
+    if rows:
+        session.connection().execute(insert(LibraryChange.__table__), rows)
+
+
+def record_reset(session: Session):
+    """
+    Mark a full wipe: earlier history is dropped and clients older than this must resync.
+    The marker is inserted before the wipe so it takes the next revision; `rev` has no
+    AUTOINCREMENT and an emptied table would restart at 1, behind clients' `since`.
+    """
+    result = session.connection().execute(
+        insert(LibraryChange.__table__), [{"entity": "library", "entity_id": None, "op": "reset"}]
+    )
+    session.exec(delete(LibraryChange).where(LibraryChange.rev < result.inserted_primary_key[0]))
+
+
+def current_revision(session: Session) -> int:
+    return session.exec(select(func.max(LibraryChange.rev))).one() or 0
+
+
+def content_revision(session: Session, include_user_data: bool) -> int:
+    """Latest revision, ignoring play/rating-only changes unless `include_user_data`."""
+    if include_user_data:
+        return current_revision(session)
+    return session.exec(
+        select(func.max(LibraryChange.rev)).where(LibraryChange.user_data == False)  # noqa: E712
+    ).one() or 0
+
+
+def last_reset_revision(session: Session) -> Optional[int]:
+    return session.exec(
+        select(func.max(LibraryChange.rev)).where(LibraryChange.op == "reset")
+    ).one()
+
+
+def compact(session: Session):
+    """
+    Drop rows superseded by a newer change to the same entity. The latest
+    non-user-data row is kept too, so content_revision never moves backwards.
+    """
+    latest = (
+        select(func.max(LibraryChange.rev))
+        .group_by(LibraryChange.entity, LibraryChange.entity_id, LibraryChange.user_data)
+    )
+    session.exec(delete(LibraryChange).where(LibraryChange.rev.not_in(latest)))
+    session.commit()
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session, flush_context):
+    """Log every ORM insert/update/delete of songs and albums in the same transaction."""
+    rows = []
+    for obj in session.new:
+        entity = TRACKED_ENTITIES.get(type(obj))
+        if entity and obj.id is not None:
+            rows.append({"entity": entity, "entity_id": obj.id, "op": "upsert"})
+    for obj in session.dirty:
+        entity = TRACKED_ENTITIES.get(type(obj))
+        if entity and session.is_modified(obj, include_collections=False):
+            rows.append({"entity": entity, "entity_id": obj.id, "op": "upsert"})
+    for obj in session.deleted:
+        entity = TRACKED_ENTITIES.get(type(obj))
+        if entity:
+            rows.append({"entity": entity, "entity_id": obj.id, "op": "delete"})
+    if rows:
+        session.connection().execute(insert(LibraryChange.__table__), rows)
@@ -0,0 +1,417 @@
+# Content-addressed cover art store
+# Files live at covers/<hash[:2]>/<hash>_<size>.<ext>, keyed by the hash of the
+# embedded image bytes, so artwork shared by many albums is stored once.
+import asyncio
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Optional
+from database import env_int, get_app_dir
+
+COVERS_DIR = os.path.join(get_app_dir(), "covers")
+os.makedirs(COVERS_DIR, exist_ok=True)
+
+# Longest-edge size buckets (px); requests are rounded up to the next bucket
+SIZE_BUCKETS = (64, 150, 300, 600, 1200)
+SIZE_ALIASES = {"small": 300, "full": 1200}
+
+# format -> (file extension, media type, Pillow encoder options)
+FORMATS = {
+    "jpeg": ("jpg", "image/jpeg", {"format": "JPEG", "quality": 85, "optimize": True}),
+    "webp": ("webp", "image/webp", {"format": "WEBP", "quality": 80, "method": 4}),
+}
+
+# Master rendition every smaller size is derived from (no re-parsing audio files)
+MASTER_SIZE = SIZE_BUCKETS[-1]
+MASTER_FORMAT = "jpeg"
+
+# Disk budget for the cover cache (override with TREMORS_COVER_CACHE_MB)
+CACHE_BUDGET_BYTES = env_int("TREMORS_COVER_CACHE_MB", 256, minimum=1) * 1024 * 1024
+# Evict down to this fraction of the budget so eviction doesn't run on every write
+EVICT_TARGET_RATIO = 0.9
+
+RENDITION_RE = re.compile(r"^([0-9a-f]{32})_(\d+)\.(jpg|webp)$")
+
+# Hot in-memory LRU for thumbnails (bytes budget; larger renditions are served from disk)
+HOT_CACHE_BYTES = 16 * 1024 * 1024
+HOT_MAX_SIZE = 300
+
+# Decode/resize runs here, not in the request threadpool streaming also uses
+COVER_WORKERS = min(4, os.cpu_count() or 1)
+_executor = ThreadPoolExecutor(max_workers=COVER_WORKERS, thread_name_prefix="cover")
+_inflight: Dict[Hashable, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+# Pillow is imported on first decode, not at startup: serving cached renditions never needs it
+@lru_cache(maxsize=None)
+def webp_supported() -> bool:
+    from PIL import features
+    return features.check("webp")
+
+
+def resolve_size(size: str) -> int:
+    """Map 'small'/'full' or a pixel count to a size bucket."""
+    if size in SIZE_ALIASES:
+        return SIZE_ALIASES[size]
+    try:
+        px = int(size)
+    except (TypeError, ValueError):
+        return SIZE_ALIASES["small"]
+    for bucket in SIZE_BUCKETS:
+        if px <= bucket:
+            return bucket
+    return SIZE_BUCKETS[-1]
+
+
+def resolve_format(fmt: str, accept: Optional[str] = None) -> str:
+    """Pick the output format: explicit 'jpeg'/'webp', or 'auto' negotiated from the Accept header."""
+    if fmt == "auto":
+        fmt = "webp" if accept and "image/webp" in accept else "jpeg"
+    if fmt == "webp" and not webp_supported():
+        return "jpeg"
+    return fmt if fmt in FORMATS else "jpeg"
+
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def art_hash(image_data: bytes) -> str:
+    return hashlib.blake2b(image_data, digest_size=16).hexdigest()
+
+
+def cover_path(digest: str, size: int, fmt: str) -> str:
+    return os.path.join(COVERS_DIR, digest[:2], f"{digest}_{size}.{FORMATS[fmt][0]}")
+
+
+def etag(digest: str, size: int, fmt: str) -> str:
+    """Strong validator: renditions are immutable for a given content hash."""
+    return f'"{digest}-{size}.{FORMATS[fmt][0]}"'
+
+
+class HotCache:
+    """Byte-bounded LRU of recently served thumbnails."""
+
+    def __init__(self, max_bytes: int = HOT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def discard(self, key: str):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+
+
+hot_cache = HotCache()
+
+
+def render(image_data: bytes, size: int, fmt: str) -> bytes:
+    """Decode, downscale (never upscale) and encode an image."""
+    from PIL import Image
+    img = Image.open(io.BytesIO(image_data))
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.thumbnail((size, size), Image.Resampling.LANCZOS)
+    out_io = io.BytesIO()
+    img.save(out_io, **FORMATS[fmt][2])
+    return out_io.getvalue()
+
+
+def store(digest: str, size: int, fmt: str, data: bytes) -> str:
+    """Atomically write a rendered cover; concurrent writers of the same key are harmless."""
+    path = cover_path(digest, size, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    cover_cache.added(path, len(data))
+    return path
+
+
+class CoverCacheManager:
+    """
+    Tracks every file in COVERS_DIR (size, last access, hit count) and keeps the
+    total under a disk budget. Derived renditions are evicted before masters,
+    least recently used first, then least frequently used. Access times live in
+    memory and are written back as file mtimes at shutdown so LRU order survives
+    restarts.
+    """
+
+    def __init__(self, budget_bytes: int = CACHE_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        # path -> [size, last_access, hits]
+        self._entries: Dict[str, List] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        # While load() walks the directory: files and hashes removed meanwhile,
+        # which the walk may still have listed
+        self._loading = False
+        self._dropped_paths: set = set()
+        self._dropped_digests: set = set()
+        self._cleared = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def load(self):
+        """Index the cache directory, dropping temp files, empty files and legacy per-album covers."""
+        with self._lock:
+            self._loading = True
+            self._dropped_paths = set()
+            self._dropped_digests = set()
+            self._cleared = False
+        entries = {}
+        for root, _, files in os.walk(COVERS_DIR):
+            for file in files:
+                path = os.path.join(root, file)
+                # Pre content-addressing files ({album_id}.jpg) may belong to a reused album id
+                if root == COVERS_DIR or file.endswith(".tmp") or not RENDITION_RE.match(file):
+                    _remove(path)
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if st.st_size == 0:
+                    _remove(path)
+                    continue
+                entries[path] = [st.st_size, st.st_mtime, 0]
+        doomed = []
+        with self._lock:
+            # Runs in the background at startup: files evicted or deleted during the walk
+            # stay gone, and whatever was recorded meanwhile is kept as is
+            for path in list(entries):
+                if path in self._entries:
+                    continue
+                if path in self._dropped_paths:
+                    del entries[path]
+                elif self._cleared or os.path.basename(path)[:32] in self._dropped_digests:
+                    # Deleted by hash before the walk reported it: remove the file too
+                    del entries[path]
+                    doomed.append(path)
+            entries.update(self._entries)
+            self._entries = entries
+            self._total = sum(e[0] for e in entries.values())
+            self._loading = False
+            self._dropped_paths = set()
+            self._dropped_digests = set()
+            self._cleared = False
+        for path in doomed:
+            _remove(path)
+        self._enforce_budget()
+
+    def save(self):
+        """Persist access times as mtimes (best effort)."""
+        with self._lock:
+            snapshot = [(path, e[1]) for path, e in self._entries.items() if e[2]]
+        for path, accessed in snapshot:
+            try:
+                os.utime(path, (accessed, accessed))
+            except OSError:
+                pass
+
+    def added(self, path: str, size: int):
+        with self._lock:
+            old = self._entries.get(path)
+            if old:
+                self._total -= old[0]
+            self._entries[path] = [size, time.time(), 0]
+            self._total += size
+        self._enforce_budget()
+
+    def record_hit(self, path: str):
+        with self._lock:
+            self.hits += 1
+            entry = self._entries.get(path)
+            if entry:
+                entry[1] = time.time()
+                entry[2] += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _enforce_budget(self):
+        with self._lock:
+            if self._total <= self.budget_bytes:
+                return
+            target = self.budget_bytes * EVICT_TARGET_RATIO
+            victims = sorted(
+                self._entries.items(),
+                key=lambda item: (
+                    _is_master(item[0]),
+                    item[1][1],
+                    item[1][2]
+                )
+            )
+            evicted = []
+            for path, (size, _, _) in victims:
+                if self._total <= target:
+                    break
+                del self._entries[path]
+                self._total -= size
+                self.evictions += 1
+                evicted.append(path)
+                if self._loading:
+                    self._dropped_paths.add(path)
+        for path in evicted:
+            hot_cache.discard(path)
+            _remove(path)
+
+    def remove_hashes(self, digests: Iterable[str]):
+        """Delete every rendition of the given artwork hashes."""
+        digests = set(digests)
+        if not digests:
+            return
+        with self._lock:
+            doomed = [p for p in self._entries if os.path.basename(p)[:32] in digests]
+            for path in doomed:
+                self._total -= self._entries.pop(path)[0]
+            if self._loading:
+                self._dropped_paths.update(doomed)
+                self._dropped_digests.update(digests)
+        for path in doomed:
+            hot_cache.discard(path)
+            _remove(path)
+
+    def prune_orphans(self, referenced: Iterable[str]):
+        """Delete renditions whose hash no album references any more."""
+        referenced = set(referenced)
+        with self._lock:
+            digests = {os.path.basename(p)[:32] for p in self._entries}
+        self.remove_hashes(digests - referenced)
+
+    def clear(self):
+        with self._lock:
+            digests = {os.path.basename(p)[:32] for p in self._entries}
+            if self._loading:
+                # Also covers files the startup walk has listed but not merged yet
+                self._cleared = True
+        self.remove_hashes(digests)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "files": len(self._entries),
+                "bytes": self._total,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "hot_cache_bytes": hot_cache.size,
+            }
+
+
+def _is_master(path: str) -> bool:
+    return path.endswith(f"_{MASTER_SIZE}.{FORMATS[MASTER_FORMAT][0]}")
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        # Still open (e.g. being streamed on Windows) or already gone
+        pass
+
+
+cover_cache = CoverCacheManager()
+
+
+def master_path(digest: str) -> str:
+    return cover_path(digest, MASTER_SIZE, MASTER_FORMAT)
+
+
+def render_from_master(digest: str, size: int, fmt: str) -> Optional[bytes]:
+    """Fast path: derive a rendition from the stored master instead of the audio file."""
+    try:
+        with open(master_path(digest), "rb") as f:
+            master = f.read()
+    except OSError:
+        return None
+    if size == MASTER_SIZE and fmt == MASTER_FORMAT:
+        return master
+    return render(master, size, fmt)
+
+
+def pack_atlas(tiles, size: int, columns: int, fmt: str):
+    """
+    Paste (album_id, rendition bytes) tiles into one row-major grid image.
+    Returns (encoded atlas, layout map); tiles without data are skipped.
+    """
+    from PIL import Image
+    rows = max(1, -(-len(tiles) // columns))
+    atlas = Image.new("RGB", (columns * size, rows * size))
+    layout = {"tile": size, "columns": columns, "tiles": {}}
+    for index, (album_id, data) in enumerate(tiles):
+        if not data:
+            continue
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        except Exception:
+            continue
+        x = (index % columns) * size
+        y = (index // columns) * size
+        atlas.paste(img.convert("RGB"), (x, y))
+        layout["tiles"][str(album_id)] = [x, y, img.width, img.height]
+    out_io = io.BytesIO()
+    atlas.save(out_io, **FORMATS[fmt][2])
+    return out_io.getvalue(), layout
+
+
+def _run_once(key: Hashable, fn, args):
+    try:
+        return fn(*args)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def single_flight(key: Hashable, fn, *args) -> "asyncio.Future":
+    """
+    Run `fn(*args)` on the cover pool, sharing one execution between all
+    concurrent callers with the same key. Returns an awaitable.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _executor.submit(_run_once, key, fn, args)
+            _inflight[key] = future
+    return asyncio.wrap_future(future)
@@ -1,3 +1,4 @@
+import logging
 import os
 import sys
 from sqlmodel import SQLModel, create_engine, Session
@@ -5,6 +6,10 @@ from sqlmodel import SQLModel, create_engine, Session
 # Get the directory where the executable/script is located
 def get_app_dir():
     """Get the application directory (where the executable is located)."""
+    # Explicit data directory (benchmarks, scratch libraries)
+    data_dir = os.environ.get("TREMORS_DATA_DIR")
+    if data_dir:
+        return os.path.abspath(data_dir)
     if getattr(sys, 'frozen', False):
         # Running as compiled executable
         return os.path.dirname(sys.executable)
@@ -12,6 +17,22 @@ def get_app_dir():
         # Running as script (development)
         return os.path.dirname(os.path.abspath(__file__))
 
+def env_int(name: str, default: int, minimum: int = 0) -> int:
+    """Integer setting from the environment; a malformed value logs a warning and keeps the default."""
+    raw = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value = int(raw)
+        if value < minimum:
+            raise ValueError
+        return value
+    except ValueError:
+        logging.getLogger("tremors.config").warning(
+            f"Ignoring {name}={raw!r} (expected an integer >= {minimum}); using {default}"
+        )
+        return default
+
 # 1. Define the database file path (in app directory)
 app_dir = get_app_dir()
 sqlite_file_name = os.path.join(app_dir, "music.db")
@@ -22,9 +43,21 @@ engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
 
 # 3. Helper to create tables
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    # Under the database write lock, so several workers starting at once don't race the existence checks
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        SQLModel.metadata.create_all(conn)
+        conn.commit()
 
 # 4. Dependency Injection helper
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+# 5. Keep IN (...) lists under SQLite's bound-parameter limit
+SQLITE_MAX_VARIABLES = 900
+
+def chunked(items, size: int = SQLITE_MAX_VARIABLES):
+    """Yield successive slices of `items` no longer than `size`."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
\ No newline at end of file
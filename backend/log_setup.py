@@ -0,0 +1,138 @@
+# Non-blocking logging: records are queued and written to disk by a background listener
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+from database import env_int, get_app_dir
+from metrics import current_request_stats
+
+# Records waiting for the writer; beyond this they are dropped (and counted) rather than block a request
+LOG_QUEUE_SIZE = 10000
+
+# Successful /stream and /covers access lines: log 1 in N (0 = none). Errors are always logged.
+MEDIA_ACCESS_LOG_SAMPLE = env_int("TREMORS_MEDIA_ACCESS_LOG_SAMPLE", 100)
+MEDIA_PATH_PREFIXES = ("/stream/", "/covers/")
+
+# Timing fields appended as key=value when present on a record
+TIMING_FIELDS = ("duration_ms", "sql_queries", "sql_ms")
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLogFilter(logging.Filter):
+    """
+    Samples media access lines and attaches the request's timing fields
+    (uvicorn logs access lines from inside the response, so the metrics
+    middleware's per-request stats are still current).
+    """
+
+    def __init__(self, sample: int = MEDIA_ACCESS_LOG_SAMPLE):
+        super().__init__()
+        self.sample = sample
+        self._seen = 0
+
+    def filter(self, record):
+        args = record.args
+        # uvicorn: (client, method, path, http_version, status)
+        if isinstance(args, tuple) and len(args) == 5:
+            path, status = args[2], args[4]
+            if isinstance(path, str) and path.startswith(MEDIA_PATH_PREFIXES) and status < 400:
+                if self.sample <= 0:
+                    return False
+                self._seen += 1
+                if self._seen % self.sample:
+                    return False
+        stats = current_request_stats()
+        if stats is not None:
+            if stats.latency is not None:
+                record.duration_ms = round(stats.latency * 1000, 1)
+            record.sql_queries = stats.queries
+            record.sql_ms = round(stats.sql_seconds * 1000, 1)
+        return True
+
+
+class TimingFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = [f"{name}={getattr(record, name)}" for name in TIMING_FIELDS if hasattr(record, name)]
+        return f"{line} | {' '.join(fields)}" if fields else line
+
+
+_listener: Optional[QueueListener] = None
+queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def setup_logging():
+    """Configure file-based logging for production (idempotent)."""
+    global _listener, queue_handler
+    if _listener is not None:
+        return
+
+    # Directory of the executable when frozen, of the backend sources otherwise
+    app_dir = get_app_dir()
+    log_dir = os.path.join(app_dir, 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, 'tremorsmusic.log')
+
+    # Rotating file handler (5MB max, keep 5 backups), only ever touched by the listener thread
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=5*1024*1024,  # 5MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(TimingFormatter(
+        '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+    ))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _listener = QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    # At exit, so the server's own shutdown lines still reach the file
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers = [queue_handler]
+
+    # uvicorn and uvicorn.access don't propagate; uvicorn.error propagates to uvicorn
+    for logger_name in ['uvicorn', 'uvicorn.access']:
+        logger = logging.getLogger(logger_name)
+        logger.handlers = [queue_handler]
+    logging.getLogger('uvicorn.error').handlers = []
+    access_logger = logging.getLogger('uvicorn.access')
+    access_logger.filters = [f for f in access_logger.filters if not isinstance(f, AccessLogFilter)]
+    access_logger.addFilter(AccessLogFilter())
+
+    logging.info("Tremors Music Backend starting...")
+    logging.info(f"App directory: {app_dir}")
+    logging.info(f"Log file: {log_file}")
+
+
+def stop_logging():
+    """Flush queued records to disk and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_stats():
+    """(records waiting to be written, records dropped) for /metrics."""
+    if queue_handler is None:
+        return 0, 0
+    return queue_handler.queue.qsize(), queue_handler.dropped
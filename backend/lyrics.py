@@ -0,0 +1,104 @@
+# LRC (synced lyrics) parsing into a compact timeline
+import bisect
+import json
+import re
+from typing import Any, Dict, Optional
+
+# [mm:ss], [mm:ss.xx], [mm:ss.xxx] or [mm:ss:xx]
+TIMESTAMP_RE = re.compile(r'\[(\d{1,3}):(\d{1,2})(?:[.:](\d{1,3}))?\]')
+# [ar:Artist], [offset:+250], ...
+TAG_RE = re.compile(r'^\[([a-zA-Z]+):(.*)\]$')
+# Enhanced LRC word timings: <mm:ss.xx>
+WORD_TIME_RE = re.compile(r'<\d{1,3}:\d{1,2}(?:[.:]\d{1,3})?>')
+
+
+def _to_ms(minutes: str, seconds: str, fraction: Optional[str]) -> int:
+    ms = (int(minutes) * 60 + int(seconds)) * 1000
+    if fraction:
+        # ".5" = 500ms, ".05" = 50ms, ".005" = 5ms
+        ms += int(fraction.ljust(3, '0')[:3])
+    return ms
+
+
+def parse_lrc(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Parse LRC into {"times": [ms...], "lines": [str...], "offset": ms, "tags": {...}}.
+    Times are sorted with the [offset:] tag already applied; a line with several
+    timestamps appears once per timestamp. Returns None when the text has no
+    timestamps (i.e. plain lyrics).
+    """
+    if not text:
+        return None
+
+    offset = 0
+    tags = {}
+    entries = []
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line.startswith('['):
+            continue
+
+        stamps = []
+        pos = 0
+        while True:
+            m = TIMESTAMP_RE.match(line, pos)
+            if not m:
+                break
+            stamps.append(_to_ms(*m.groups()))
+            pos = m.end()
+
+        if stamps:
+            lyric = WORD_TIME_RE.sub('', line[pos:]).strip()
+            entries.extend((t, lyric) for t in stamps)
+            continue
+
+        tag = TAG_RE.match(line)
+        if tag:
+            key, value = tag.group(1).lower(), tag.group(2).strip()
+            if key == 'offset':
+                try:
+                    offset = int(value)
+                except ValueError:
+                    pass
+            else:
+                tags[key] = value
+
+    if not entries:
+        return None
+
+    # Positive offset shifts lyrics earlier
+    entries.sort(key=lambda e: e[0])
+    return {
+        "times": [max(0, t - offset) for t, _ in entries],
+        "lines": [lyric for _, lyric in entries],
+        "offset": offset,
+        "tags": tags,
+    }
+
+
+def dumps(timeline: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json.dumps(timeline, separators=(',', ':'), ensure_ascii=False) if timeline else None
+
+
+def loads(data: Optional[str]) -> Optional[Dict[str, Any]]:
+    return json.loads(data) if data else None
+
+
+def slice_timeline(timeline: Dict[str, Any], position: float, before: int = 5, after: int = 20) -> Dict[str, Any]:
+    """
+    Window of the timeline around a playback position (seconds).
+    `current` is the index of the active line (-1 before the first line).
+    """
+    times = timeline["times"]
+    current = bisect.bisect_right(times, int(position * 1000)) - 1
+    start = max(0, current - before)
+    end = min(len(times), max(current, 0) + after + 1)
+    return {
+        "times": times[start:end],
+        "lines": timeline["lines"][start:end],
+        "offset": timeline["offset"],
+        "tags": timeline["tags"],
+        "start": start,
+        "current": current,
+        "total": len(times),
+    }
@@ -0,0 +1,96 @@
+# M3U/M3U8 playlist parsing, path resolution and writing
+import ntpath
+import os
+import posixpath
+import urllib.parse
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+
+M3U_MEDIA_TYPES = {
+    "m3u": "audio/x-mpegurl",
+    "m3u8": "application/vnd.apple.mpegurl",
+}
+
+
+def _decode(raw: bytes) -> str:
+    # .m3u8 is UTF-8; legacy .m3u is often Latin-1/cp1252
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def iter_entries(stream: BinaryIO) -> Iterator[str]:
+    """Yield media locations from an M3U/M3U8 byte stream, one line at a time."""
+    for index, raw in enumerate(stream):
+        line = _decode(raw).strip()
+        if index == 0:
+            line = line.lstrip("\ufeff")
+        # Comments and directives (#EXTM3U, #EXTINF, ...)
+        if not line or line.startswith("#"):
+            continue
+        if line.lower().startswith("file://"):
+            line = urllib.parse.unquote(urllib.parse.urlparse(line).path)
+            # file:///C:/Music/... -> C:/Music/...
+            if len(line) > 2 and line[0] == "/" and line[2] == ":":
+                line = line[1:]
+        yield line
+
+
+def _fold(path: str) -> str:
+    """Case- and separator-insensitive form of a path ("c:/music/a/b.mp3")."""
+    return "/".join(p for p in path.replace("\\", "/").lower().split("/") if p and p != ".")
+
+
+def _is_absolute(path: str) -> bool:
+    return posixpath.isabs(path.replace("\\", "/")) or bool(ntpath.splitdrive(path)[0])
+
+
+def _tail(folded: str) -> Optional[str]:
+    """Trailing "folder/file" of a folded path (None for a bare file name)."""
+    parts = folded.rsplit("/", 2)
+    return "/".join(parts[-2:]) if len(parts) > 1 else None
+
+
+class PathIndex:
+    """
+    In-memory path -> song id lookup for resolving playlist entries:
+    case- and separator-insensitive full paths, then (relative entries only)
+    a unique trailing "folder/file". A bare file name is never enough.
+    """
+
+    # Marks a tail shared by several songs (ambiguous, never matched)
+    AMBIGUOUS = -1
+
+    def __init__(self, rows: Iterable[Tuple[int, str]]):
+        self.folded: Dict[str, int] = {}
+        self.tails: Dict[str, int] = {}
+        for song_id, path in rows:
+            folded = _fold(path)
+            self.folded[folded] = song_id
+            tail = _tail(folded)
+            if tail is not None:
+                self.tails[tail] = song_id if tail not in self.tails else self.AMBIGUOUS
+
+    def resolve(self, entry: str, base_dir: Optional[str] = None) -> Tuple[Optional[int], bool]:
+        """(song id or None, True if matched by full path rather than by tail)."""
+        relative = not _is_absolute(entry)
+        if relative and base_dir:
+            entry = os.path.join(base_dir, entry)
+        folded = _fold(posixpath.normpath(entry.replace("\\", "/")))
+        song_id = self.folded.get(folded)
+        if song_id is not None:
+            return song_id, True
+        # An absolute path names one file: if it isn't in the library, it isn't matched
+        if not relative:
+            return None, False
+        # Playlist made elsewhere: a unique folder/file tail is a fuzzy match
+        tail = _tail(folded)
+        song_id = self.tails.get(tail) if tail is not None else None
+        if song_id is None or song_id == self.AMBIGUOUS:
+            return None, False
+        return song_id, False
+
+
+def render_entry(path: str, duration: Optional[float], artist: str, title: str) -> str:
+    seconds = int(duration) if duration else -1
+    return f"#EXTINF:{seconds},{artist} - {title}\n{path}\n"
@@ -1,63 +1,45 @@
-import os
-import sys
+import time
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+import anyio.to_thread
 from database import create_db_and_tables
-from router import library, stream, media, playlists
+from migrate_db import migrate
+from search_index import suggestion_index
+from user_data_buffer import user_data_buffer
+from cover_store import cover_cache
+import changelog  # noqa: F401 - registers the song/album change-log flush hook
+from metrics import metrics, MetricsMiddleware
+from log_setup import setup_logging, log_stats
+from router import library, stream, media, playlists, smart_playlists
 
-# --- Logging Setup ---
-def setup_logging():
-    """Configure file-based logging for production."""
-    # Get the directory where the executable is located
-    if getattr(sys, 'frozen', False):
-        # Running as compiled executable
-        app_dir = os.path.dirname(sys.executable)
-    else:
-        # Running as script
-        app_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    log_dir = os.path.join(app_dir, 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, 'tremorsmusic.log')
-    
-    # Configure rotating file handler (5MB max, keep 5 backups)
-    handler = RotatingFileHandler(
-        log_file,
-        maxBytes=5*1024*1024,  # 5MB
-        backupCount=5,
-        encoding='utf-8'
-    )
-    handler.setFormatter(logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
-    ))
-    
-    # Configure root logger
-    logging.basicConfig(
-        level=logging.INFO,
-        handlers=[handler]
-    )
-    
-    # Also configure uvicorn loggers
-    for logger_name in ['uvicorn', 'uvicorn.access', 'uvicorn.error']:
-        logger = logging.getLogger(logger_name)
-        logger.handlers = [handler]
-    
-    logging.info("Tremors Music Backend starting...")
-    logging.info(f"App directory: {app_dir}")
-    logging.info(f"Log file: {log_file}")
-
-# Initialize logging
-setup_logging()
+def warm_up():
+    """
+    Non-critical startup work, run in the background once the server is up.
+    Until it finishes, search suggestions are empty and the cover cache only
+    accounts for files written since launch.
+    """
+    started = time.perf_counter()
+    suggestion_index.rebuild()
+    cover_cache.load()
+    logging.info("Warm-up finished", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 1)})
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Logging is configured here, not at import, so importing the app stays cheap
+    setup_logging()
     logging.info("Initializing database...")
     create_db_and_tables()
+    migrate()
+    user_data_buffer.start()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     logging.info("Database ready. Backend is now accepting connections.")
     yield
+    user_data_buffer.stop()
+    cover_cache.save()
     logging.info("Backend shutting down...")
 
 app = FastAPI(lifespan=lifespan)
@@ -69,15 +51,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Atlas-Layout"],
 )
+# Outermost, so timings include CORS handling
+app.add_middleware(MetricsMiddleware)
 
 # Register Routers
 app.include_router(library.router)
 app.include_router(stream.router)
 app.include_router(media.router)
 app.include_router(playlists.router)
+app.include_router(smart_playlists.router)
 
 
 @app.get("/")
 def read_root():
-    return {"message": "Tremors Music Backend is Ready 🎵", "version": "1.5.0"}
\ No newline at end of file
+    return {"message": "Tremors Music Backend is Ready 🎵", "version": "1.5.0"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: per-route latency, SQL statements/time, bytes sent, threadpool use."""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    log_queued, log_dropped = log_stats()
+    return PlainTextResponse(
+        metrics.render({
+            "tremors_threadpool_busy_threads": (stats.borrowed_tokens, "Worker threads running sync endpoints/file I/O."),
+            "tremors_threadpool_max_threads": (stats.total_tokens, "Worker thread limit."),
+            "tremors_threadpool_waiting_tasks": (stats.tasks_waiting, "Calls queued for a worker thread (saturation)."),
+            "tremors_log_queue_depth": (log_queued, "Log records waiting for the background writer."),
+            "tremors_log_dropped_records": (log_dropped, "Log records dropped because the writer fell behind."),
+        }),
+        media_type="text/plain; version=0.0.4"
+    )
\ No newline at end of file
@@ -0,0 +1,229 @@
+# Request latency / SQL accounting and Prometheus text exposition
+import contextvars
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from database import engine, env_int
+
+# Requests slower than this (to first response byte) are logged; override with TREMORS_SLOW_REQUEST_MS
+SLOW_REQUEST_SECONDS = env_int("TREMORS_SLOW_REQUEST_MS", 500) / 1000
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+logger = logging.getLogger("tremors.metrics")
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # labels -> [bucket counts..., sum, count]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+class _RequestStats:
+    __slots__ = ("queries", "sql_seconds", "latency")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        # Seconds to the first response byte, once the response has started
+        self.latency: Optional[float] = None
+
+
+# Set per request by the middleware; sync endpoints see it too (the threadpool copies context)
+_current: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[_RequestStats]:
+    """Stats of the request being served in this context (None outside requests)."""
+    return _current.get()
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries_per_request = Histogram(QUERY_COUNT_BUCKETS)
+        # (method, route, status) -> requests
+        self.requests: Dict[Tuple, int] = {}
+        # route -> [statements, seconds]
+        self.route_sql: Dict[str, List[float]] = {}
+        # route -> body bytes sent
+        self.route_bytes: Dict[str, int] = {}
+        # Every statement, request or background (scanner, flushes)
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.slow_requests = 0
+
+    def record_sql(self, seconds: float):
+        with self._lock:
+            self.sql_queries += 1
+            self.sql_seconds += seconds
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += seconds
+
+    def record_request(self, method: str, route: str, status: int, latency: float, stats: _RequestStats, sent: int):
+        with self._lock:
+            key = (method, route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.observe((method, route), latency)
+            self.queries_per_request.observe((route,), stats.queries)
+            sql = self.route_sql.setdefault(route, [0, 0.0])
+            sql[0] += stats.queries
+            sql[1] += stats.sql_seconds
+            self.route_bytes[route] = self.route_bytes.get(route, 0) + sent
+            if latency >= SLOW_REQUEST_SECONDS:
+                self.slow_requests += 1
+        if latency >= SLOW_REQUEST_SECONDS:
+            logger.warning(
+                f"Slow request: {method} {route} -> {status}",
+                extra={
+                    "duration_ms": round(latency * 1000, 1),
+                    "sql_queries": stats.queries,
+                    "sql_ms": round(stats.sql_seconds * 1000, 1),
+                }
+            )
+
+    def render(self, gauges: Dict[str, Tuple[float, str]] = None) -> str:
+        """Prometheus text exposition format (0.0.4). `gauges`: name -> (value, help)."""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, hist: Histogram, label_names):
+            for labels, series in sorted(hist._series.items()):
+                base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(label_names, labels))
+                for bound, count in zip(hist.buckets, series):
+                    lines.append(f'{name}_bucket{{{base},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+                lines.append(f"{name}_sum{{{base}}} {series[-2]}")
+                lines.append(f"{name}_count{{{base}}} {series[-1]}")
+
+        with self._lock:
+            header("tremors_http_requests_total", "counter", "HTTP requests by route and status.")
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'tremors_http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+            header("tremors_http_request_duration_seconds", "histogram", "Time to first response byte.")
+            histogram("tremors_http_request_duration_seconds", self.latency, ("method", "route"))
+
+            header("tremors_http_request_sql_queries", "histogram", "SQL statements per request (N+1 detector).")
+            histogram("tremors_http_request_sql_queries", self.queries_per_request, ("route",))
+
+            header("tremors_http_sql_queries_total", "counter", "SQL statements issued while serving a route.")
+            for route, (count, _) in sorted(self.route_sql.items()):
+                lines.append(f'tremors_http_sql_queries_total{{route="{_escape(route)}"}} {count}')
+            header("tremors_http_sql_seconds_total", "counter", "Time spent in SQL while serving a route.")
+            for route, (_, seconds) in sorted(self.route_sql.items()):
+                lines.append(f'tremors_http_sql_seconds_total{{route="{_escape(route)}"}} {seconds}')
+
+            header("tremors_http_response_bytes_total", "counter", "Response body bytes sent (audio streaming included).")
+            for route, sent in sorted(self.route_bytes.items()):
+                lines.append(f'tremors_http_response_bytes_total{{route="{_escape(route)}"}} {sent}')
+
+            header("tremors_http_slow_requests_total", "counter", "Requests slower than the slow-request threshold.")
+            lines.append(f"tremors_http_slow_requests_total {self.slow_requests}")
+
+            header("tremors_sql_queries_total", "counter", "All SQL statements, background work included.")
+            lines.append(f"tremors_sql_queries_total {self.sql_queries}")
+            header("tremors_sql_seconds_total", "counter", "Time spent in all SQL statements.")
+            lines.append(f"tremors_sql_seconds_total {self.sql_seconds}")
+
+        for name, (value, help_text) in (gauges or {}).items():
+            header(name, "gauge", help_text)
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Global metrics registry
+metrics = Metrics()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start"].pop()
+    metrics.record_sql(time.perf_counter() - started)
+
+
+@event.listens_for(engine, "handle_error")
+def _handle_error(context):
+    # after_cursor_execute never fires for a failed statement: pop its start here
+    conn = context.connection
+    if conn is None or context.execution_context is None:
+        return
+    stack = conn.info.get("query_start")
+    if stack:
+        metrics.record_sql(time.perf_counter() - stack.pop())
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: latency to first byte, SQL per request, bytes sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = _RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        state = {"status": 500, "latency": None, "sent": 0, "length": 0}
+
+        async def send_wrapper(message):
+            kind = message["type"]
+            if kind == "http.response.start":
+                state["status"] = message["status"]
+                state["latency"] = stats.latency = time.perf_counter() - started
+                for name, value in message.get("headers", []):
+                    if name == b"content-length":
+                        state["length"] = int(value)
+            elif kind == "http.response.body":
+                state["sent"] += len(message.get("body", b""))
+            elif kind == "http.response.pathsend":
+                # Zero-copy file send: the server writes Content-Length bytes
+                state["sent"] += state["length"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            metrics.record_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                state["status"],
+                state["latency"] if state["latency"] is not None else time.perf_counter() - started,
+                stats,
+                state["sent"]
+            )
@@ -4,26 +4,53 @@ from database import get_app_dir
 
 DB_PATH = os.path.join(get_app_dir(), "music.db")
 
-def migrate():
-    if not os.path.exists(DB_PATH):
+# Columns added after the first release: (table, column, SQL type).
+# New tables are handled by SQLModel.metadata.create_all; existing tables need ALTERs.
+COLUMN_MIGRATIONS = [
+    ("song", "synced_lyrics", "TEXT"),
+    ("album", "cover_song_id", "INTEGER"),
+    ("song", "lyrics_timeline", "TEXT"),
+    ("librarychange", "user_data", "BOOLEAN NOT NULL DEFAULT 0"),
+    ("smartplaylist", "materialized_bucket", "INTEGER"),
+]
+
+# Indexes added to existing tables: (index name, table, quoted columns)
+INDEX_MIGRATIONS = [
+    ("ix_playlistsong_playlist_order", "playlistsong", '"playlist_id", "order", "song_id"'),
+    # Smart playlist rule columns
+    ("ix_song_year", "song", '"year"'),
+    ("ix_song_rating", "song", '"rating"'),
+    ("ix_song_play_count", "song", '"play_count"'),
+    ("ix_song_last_played", "song", '"last_played"'),
+    # Smart playlist invalidation: latest revision of non-user-data changes
+    ("ix_librarychange_user_data_rev", "librarychange", '"user_data", "rev"'),
+]
+
+def migrate(db_path: str = DB_PATH):
+    """Add any missing columns and indexes. Safe to run on every startup."""
+    if not os.path.exists(db_path):
         print("No music.db found, nothing to migrate.")
         return
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
     try:
-        # Check if column exists
-        cursor.execute("PRAGMA table_info(song)")
-        columns = [info[1] for info in cursor.fetchall()]
-        
-        if "synced_lyrics" not in columns:
-            print("Adding 'synced_lyrics' column to 'song' table...")
-            cursor.execute("ALTER TABLE song ADD COLUMN synced_lyrics TEXT")
-            conn.commit()
-            print("Migration successful.")
-        else:
-            print("'synced_lyrics' column already exists.")
+        # Hold the write lock throughout: concurrent workers run this one at a time
+        cursor.execute("BEGIN IMMEDIATE")
+        for table, column, sql_type in COLUMN_MIGRATIONS:
+            # Check if column exists
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns = [info[1] for info in cursor.fetchall()]
+            
+            if columns and column not in columns:
+                print(f"Adding '{column}' column to '{table}' table...")
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}")
+                print("Migration successful.")
+
+        for name, table, columns in INDEX_MIGRATIONS:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        conn.commit()
             
     except Exception as e:
         print(f"Migration error: {e}")
@@ -1,5 +1,6 @@
 from typing import Optional, List
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 
 # --- LINK TABLE ---
 class PlaylistSong(SQLModel, table=True):
@@ -7,6 +8,9 @@ class PlaylistSong(SQLModel, table=True):
     song_id: Optional[int] = Field(default=None, foreign_key="song.id", primary_key=True)
     order: int = Field(default=0)
 
+    # Covers ordered reads and neighbour lookups for moves/inserts
+    __table_args__ = (Index("ix_playlistsong_playlist_order", "playlist_id", "order", "song_id"),)
+
 # --- MODELS ---
 class LibraryPath(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -26,11 +30,60 @@ class AlbumBase(SQLModel):
     label: Optional[str] = None
     barcode: Optional[str] = None
     catalog_number: Optional[str] = None
+    
+    # --- ARTWORK SOURCE (indexed by the scanner) ---
+    # cover_path: sidecar image (cover.jpg, folder.png, ...) next to the tracks
+    cover_song_id: Optional[int] = None  # song with embedded art, when there is no sidecar
 
 class Album(AlbumBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     songs: List["Song"] = Relationship(back_populates="album")
 
+class AlbumArt(SQLModel, table=True):
+    """Album -> content hash of its artwork in the cover store (None = no art found)"""
+    album_id: int = Field(foreign_key="album.id", primary_key=True)
+    art_hash: Optional[str] = Field(default=None, index=True)
+
+# --- CHANGE LOG (delta sync) ---
+class LibraryChange(SQLModel, table=True):
+    """One row per song/album mutation; `rev` is the library revision clients sync from."""
+    rev: Optional[int] = Field(default=None, primary_key=True)
+    entity: str = Field(index=True)  # song, album, library
+    entity_id: Optional[int] = Field(default=None, index=True)
+    op: str  # upsert, delete, reset
+    # Only play counts / last_played / ratings changed (write-behind buffer flushes)
+    user_data: bool = Field(default=False)
+
+# --- SMART PLAYLISTS ---
+class SmartPlaylist(SQLModel, table=True):
+    """Saved rule set (smart_rules.SmartRules as JSON), optionally materialized."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    rules: str
+    materialize: bool = Field(default=False)
+    # Revision of the changes the rules depend on when the rows were computed (None = stale)
+    materialized_rev: Optional[int] = None
+    # Time bucket for rules relative to now (in_last/not_in_last), else None
+    materialized_bucket: Optional[int] = None
+
+class SmartPlaylistSong(SQLModel, table=True):
+    """Materialized smart playlist results, in order."""
+    smart_playlist_id: int = Field(foreign_key="smartplaylist.id", primary_key=True)
+    position: int = Field(primary_key=True)
+    song_id: int
+
+# --- SCANNER STATE (shared by every worker process) ---
+class ScanState(SQLModel, table=True):
+    """Single row (id=1): the scanner lease, live progress and the last result."""
+    id: int = Field(default=1, primary_key=True)
+    # Lease holder ("<pid>-<token>"); free when None or past lease_expires (epoch seconds)
+    owner: Optional[str] = None
+    lease_expires: Optional[float] = None
+    cancel_requested: bool = Field(default=False)
+    # JSON snapshots written by the scanning process
+    progress: Optional[str] = None
+    last_scan_result: Optional[str] = None
+
 # --- READ MODELS (Optimization) ---
 class SongListItem(SQLModel):
     """Lightweight Song model for lists (excludes lyrics/comments)"""
@@ -55,10 +108,24 @@ class SongListItem(SQLModel):
     bitrate: Optional[int] = None
     sample_rate: Optional[int] = None
 
+class BatchRequest(SQLModel):
+    """Id list for batch multi-get endpoints"""
+    ids: List[int]
+
 class AlbumRead(AlbumBase):
     """Album with computed fields"""
     id: int
     song_count: int = 0
+    art_hash: Optional[str] = None  # pass as ?h= to /covers for immutable caching
+
+class PlaylistSummary(SQLModel):
+    """Playlist with aggregates for the playlist index"""
+    id: int
+    name: str
+    song_count: int = 0
+    duration: float = 0.0
+    # First distinct albums in playlist order, for cover mosaics
+    cover_album_ids: List[int] = []
 
 class Playlist(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -92,7 +159,7 @@ class Song(SQLModel, table=True):
     isrc: Optional[str] = None  # International Standard Recording Code
     
     # --- DATES ---
-    year: Optional[int] = None
+    year: Optional[int] = Field(default=None, index=True)
     release_date: Optional[str] = None  # YYYY-MM-DD format
     original_date: Optional[str] = None
     
@@ -110,6 +177,7 @@ class Song(SQLModel, table=True):
     has_lyrics: bool = Field(default=False)
     lyrics: Optional[str] = None  # Full lyrics text
     synced_lyrics: Optional[str] = None  # JSON/LRC formatted time-synced lyrics
+    lyrics_timeline: Optional[str] = None  # Parsed LRC: JSON {times, lines, offset, tags}
     comment: Optional[str] = None
     description: Optional[str] = None
     language: Optional[str] = None  # ISO 639-2 code
@@ -126,9 +194,9 @@ class Song(SQLModel, table=True):
     replaygain_album_peak: Optional[float] = None
     
     # --- USER DATA (local only, not from tags) ---
-    rating: Optional[int] = None  # 0-5 scale
-    play_count: int = Field(default=0)
-    last_played: Optional[str] = None  # ISO datetime
+    rating: Optional[int] = Field(default=None, index=True)  # 0-5 scale
+    play_count: int = Field(default=0, index=True)
+    last_played: Optional[str] = Field(default=None, index=True)  # ISO datetime
     date_added: Optional[str] = None  # ISO datetime
     
     # --- MEDIA TYPE (for podcasts, audiobooks, etc.) ---
@@ -138,4 +206,8 @@ class Song(SQLModel, table=True):
     
     # --- RELATIONSHIPS ---
     album: Optional[Album] = Relationship(back_populates="songs")
-    playlists: List[Playlist] = Relationship(back_populates="songs", link_model=PlaylistSong)
\ No newline at end of file
+    playlists: List[Playlist] = Relationship(back_populates="songs", link_model=PlaylistSong)
+
+def song_list_columns():
+    """Song columns backing SongListItem, for column-only selects that skip lyrics/comments."""
+    return [getattr(Song, name) for name in SongListItem.model_fields]
@@ -1,11 +1,17 @@
-from typing import List, Dict, Any
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
+from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from sqlmodel import Session, select, func, or_, delete
 from sqlalchemy import case
 from pydantic import BaseModel
-from database import get_session
-from models import Song, Album, LibraryPath, SongListItem, AlbumRead
-from scanner import scan_directory
+from database import get_session, chunked
+from models import Song, Album, AlbumArt, LibraryPath, LibraryChange, SongListItem, AlbumRead, BatchRequest, song_list_columns
+from search_index import suggestion_index
+from changelog import current_revision, last_reset_revision, record_reset
+from user_data_buffer import user_data_buffer
+from cover_store import cover_cache
+from stream_cache import stream_cache
+from sampling_profiler import sample_thread, render_collapsed
 import os
 import re
 import urllib.parse
@@ -72,8 +78,13 @@ def reset_library(
     """
     if hard:
         session.exec(delete(Song))
+        session.exec(delete(AlbumArt))
         session.exec(delete(Album))
+        record_reset(session)
         session.commit()
+        cover_cache.clear()
+        suggestion_index.clear()
+        stream_cache.clear()
         return {"message": "Library WIPED (Hard Reset). Paths saved."}
     else:
         # Perform Smart Rescan (Sync)
@@ -81,13 +92,15 @@ def reset_library(
         if not paths:
             return {"message": "No paths to scan."}
         
-        # Reset progress tracker
+        # Claim the scanner lease (one scan across all worker processes)
         from scanner_progress import scanner_progress
-        scanner_progress.reset()
+        # The scanner (and Mutagen with it) loads on first scan, not at startup
+        from scanner import run_scan
+        if not scanner_progress.acquire():
+            raise HTTPException(status_code=409, detail="A scan is already running")
         
-        for p in paths:
-            # Re-use the smart scan_directory logic which now handles pruning
-            background_tasks.add_task(scan_directory, os.path.normpath(p.path))
+        # Re-use the smart scan_directory logic which now handles pruning
+        background_tasks.add_task(run_scan, [os.path.normpath(p.path) for p in paths])
             
         return {"message": "Smart Rescan started (Sync & Prune). Use ?hard=true to completely wipe."}
 
@@ -98,75 +111,198 @@ def scan_library(background_tasks: BackgroundTasks, session: Session = Depends(g
     
     # Import here to avoid circular dependency
     from scanner_progress import scanner_progress
+    # The scanner (and Mutagen with it) loads on first scan, not at startup
+    from scanner import run_scan
     
-    # Reset progress before starting
-    scanner_progress.reset()
+    # Claim the scanner lease (one scan across all worker processes)
+    if not scanner_progress.acquire():
+        raise HTTPException(status_code=409, detail="A scan is already running")
     
-    for p in paths:
-        background_tasks.add_task(scan_directory, os.path.normpath(p.path))
+    background_tasks.add_task(run_scan, [os.path.normpath(p.path) for p in paths])
     return {"message": "Scanning started"}
 
 @router.get("/scan/status")
 def get_scan_status():
-    """Get real-time scanner progress"""
+    """Get real-time scanner progress (from whichever worker is scanning)"""
     from scanner_progress import scanner_progress
     return scanner_progress.to_dict()
 
+@router.get("/scan/profile", response_class=PlainTextResponse)
+def profile_scan(
+    seconds: float = Query(10, gt=0, le=120),
+    interval_ms: float = Query(5, ge=1, le=1000)
+):
+    """
+    Sample the running scan's call stack for `seconds` and return it in
+    collapsed-stack format ("frame;frame;... samples"), ready for flame graph tools.
+    """
+    from scanner_progress import scanner_progress
+    thread_id = scanner_progress.thread_id
+    if not scanner_progress.is_scanning or thread_id is None:
+        # Stacks can only be sampled in the process running the scan
+        raise HTTPException(status_code=400, detail="No scan is running in this worker process")
+    stacks = sample_thread(thread_id, seconds, interval_ms / 1000)
+    return render_collapsed(stacks)
+
 @router.post("/scan/stop")
 def stop_scan():
-    """Stop the currently running scan."""
+    """
+    Stop the running scan, whichever worker runs it. It stops within a
+    heartbeat; files already processed are kept and nothing is pruned.
+    """
     from scanner_progress import scanner_progress
-    if not scanner_progress.is_scanning:
+    if not scanner_progress.request_stop():
         raise HTTPException(status_code=400, detail="No scan is currently running")
-    scanner_progress.finish()
-    return {"message": "Scan stopped"}
+    return {"message": "Scan stopping"}
+
+# --- DELTA SYNC ---
+@router.get("/changes")
+def get_changes(since: Optional[int] = None, limit: int = 5000, session: Session = Depends(get_session)):
+    """
+    Songs and albums changed after revision `since`, for clients keeping a local mirror.
+    - Each entity appears once with its latest operation (upserted rows / deleted ids).
+    - `reset: true` means the client must load the library in full (no `since` given, or
+      the library was wiped after `since`), then continue from the returned `revision`.
+    - Page with `since=<revision>` while `has_more` is true.
+    """
+    revision = current_revision(session)
+    reset_rev = last_reset_revision(session)
+    if since is None or (reset_rev is not None and reset_rev > since):
+        return {"revision": revision, "reset": True, "has_more": False}
+
+    latest = (
+        select(LibraryChange.entity, LibraryChange.entity_id, func.max(LibraryChange.rev).label("rev"))
+        .where(LibraryChange.rev > since, LibraryChange.entity != "library")
+        .group_by(LibraryChange.entity, LibraryChange.entity_id)
+        .subquery()
+    )
+    rows = session.exec(
+        select(latest.c.entity, latest.c.entity_id, latest.c.rev, LibraryChange.op)
+        .join(LibraryChange, LibraryChange.rev == latest.c.rev)
+        .order_by(latest.c.rev)
+        .limit(limit + 1)
+    ).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    upserts = {"song": [], "album": []}
+    deletes = {"song": [], "album": []}
+    for entity, entity_id, _, op in rows:
+        (upserts if op == "upsert" else deletes)[entity].append(entity_id)
+
+    songs = {}
+    for chunk in chunked(upserts["song"]):
+        for row in session.exec(select(*song_list_columns()).where(Song.id.in_(chunk))).all():
+            songs[row.id] = dict(row._mapping)
+    albums = {}
+    for chunk in chunked(upserts["album"]):
+        for album in session.exec(select(Album).where(Album.id.in_(chunk))).all():
+            albums[album.id] = album
+
+    return {
+        "revision": rows[-1][2] if has_more else max(revision, since),
+        "reset": False,
+        "has_more": has_more,
+        "songs": {
+            "upserted": list(songs.values()),
+            # Upserted rows that no longer exist count as deleted
+            "deleted": deletes["song"] + [i for i in upserts["song"] if i not in songs]
+        },
+        "albums": {
+            "upserted": list(albums.values()),
+            "deleted": deletes["album"] + [i for i in upserts["album"] if i not in albums]
+        }
+    }
 
 # --- ARTISTS ---
 @router.get("/artists")
-def get_artists(session: Session = Depends(get_session)):
-    albums = session.exec(select(Album)).all()
-    artist_map = {}
-    for album in albums:
-        if album.artist not in artist_map:
-            artist_map[album.artist] = {
-                "name": album.artist,
-                "album_count": 0,
-                "cover_example": album.id 
-            }
-        artist_map[album.artist]["album_count"] += 1
-    return list(artist_map.values())
+def get_artists(
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort_by: str = "name",
+    order: str = "asc",
+    session: Session = Depends(get_session)
+):
+    """List album artists with album/song counts, aggregated in SQL. All of them unless `limit` is given."""
+    # Song counts per album, joined onto the artist GROUP BY
+    song_counts = select(Song.album_id, func.count(Song.id).label("count")).group_by(Song.album_id).subquery()
+    
+    album_count = func.count(Album.id).label("album_count")
+    song_count = func.coalesce(func.sum(song_counts.c.count), 0).label("song_count")
+    
+    query = (
+        select(
+            Album.artist,
+            album_count,
+            song_count,
+            func.min(Album.id).label("cover_example")
+        )
+        .outerjoin(song_counts, Album.id == song_counts.c.album_id)
+        .group_by(Album.artist)
+    )
+    
+    if sort_by == "album_count":
+        sort_col = album_count
+    elif sort_by == "song_count":
+        sort_col = song_count
+    else:
+        sort_col = func.lower(Album.artist)
+
+    if order == "desc":
+        query = query.order_by(sort_col.desc(), func.lower(Album.artist))
+    else:
+        query = query.order_by(sort_col.asc(), func.lower(Album.artist))
+
+    if offset:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    rows = session.exec(query).all()
+    return [
+        {
+            "name": artist,
+            "album_count": albums,
+            "song_count": songs,
+            "cover_example": cover_id
+        }
+        for artist, albums, songs, cover_id in rows
+    ]
 
 @router.get("/artists/{artist_name}/work")
 def get_artist_work(artist_name: str, session: Session = Depends(get_session)):
     decoded_name = urllib.parse.unquote(artist_name).lower()
     
-    # Join with Album to check Album Artist too
-    songs = session.exec(
-        select(Song)
-        .join(Album, isouter=True)
-        .where(
-            or_(
-                func.lower(Song.artist) == decoded_name,
-                func.lower(Album.artist) == decoded_name
+    # 1. Songs (list projection) where the track or album artist matches
+    with user_data_buffer.reading():
+        songs = [dict(row._mapping) for row in session.exec(
+            select(*song_list_columns())
+            .join(Album, Song.album_id == Album.id, isouter=True)
+            .where(
+                or_(
+                    func.lower(Song.artist) == decoded_name,
+                    func.lower(Album.artist) == decoded_name
+                )
             )
-        )
-        .order_by(Song.album_id, Song.track_number)
-    ).all()
+            .order_by(Song.album_id, Song.track_number)
+        ).all()]
+        user_data_buffer.overlay(songs)
     
-    work_map = {}
+    # 2. All referenced albums in a single IN query
+    album_ids = {row["album_id"] for row in songs if row["album_id"] is not None}
+    albums = {}
+    if album_ids:
+        albums = {a.id: a for a in session.exec(select(Album).where(Album.id.in_(album_ids))).all()}
     
-    for song in songs:
-        alb_id = song.album_id or -1
+    work_map = {}
+    for row in songs:
+        alb_id = row["album_id"] or -1
         if alb_id not in work_map:
-            album_data = None
-            if alb_id != -1:
-                album_data = session.get(Album, alb_id)
-            
             work_map[alb_id] = {
-                "album": album_data,
+                "album": albums.get(alb_id),
                 "songs": []
             }
-        work_map[alb_id]["songs"].append(song)
+        work_map[alb_id]["songs"].append(row)
         
     return list(work_map.values())
 
@@ -197,17 +333,20 @@ def get_genres(session: Session = Depends(get_session)):
 def get_genre_songs(name: str, session: Session = Depends(get_session)):
     """Get all songs for a specific genre using query parameter."""
     
-    # Get all songs with genre tags
-    all_songs = session.exec(select(Song).where(Song.genre.is_not(None))).all()
-    
-    # Filter songs that have this exact genre (handling multi-genre tags)
-    matching_songs = []
-    for song in all_songs:
-        if song.genre:
-            # Split by comma/semicolon and check for exact match
-            song_genres = [g.strip() for g in re.split(r'[,;]', song.genre)]
-            if name in song_genres:
-                matching_songs.append(song)
+    with user_data_buffer.reading():
+        # Get all songs with genre tags
+        all_songs = session.exec(select(Song).where(Song.genre.is_not(None))).all()
+        session.expunge_all()
+        
+        # Filter songs that have this exact genre (handling multi-genre tags)
+        matching_songs = []
+        for song in all_songs:
+            if song.genre:
+                # Split by comma/semicolon and check for exact match
+                song_genres = [g.strip() for g in re.split(r'[,;]', song.genre)]
+                if name in song_genres:
+                    matching_songs.append(song)
+        user_data_buffer.overlay(matching_songs)
     
     # Sort by artist then title
     matching_songs.sort(key=lambda s: (s.artist or '', s.title or ''))
@@ -218,6 +357,8 @@ def get_genre_songs(name: str, session: Session = Depends(get_session)):
 @router.get("/smart-playlists/favorites", response_model=List[Song])
 def get_favorites(limit: int = 100, session: Session = Depends(get_session)):
     """Get favorite songs (rating == 5 only)."""
+    # Filters/sorts on buffered columns, so persist pending events first
+    user_data_buffer.flush()
     songs = session.exec(
         select(Song)
         .where(Song.rating == 5)
@@ -230,17 +371,21 @@ def get_favorites(limit: int = 100, session: Session = Depends(get_session)):
 @router.get("/smart-playlists/recently-added", response_model=List[Song])
 def get_recently_added(limit: int = 50, session: Session = Depends(get_session)):
     """Get recently added songs, sorted by id desc (newest first)."""
-    songs = session.exec(
-        select(Song)
-        .order_by(Song.id.desc())
-        .limit(limit)
-    ).all()
-    return songs
+    with user_data_buffer.reading():
+        songs = session.exec(
+            select(Song)
+            .order_by(Song.id.desc())
+            .limit(limit)
+        ).all()
+        session.expunge_all()
+        return user_data_buffer.overlay(songs)
 
 
 @router.get("/smart-playlists/most-played", response_model=List[Song])
 def get_most_played(limit: int = 50, session: Session = Depends(get_session)):
     """Get most played songs."""
+    # Filters/sorts on buffered columns, so persist pending events first
+    user_data_buffer.flush()
     songs = session.exec(
         select(Song)
         .where(Song.play_count > 0)
@@ -252,29 +397,25 @@ def get_most_played(limit: int = 50, session: Session = Depends(get_session)):
 
 @router.post("/songs/{song_id}/play")
 def increment_play_count(song_id: int, session: Session = Depends(get_session)):
-    """Increment play count for a song."""
-    song = session.get(Song, song_id)
-    if not song:
-        raise HTTPException(status_code=404, detail="Song not found")
-    song.play_count = (song.play_count or 0) + 1
-    session.commit()
-    return {"play_count": song.play_count}
+    """Increment play count for a song (buffered; persisted by the write-behind flush)."""
+    with user_data_buffer.reading():
+        stored = session.exec(select(Song.play_count).where(Song.id == song_id)).first()
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Song not found")
+        return {"play_count": user_data_buffer.record_play(song_id, stored)}
 
 
 @router.post("/songs/{song_id}/favorite")
 def toggle_favorite(song_id: int, session: Session = Depends(get_session)):
     """Toggle favorite status (rating 5 = favorite, 0 = not favorite)."""
-    song = session.get(Song, song_id)
-    if not song:
-        raise HTTPException(status_code=404, detail="Song not found")
-    # Toggle: if rated 5, set to 0; otherwise set to 5
-    if song.rating == 5:
-        song.rating = 0
-    else:
-        song.rating = 5
-    session.add(song)
-    session.commit()
-    return {"rating": song.rating, "is_favorite": song.rating == 5}
+    with user_data_buffer.reading():
+        row = session.exec(select(Song.id, Song.rating).where(Song.id == song_id)).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Song not found")
+        # Toggle: if rated 5, set to 0; otherwise set to 5
+        rating = 0 if user_data_buffer.rating(song_id, row.rating) == 5 else 5
+        user_data_buffer.set_rating(song_id, rating)
+    return {"rating": rating, "is_favorite": rating == 5}
 
 
 # --- SONGS ---
@@ -314,13 +455,45 @@ def get_songs(
     else:
         query = query.order_by(sort_col.asc())
 
-    return session.exec(query.offset(offset).limit(limit)).all()
+    with user_data_buffer.reading():
+        songs = session.exec(query.offset(offset).limit(limit)).all()
+        # Detach before patching in unflushed play counts/ratings so nothing is written back
+        session.expunge_all()
+        return user_data_buffer.overlay(songs)
+
+@router.post("/songs/batch")
+def get_songs_batch(payload: BatchRequest, projection: str = "list", session: Session = Depends(get_session)):
+    """
+    Fetch many songs in one round-trip.
+    - projection="list" (default): SongListItem fields only.
+    - projection="full": every Song column, lyrics included.
+    Items keep the requested order; unknown ids are reported in `missing`.
+    """
+    ids = list(dict.fromkeys(payload.ids))
+    found = {}
+    with user_data_buffer.reading():
+        for chunk in chunked(ids):
+            if projection == "full":
+                for song in session.exec(select(Song).where(Song.id.in_(chunk))).all():
+                    found[song.id] = song
+            else:
+                for row in session.exec(select(*song_list_columns()).where(Song.id.in_(chunk))).all():
+                    found[row.id] = dict(row._mapping)
+
+        session.expunge_all()
+        items = user_data_buffer.overlay([found[i] for i in ids if i in found])
+    return {
+        "items": items,
+        "missing": [i for i in ids if i not in found]
+    }
 
 @router.get("/songs/{song_id}", response_model=Song)
 def get_song(song_id: int, session: Session = Depends(get_session)):
-    song = session.get(Song, song_id)
-    if not song: raise HTTPException(404, "Song not found")
-    return song
+    with user_data_buffer.reading():
+        song = session.get(Song, song_id)
+        if not song: raise HTTPException(404, "Song not found")
+        session.expunge(song)
+        return user_data_buffer.overlay([song])[0]
 
 # --- SEARCH ---
 @router.get("/search", response_model=Dict[str, Any])
@@ -348,17 +521,20 @@ def search_library(q: str = "", limit: int = 50, session: Session = Depends(get_
         else_=0
     )
     
-    songs = session.exec(
-        select(Song)
-        .where(
-            or_(
-                Song.title.ilike(search_term),
-                Song.artist.ilike(search_term)
+    with user_data_buffer.reading():
+        songs = session.exec(
+            select(Song)
+            .where(
+                or_(
+                    Song.title.ilike(search_term),
+                    Song.artist.ilike(search_term)
+                )
             )
-        )
-        .order_by(song_score.desc())
-        .limit(limit)
-    ).all()
+            .order_by(song_score.desc())
+            .limit(limit)
+        ).all()
+        session.expunge_all()
+        user_data_buffer.overlay(songs)
     
     # === ALBUMS ===
     album_score = case(
@@ -425,6 +601,14 @@ def search_library(q: str = "", limit: int = 50, session: Session = Depends(get_
         "bestMatchType": best_match_type
     }
 
+@router.get("/suggest")
+def suggest(q: str = "", limit: int = 10):
+    """
+    Search-as-you-type completions served from the in-memory prefix index.
+    No database access; returns [{type, text, id}] for songs, albums, artists and genres.
+    """
+    return suggestion_index.suggest(q, min(max(limit, 1), 50))
+
 # --- ALBUMS ---
 @router.get("/albums", response_model=List[AlbumRead])
 def get_albums(offset: int = 0, limit: int = 50, session: Session = Depends(get_session)):
@@ -434,8 +618,9 @@ def get_albums(offset: int = 0, limit: int = 50, session: Session = Depends(get_
     
     # 2. Join Album with Subquery
     query = (
-        select(Album, func.coalesce(sq.c.count, 0).label("song_count"))
+        select(Album, func.coalesce(sq.c.count, 0).label("song_count"), AlbumArt.art_hash)
         .outerjoin(sq, Album.id == sq.c.album_id)
+        .outerjoin(AlbumArt, Album.id == AlbumArt.album_id)
         .offset(offset)
         .limit(limit)
     )
@@ -444,14 +629,44 @@ def get_albums(offset: int = 0, limit: int = 50, session: Session = Depends(get_
     
     # 3. Construct AlbumRead objects
     albums_with_counts = []
-    for album, count in results:
-        # Create AlbumRead from Album data + extra field
+    for album, count, art_hash in results:
+        # Create AlbumRead from Album data + extra fields
         ar = AlbumRead.model_validate(album)
         ar.song_count = count
+        ar.art_hash = art_hash
         albums_with_counts.append(ar)
         
     return albums_with_counts
 
+@router.post("/albums/batch")
+def get_albums_batch(payload: BatchRequest, session: Session = Depends(get_session)):
+    """Fetch many albums (with song counts) in requested order; unknown ids go to `missing`."""
+    ids = list(dict.fromkeys(payload.ids))
+    found = {}
+    for chunk in chunked(ids):
+        sq = (
+            select(Song.album_id, func.count(Song.id).label("count"))
+            .where(Song.album_id.in_(chunk))
+            .group_by(Song.album_id)
+            .subquery()
+        )
+        query = (
+            select(Album, func.coalesce(sq.c.count, 0), AlbumArt.art_hash)
+            .outerjoin(sq, Album.id == sq.c.album_id)
+            .outerjoin(AlbumArt, Album.id == AlbumArt.album_id)
+            .where(Album.id.in_(chunk))
+        )
+        for album, count, art_hash in session.exec(query).all():
+            ar = AlbumRead.model_validate(album)
+            ar.song_count = count
+            ar.art_hash = art_hash
+            found[album.id] = ar
+
+    return {
+        "items": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found]
+    }
+
 @router.get("/albums/{album_id}", response_model=Album)
 def get_album_details(album_id: int, session: Session = Depends(get_session)):
     album = session.get(Album, album_id)
@@ -461,4 +676,7 @@ def get_album_details(album_id: int, session: Session = Depends(get_session)):
 
 @router.get("/albums/{album_id}/songs", response_model=List[SongListItem])
 def get_album_songs(album_id: int, session: Session = Depends(get_session)):
-    return session.exec(select(Song).where(Song.album_id == album_id).order_by(Song.track_number, Song.title)).all()
\ No newline at end of file
+    with user_data_buffer.reading():
+        songs = session.exec(select(Song).where(Song.album_id == album_id).order_by(Song.track_number, Song.title)).all()
+        session.expunge_all()
+        return user_data_buffer.overlay(songs)
\ No newline at end of file
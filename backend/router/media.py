@@ -1,116 +1,386 @@
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from sqlmodel import Session, select
-from database import get_session, get_app_dir
-from models import Album, Song
-from mutagen import File as MutagenFile
-from mutagen.id3 import ID3, APIC
-from mutagen.flac import FLAC, Picture
-from mutagen.mp4 import MP4
+from sqlalchemy import update, bindparam
+from database import get_session, engine, chunked
+from models import Album, AlbumArt, Song, BatchRequest
+from artwork import extract_embedded_art
+from lyrics import parse_lrc, slice_timeline, dumps as dump_timeline, loads as loads_timeline
 import os
+import asyncio
 import base64
-import io
-from PIL import Image
+import json
+from typing import Optional
+import cover_store
 
 router = APIRouter(tags=["Media"])
 
 # 1x1 Transparent PNG pixel
 DEFAULT_COVER = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=")
 
-# Define cache directory
-COVERS_DIR = os.path.join(get_app_dir(), "covers")
-os.makedirs(COVERS_DIR, exist_ok=True)
+class _UnreadableArt(Exception):
+    """Artwork was found but can't be decoded; `data` holds the original bytes."""
+    def __init__(self, data: bytes):
+        super().__init__("artwork could not be rendered")
+        self.data = data
 
-@router.get("/covers/{album_id}")
-def get_album_cover(album_id: int, size: str = "small", session: Session = Depends(get_session)):
-    # Validate size
-    is_full = size == "full"
+def _lookup_art(album_id: int):
+    """Return (album_exists, probed, art_hash) from the database alone."""
+    with Session(engine) as session:
+        art = session.get(AlbumArt, album_id)
+        if not art:
+            return session.get(Album, album_id) is not None, False, None
+    return True, True, art.art_hash
+
+def _open_rendition(path: str):
+    """
+    Open a cached rendition, or None when it isn't on disk. The open handle
+    keeps serving the file even if the cache evicts it meanwhile.
+    """
+    try:
+        return open(path, "rb")
+    except OSError:
+        return None
+
+def _iter_file(f, chunk_size: int = 64 * 1024):
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+def _read_art_source(session: Session, album: Album) -> Optional[bytes]:
+    """Load artwork bytes from the source recorded by the scanner (sidecar, then embedded)."""
+    if album.cover_path:
+        try:
+            with open(album.cover_path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+    if album.cover_song_id:
+        path = session.exec(select(Song.path).where(Song.id == album.cover_song_id)).first()
+        image_data = extract_embedded_art([path]) if path else None
+        if image_data:
+            return image_data
+    # Not indexed yet (or the recorded source is gone): check first 3 songs for art
+    paths = session.exec(select(Song.path).where(Song.album_id == album.id).limit(3)).all()
+    return extract_embedded_art(paths)
+
+def _resolve_album_art(album_id: int) -> Optional[str]:
+    """
+    Cover-pool job: load the album's artwork, store the master rendition
+    and record the album -> hash mapping. Returns the hash (None = no art).
+    """
+    with Session(engine) as session:
+        art = session.get(AlbumArt, album_id)
+        if art and (not art.art_hash or os.path.exists(cover_store.master_path(art.art_hash))):
+            return art.art_hash
+        
+        album = session.get(Album, album_id)
+        if not album:
+            return None
+        image_data = _read_art_source(session, album)
+        digest = cover_store.art_hash(image_data) if image_data else None
+        
+        if digest:
+            try:
+                master = cover_store.render(image_data, cover_store.MASTER_SIZE, cover_store.MASTER_FORMAT)
+                cover_store.store(digest, cover_store.MASTER_SIZE, cover_store.MASTER_FORMAT, master)
+            except Exception as e:
+                print(f"[ERROR] Error processing image for album {album_id}: {e}")
+                # Not recorded, so the next request tries again
+                raise _UnreadableArt(image_data) from e
+        
+        # Remember the result (hash or "no art") so later requests skip probing
+        art = art or AlbumArt(album_id=album_id)
+        art.art_hash = digest
+        session.add(art)
+        session.commit()
+        return digest
+
+def _render_rendition(album_id: int, digest: str, px: int, fmt: str) -> Optional[bytes]:
+    """Cover-pool job: derive one size/format from the master and cache it."""
+    data = cover_store.render_from_master(digest, px, fmt)
+    if data is None:
+        # Master was removed from disk; rebuild it from the artwork source
+        digest = _resolve_album_art(album_id)
+        data = cover_store.render_from_master(digest, px, fmt) if digest else None
+        if data is None:
+            return None
     
-    # 1. Check Cache
-    filename = f"{album_id}_full.jpg" if is_full else f"{album_id}.jpg"
-    cache_path = os.path.join(COVERS_DIR, filename)
+    # Try to cache to disk (Best Effort)
+    try:
+        cover_store.store(digest, px, fmt, data)
+    except Exception as e:
+        print(f"[WARNING] Failed to write cache for album {album_id}: {e}")
+    return data
+
+def _cover_headers(digest: str, px: int, fmt: str, pinned: bool):
+    return {
+        "ETag": cover_store.etag(digest, px, fmt),
+        # URLs carrying the content hash never change; bare album-id URLs revalidate daily
+        "Cache-Control": "public, max-age=31536000, immutable" if pinned else "public, max-age=86400",
+        "Vary": "Accept",
+    }
+
+# --- COVER CACHE ---
+@router.get("/covers/stats")
+def get_cover_cache_stats():
+    """Cover cache size, budget, hit rate and eviction counters."""
+    return cover_store.cover_cache.stats()
+
+@router.delete("/covers/cache")
+def clear_cover_cache():
+    """Delete every cached rendition; covers are regenerated from their sources on demand."""
+    cover_store.cover_cache.clear()
+    return {"message": "Cover cache cleared"}
+
+async def _resolve_tile(album_id: int) -> Optional[str]:
+    """Artwork hash for an atlas tile; art that can't be decoded gets the placeholder."""
+    try:
+        return await cover_store.single_flight(("album", album_id), _resolve_album_art, album_id)
+    except _UnreadableArt:
+        return None
+
+# --- COVER ATLAS ---
+ATLAS_MAX_TILES = 200
+ATLAS_MAX_SIZE = 300
+
+def _lookup_art_many(album_ids):
+    """Return {album_id: art_hash or None} for probed albums, plus the set of existing album ids."""
+    probed = {}
+    existing = set()
+    with Session(engine) as session:
+        for chunk in chunked(album_ids):
+            for album_id, digest in session.exec(
+                select(AlbumArt.album_id, AlbumArt.art_hash).where(AlbumArt.album_id.in_(chunk))
+            ).all():
+                probed[album_id] = digest
+            existing.update(session.exec(select(Album.id).where(Album.id.in_(chunk))).all())
+    return probed, existing
+
+def _read_rendition(digest: str, px: int, fmt: str) -> Optional[bytes]:
+    path = cover_store.cover_path(digest, px, fmt)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    cover_store.hot_cache.put(path, data)
+    return data
+
+async def _rendition_bytes(album_id: int, digest: str, px: int, fmt: str) -> Optional[bytes]:
+    """Hot cache -> disk -> render on the cover pool."""
+    path = cover_store.cover_path(digest, px, fmt)
+    data = cover_store.hot_cache.get(path)
+    if data is None:
+        data = await run_in_threadpool(_read_rendition, digest, px, fmt)
+    if data is not None:
+        cover_store.cover_cache.record_hit(path)
+    else:
+        cover_store.cover_cache.record_miss()
+        data = await cover_store.single_flight(("render", digest, px, fmt), _render_rendition, album_id, digest, px, fmt)
+    return data
+
+@router.get("/covers/atlas")
+async def get_cover_atlas(
+    ids: str,
+    size: str = "150",
+    columns: int = 8,
+    format: str = "auto",
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Pack many album covers into one image for grid views.
+    - ids: comma-separated album ids (max 200), tiles laid out row-major in this order.
+    - size: tile size, rounded to a bucket and capped at 300.
+    The X-Atlas-Layout header holds the JSON offset map:
+    {"tile": px, "columns": n, "tiles": {"<album_id>": [x, y, w, h]}}.
+    Albums without artwork are left out of "tiles"; show the placeholder for them.
+    """
+    try:
+        album_ids = [int(i) for i in ids.split(",") if i.strip()][:ATLAS_MAX_TILES]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    px = min(cover_store.resolve_size(size), ATLAS_MAX_SIZE)
+    fmt = cover_store.resolve_format(format, accept)
+    columns = max(1, min(columns, len(album_ids) or 1))
     
-    if os.path.exists(cache_path):
-        with open(cache_path, "rb") as f:
-            return Response(content=f.read(), media_type="image/jpeg")
+    # 1. Resolve artwork hashes (one query; unprobed albums are extracted in parallel)
+    probed, existing = await run_in_threadpool(_lookup_art_many, album_ids)
+    unprobed = [i for i in album_ids if i in existing and i not in probed]
+    resolved = await asyncio.gather(*[_resolve_tile(i) for i in unprobed])
+    probed.update(zip(unprobed, resolved))
+    digests = [probed.get(i) for i in album_ids]
+    
+    # The atlas is fully determined by the tile hashes, so they make a strong validator
+    atlas_key = cover_store.art_hash(f"{px}:{fmt}:{columns}:{digests}".encode())
+    headers = {"ETag": f'"atlas-{atlas_key}"', "Cache-Control": "public, max-age=86400", "Vary": "Accept"}
+    if if_none_match and headers["ETag"] in if_none_match:
+        return Response(status_code=304, headers=headers)
+    
+    # 2. Fetch every tile rendition (cached or rendered once per hash/size)
+    tiles = await asyncio.gather(
+        *[_rendition_bytes(i, d, px, fmt) if d else asyncio.sleep(0, None) for i, d in zip(album_ids, digests)]
+    )
+    
+    # 3. Pack on the cover pool
+    data, layout = await cover_store.single_flight(
+        ("atlas", atlas_key), cover_store.pack_atlas, list(zip(album_ids, tiles)), px, columns, fmt
+    )
+    headers["X-Atlas-Layout"] = json.dumps(layout, separators=(",", ":"))
+    return Response(content=data, media_type=cover_store.media_type(fmt), headers=headers)
 
-    album = session.get(Album, album_id)
-    if not album: 
-        return Response(content=DEFAULT_COVER, media_type="image/png")
+@router.get("/covers/{album_id}")
+async def get_album_cover(
+    album_id: int,
+    size: str = "small",
+    format: str = "auto",
+    h: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Album artwork from the content-addressed cover store.
+    - size: "small" (300), "full" (1200) or pixels, rounded up to 64/150/300/600/1200.
+    - format: "jpeg", "webp" or "auto" (WebP when the client accepts it).
+    - h: the album's art_hash; when it matches, the response is cached as immutable.
+    Cold covers are produced on a bounded worker pool, once per album/size even
+    when many identical requests arrive together. Cached covers carry strong
+    ETags (304 on If-None-Match) and are sent from the hot cache or streamed
+    from disk (thumbnails then fill the hot cache after the response).
+    Artwork that can't be decoded is sent as found, without resizing.
+    """
+    px = cover_store.resolve_size(size)
+    fmt = cover_store.resolve_format(format, accept)
     
-    # Check first 3 songs for art
-    songs = session.exec(select(Song).where(Song.album_id == album_id).limit(3)).all()
+    # 1. Known artwork hash -> cached rendition
+    if h:
+        # Fast path: the client already knows the hash; revalidation and warm
+        # hits need no DB or disk access (the ETag names the content itself)
+        headers = _cover_headers(h, px, fmt, True)
+        if if_none_match and headers["ETag"] in if_none_match:
+            return Response(status_code=304, headers=headers)
+        path = cover_store.cover_path(h, px, fmt)
+        data = cover_store.hot_cache.get(path)
+        if data is not None:
+            cover_store.cover_cache.record_hit(path)
+            return Response(content=data, media_type=cover_store.media_type(fmt), headers=headers)
     
-    image_data = None
+    exists, probed, digest = await run_in_threadpool(_lookup_art, album_id)
+    if not exists:
+        return Response(content=DEFAULT_COVER, media_type="image/png")
     
-    for song in songs:
-        if not os.path.exists(song.path): continue
-        try:
-            audio = MutagenFile(song.path)
-            if audio is None:
-                continue
-            
-            # MP3 with ID3 tags
-            if isinstance(audio, ID3) or (hasattr(audio, 'tags') and isinstance(audio.tags, ID3)):
-                for key in audio.tags.keys():
-                    if key.startswith('APIC'):
-                        image_data = audio.tags[key].data
-                        break
-            
-            # FLAC
-            elif isinstance(audio, FLAC) and audio.pictures:
-                image_data = audio.pictures[0].data
-            
-            # MP4/M4A
-            elif isinstance(audio, MP4) and 'covr' in audio.tags:
-                image_data = bytes(audio.tags['covr'][0])
-            
-            if image_data:
-                break # Found art
-        except:
-            continue
-
-    if image_data:
-        try:
-            # Resize Logic
-            img = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB (in case of PNG/RGBA)
-            if img.mode in ('RGBA', 'P'): 
-                img = img.convert('RGB')
-            
-            # Resize (Lanczos is high quality)
-            target_size = (1200, 1200) if is_full else (300, 300)
-            img.thumbnail(target_size, Image.Resampling.LANCZOS)
-            
-            # Save to buffer for serving
-            out_io = io.BytesIO()
-            img.save(out_io, format='JPEG', quality=85)
-            resized_bytes = out_io.getvalue()
-            
-            # Try to cache to disk (Best Effort)
-            try:
-                with open(cache_path, "wb") as f:
-                    f.write(resized_bytes)
-            except Exception as e:
-                print(f"[WARNING] Failed to write cache for album {album_id}: {e}")
-            
-            return Response(content=resized_bytes, media_type="image/jpeg")
-            
-        except Exception as e:
-            print(f"[ERROR] Error processing image for album {album_id}: {e}")
-            # Fallback to original data
-            return Response(content=image_data, media_type="image/jpeg")
+    if digest:
+        cache_path = cover_store.cover_path(digest, px, fmt)
+        headers = _cover_headers(digest, px, fmt, h == digest)
+        if if_none_match and headers["ETag"] in if_none_match:
+            return Response(status_code=304, headers=headers)
+        data = cover_store.hot_cache.get(cache_path)
+        if data is not None:
+            cover_store.cover_cache.record_hit(cache_path)
+            return Response(content=data, media_type=cover_store.media_type(fmt), headers=headers)
+        cached = await run_in_threadpool(_open_rendition, cache_path)
+        if cached is not None:
+            cover_store.cover_cache.record_hit(cache_path)
+            headers["Content-Length"] = str(os.fstat(cached.fileno()).st_size)
+            warm = BackgroundTask(_read_rendition, digest, px, fmt) if px <= cover_store.HOT_MAX_SIZE else None
+            return StreamingResponse(_iter_file(cached), media_type=cover_store.media_type(fmt), headers=headers, background=warm)
+        # Not on disk (never rendered at this size, or evicted): rendered below
+    
+    try:
+        # 2. Never probed -> extract embedded art once per album
+        if not probed:
+            digest = await cover_store.single_flight(("album", album_id), _resolve_album_art, album_id)
+        
+        # Return silent placeholder instead of 404 to fix console warnings
+        if not digest:
+            return Response(content=DEFAULT_COVER, media_type="image/png")
+        
+        # 3. Derive the requested size from the master rendition
+        cover_store.cover_cache.record_miss()
+        data = await cover_store.single_flight(("render", digest, px, fmt), _render_rendition, album_id, digest, px, fmt)
+    except _UnreadableArt as e:
+        # Fallback to original data
+        return Response(content=e.data, media_type="image/jpeg")
+    if data is None:
+        return Response(content=DEFAULT_COVER, media_type="image/png")
+    if px <= cover_store.HOT_MAX_SIZE:
+        cover_store.hot_cache.put(cover_store.cover_path(digest, px, fmt), data)
+    return Response(content=data, media_type=cover_store.media_type(fmt), headers=_cover_headers(digest, px, fmt, h == digest))
+
+@router.post("/lyrics/batch")
+def get_lyrics_batch(payload: BatchRequest, session: Session = Depends(get_session)):
+    """
+    Get cached lyrics for many songs in one query.
+    Only the database cache is consulted (no per-file tag extraction);
+    use /lyrics/{song_id} for the on-demand fallback.
+    """
+    ids = list(dict.fromkeys(payload.ids))
+    found = {}
+    backfill = []
+    for chunk in chunked(ids):
+        rows = session.exec(
+            select(Song.id, Song.lyrics, Song.synced_lyrics, Song.lyrics_timeline).where(Song.id.in_(chunk))
+        ).all()
+        for song_id, lyrics, synced, stored in rows:
+            timeline = loads_timeline(stored)
+            if synced and timeline is None:
+                synced, timeline = _reclassify_synced(synced)
+                backfill.append({"song_id": song_id, "synced": synced, "timeline": dump_timeline(timeline)})
+            found[song_id] = {
+                "song_id": song_id,
+                "plainLyrics": lyrics,
+                "syncedLyrics": synced,
+                "timeline": timeline
+            }
+    if backfill:
+        table = Song.__table__
+        session.connection().execute(
+            update(table)
+            .where(table.c.id == bindparam("song_id"))
+            .values(synced_lyrics=bindparam("synced"), lyrics_timeline=bindparam("timeline")),
+            backfill
+        )
+        session.commit()
 
-    # Return silent placeholder instead of 404 to fix console warnings
-    return Response(content=DEFAULT_COVER, media_type="image/png")
+    return {
+        "items": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found]
+    }
+
+def _reclassify_synced(synced: str):
+    """
+    (synced_lyrics, timeline) for a row scanned before timelines existed.
+    Text without timestamps was a false positive of the old "[...]" check:
+    it is plain lyrics, so synced becomes None.
+    """
+    timeline = parse_lrc(synced)
+    return (synced if timeline else None), timeline
+
+def _lyrics_response(plain: Optional[str], synced: Optional[str], timeline, position: Optional[float], before: int, after: int):
+    if timeline and position is not None:
+        timeline = slice_timeline(timeline, position, before, after)
+    return {"plainLyrics": plain, "syncedLyrics": synced, "timeline": timeline}
 
 @router.get("/lyrics/{song_id}")
-def get_lyrics(song_id: int, session: Session = Depends(get_session)):
+def get_lyrics(
+    song_id: int,
+    position: Optional[float] = None,
+    before: int = 5,
+    after: int = 20,
+    session: Session = Depends(get_session)
+):
     """
     Get lyrics for a song. Lyrics are sourced from:
     1. Database cache (extracted during library scan)
     2. Embedded tags in the audio file (fallback/on-demand extraction)
     
+    Synced (LRC) lyrics also come pre-parsed as `timeline`
+    ({times: [ms], lines, offset, tags}). Pass `position` (seconds) to get only
+    `before`/`after` lines around the active one, plus its `current` index.
+    
     No internet requests are made - fully offline.
     """
     song = session.get(Song, song_id)
@@ -119,12 +389,23 @@ def get_lyrics(song_id: int, session: Session = Depends(get_session)):
     
     # 1. Check DB Cache (populated during library scan)
     if song.synced_lyrics:
-        return {"plainLyrics": song.lyrics, "syncedLyrics": song.synced_lyrics}
+        timeline = loads_timeline(song.lyrics_timeline)
+        if timeline is None:
+            # Scanned before timelines existed: parse (or reclassify as plain) once and keep it
+            song.synced_lyrics, timeline = _reclassify_synced(song.synced_lyrics)
+            song.lyrics_timeline = dump_timeline(timeline)
+            session.add(song)
+            session.commit()
+        if song.synced_lyrics:
+            return _lyrics_response(song.lyrics, song.synced_lyrics, timeline, position, before, after)
     if song.lyrics:
-        return {"plainLyrics": song.lyrics, "syncedLyrics": None}
+        return _lyrics_response(song.lyrics, None, None, position, before, after)
 
     # 2. Try extracting from file (fallback for unscanned files or DB miss)
     if song.path and os.path.exists(song.path):
+        # Imported on first use: tag parsing is not needed to start serving
+        from mutagen import File as MutagenFile
+        from mutagen.id3 import ID3
         try:
             audio = MutagenFile(song.path, easy=True)
             if audio:
@@ -158,25 +439,25 @@ def get_lyrics(song_id: int, session: Session = Depends(get_session)):
                 if raw_lyrics and len(raw_lyrics.strip()) > 0:
                     raw_lyrics = raw_lyrics.strip()
                     
-                    # Detect if synced (contains LRC timestamps like [00:00.00])
-                    is_synced = '[' in raw_lyrics and ']' in raw_lyrics
+                    # Synced only if it actually parses as LRC
+                    timeline = parse_lrc(raw_lyrics)
                     
                     # Update DB for future requests
                     song.lyrics = raw_lyrics
                     song.has_lyrics = True
-                    if is_synced:
+                    if timeline:
                         song.synced_lyrics = raw_lyrics
+                        song.lyrics_timeline = dump_timeline(timeline)
                     
                     session.add(song)
                     session.commit()
                     
-                    return {
-                        "plainLyrics": raw_lyrics, 
-                        "syncedLyrics": raw_lyrics if is_synced else None
-                    }
+                    return _lyrics_response(
+                        raw_lyrics, raw_lyrics if timeline else None, timeline, position, before, after
+                    )
         except Exception as e:
             # Log but don't fail - just means no lyrics available
             print(f"[WARNING] Error extracting lyrics for song {song_id}: {e}")
 
     # 3. No lyrics found - return empty response (not an error)
-    return {"plainLyrics": None, "syncedLyrics": None, "message": "No embedded lyrics found"}
\ No newline at end of file
+    return {"plainLyrics": None, "syncedLyrics": None, "timeline": None, "message": "No embedded lyrics found"}
\ No newline at end of file
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import SQLModel, Session, select
-from database import get_session
-from models import Playlist, PlaylistSong, Song
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Form, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import SQLModel, Session, select, func, delete
+from sqlalchemy import update, insert, bindparam
+from database import engine, get_session, chunked
+from models import Playlist, PlaylistSong, PlaylistSummary, Song, SongListItem, song_list_columns
+from user_data_buffer import user_data_buffer
+from m3u import M3U_MEDIA_TYPES, PathIndex, iter_entries, render_entry
+from typing import List, Optional
+import bisect
+import os
+import re
+import urllib.parse
 
 router = APIRouter(prefix="/playlists", tags=["Playlists"])
 
@@ -11,6 +19,11 @@ class PlaylistCreate(SQLModel):
 
 class PlaylistAdd(SQLModel):
     song_ids: List[int]
+    # Where to insert: next to anchor songs (constant cost), or before an index
+    # (0 = top; costs a scan up to that index). None of them appends.
+    after_song_id: Optional[int] = None
+    before_song_id: Optional[int] = None
+    position: Optional[int] = None
 
 class PlaylistUpdate(SQLModel):
     name: str
@@ -18,6 +31,176 @@ class PlaylistUpdate(SQLModel):
 class PlaylistReorder(SQLModel):
     song_ids: List[int]
 
+class PlaylistMove(SQLModel):
+    song_id: int
+    # Where the song should end up: right after/before an anchor song (constant
+    # cost), or at an index (costs a scan up to that index)
+    after_song_id: Optional[int] = None
+    before_song_id: Optional[int] = None
+    position: Optional[int] = None
+
+# Sparse order keys: entries start ORDER_GAP apart, so a move or insert takes
+# the midpoint of its neighbours and writes only the affected rows.
+ORDER_GAP = 1024
+# Respace the playlist in the background once a gap gets this small
+REBALANCE_MIN_GAP = 4
+# Albums returned per playlist for cover mosaics
+SUMMARY_COVERS = 4
+# Unresolved M3U entries listed in an import report (all are counted)
+IMPORT_REPORT_LIMIT = 100
+# Rows per fetch while streaming an export
+EXPORT_BATCH = 1000
+UNSAFE_FILENAME_RE = re.compile(r'[\\/:*?"<>|]+')
+
+def _ordered(playlist_id: int, *columns, exclude: Optional[int] = None):
+    stmt = select(*columns).where(PlaylistSong.playlist_id == playlist_id)
+    if exclude is not None:
+        stmt = stmt.where(PlaylistSong.song_id != exclude)
+    return stmt.order_by(PlaylistSong.order, PlaylistSong.song_id)
+
+def _max_order(session: Session, playlist_id: int) -> Optional[int]:
+    return session.exec(
+        select(func.max(PlaylistSong.order)).where(PlaylistSong.playlist_id == playlist_id)
+    ).one()
+
+def _neighbours(session: Session, playlist_id: int, position: Optional[int], exclude: Optional[int] = None):
+    """Order keys just before and after index `position` (None at either end)."""
+    if position is None:
+        return _max_order(session, playlist_id), None
+    stmt = _ordered(playlist_id, PlaylistSong.order, exclude=exclude)
+    if position <= 0:
+        return None, session.exec(stmt.limit(1)).first()
+    rows = session.exec(stmt.offset(position - 1).limit(2)).all()
+    if not rows:
+        # Past the end: append
+        return _max_order(session, playlist_id), None
+    return rows[0], rows[1] if len(rows) > 1 else None
+
+def _anchor_order(session: Session, playlist_id: int, song_id: int) -> int:
+    link = session.get(PlaylistSong, (playlist_id, song_id))
+    if not link:
+        raise HTTPException(status_code=404, detail=f"Anchor song {song_id} not found in playlist")
+    return link.order
+
+def _anchor_neighbours(session: Session, playlist_id: int, after_song_id: Optional[int], before_song_id: Optional[int], exclude: Optional[int] = None):
+    """
+    Order keys around a slot named by its neighbouring songs: primary-key
+    lookups plus at most one seek on the (playlist_id, order) index.
+    """
+    if exclude is not None and exclude in (after_song_id, before_song_id):
+        raise HTTPException(status_code=400, detail="A song can't be anchored to itself")
+    stmt = select(PlaylistSong.order).where(PlaylistSong.playlist_id == playlist_id)
+    if exclude is not None:
+        stmt = stmt.where(PlaylistSong.song_id != exclude)
+    if after_song_id is not None:
+        before = _anchor_order(session, playlist_id, after_song_id)
+        if before_song_id is not None:
+            after = _anchor_order(session, playlist_id, before_song_id)
+            if after <= before:
+                raise HTTPException(status_code=400, detail="before_song_id must come after after_song_id")
+        else:
+            after = session.exec(stmt.where(PlaylistSong.order > before).order_by(PlaylistSong.order).limit(1)).first()
+        return before, after
+    after = _anchor_order(session, playlist_id, before_song_id)
+    before = session.exec(stmt.where(PlaylistSong.order < after).order_by(PlaylistSong.order.desc()).limit(1)).first()
+    return before, after
+
+def _keys_between(before: Optional[int], after: Optional[int], count: int):
+    """`count` increasing keys strictly between two neighbours, and their spacing (None if there is no room)."""
+    if after is None:
+        base = before if before is not None else 0
+        return [base + ORDER_GAP * (i + 1) for i in range(count)], ORDER_GAP
+    if before is None:
+        return [after - ORDER_GAP * (count - i) for i in range(count)], ORDER_GAP
+    step = (after - before) // (count + 1)
+    if step < 1:
+        return None, 0
+    return [before + step * (i + 1) for i in range(count)], step
+
+def _write_orders(session: Session, playlist_id: int, updates):
+    """Set order keys from (song_id, order) pairs in one executemany."""
+    if not updates:
+        return
+    table = PlaylistSong.__table__
+    session.connection().execute(
+        update(table)
+        .where(table.c.playlist_id == bindparam("pid"))
+        .where(table.c.song_id == bindparam("sid"))
+        .values(order=bindparam("new_order")),
+        [{"pid": playlist_id, "sid": song_id, "new_order": order} for song_id, order in updates]
+    )
+
+def _rebalance(session: Session, playlist_id: int, hole_at: Optional[int] = None, hole_size: int = 0, exclude: Optional[int] = None):
+    """
+    Respace every entry ORDER_GAP apart, optionally leaving `hole_size` free
+    slots at index `hole_at`. Returns the keys reserved for the hole.
+    """
+    song_ids = session.exec(_ordered(playlist_id, PlaylistSong.song_id, exclude=exclude)).all()
+    if hole_at is None:
+        hole_at = len(song_ids)
+    hole_at = max(0, min(hole_at, len(song_ids)))
+    updates = []
+    for i, song_id in enumerate(song_ids):
+        slot = i + 1 + (hole_size if i >= hole_at else 0)
+        updates.append((song_id, slot * ORDER_GAP))
+    _write_orders(session, playlist_id, updates)
+    return [(hole_at + 1 + i) * ORDER_GAP for i in range(hole_size)]
+
+def _rebalance_later(playlist_id: int):
+    with Session(engine) as session:
+        _rebalance(session, playlist_id)
+        session.commit()
+
+def _allocate(session: Session, playlist_id: int, position: Optional[int], count: int, exclude: Optional[int] = None,
+              after_song_id: Optional[int] = None, before_song_id: Optional[int] = None):
+    """
+    Order keys for `count` entries inserted next to the anchor songs (or at
+    `position` without anchors), and whether gaps are getting tight.
+    """
+    if after_song_id is not None or before_song_id is not None:
+        before, after = _anchor_neighbours(session, playlist_id, after_song_id, before_song_id, exclude=exclude)
+    else:
+        before, after = _neighbours(session, playlist_id, position, exclude=exclude)
+    keys, step = _keys_between(before, after, count)
+    if keys is None:
+        # No room left between the neighbours: respace now, keeping a hole
+        # (this walks the whole playlist anyway, so finding the index is free)
+        if before is not None:
+            count_stmt = select(func.count()).select_from(PlaylistSong).where(
+                PlaylistSong.playlist_id == playlist_id, PlaylistSong.order <= before
+            )
+            if exclude is not None:
+                count_stmt = count_stmt.where(PlaylistSong.song_id != exclude)
+            position = session.exec(count_stmt).one()
+        return _rebalance(session, playlist_id, hole_at=position, hole_size=count, exclude=exclude), False
+    return keys, step < REBALANCE_MIN_GAP
+
+def _insert_songs(session: Session, playlist_id: int, song_ids: List[int], position: Optional[int] = None,
+                  after_song_id: Optional[int] = None, before_song_id: Optional[int] = None):
+    """
+    Bulk-insert links for songs not already in the playlist (a song appears at
+    most once: the link's primary key). Returns (rows added, gaps tight).
+    """
+    song_ids = list(dict.fromkeys(song_ids))
+    existing = set()
+    for chunk in chunked(song_ids):
+        existing.update(session.exec(
+            select(PlaylistSong.song_id)
+            .where(PlaylistSong.playlist_id == playlist_id)
+            .where(PlaylistSong.song_id.in_(chunk))
+        ).all())
+    song_ids = [song_id for song_id in song_ids if song_id not in existing]
+    if not song_ids:
+        return 0, False
+
+    keys, tight = _allocate(session, playlist_id, position, len(song_ids),
+                            after_song_id=after_song_id, before_song_id=before_song_id)
+    session.connection().execute(
+        insert(PlaylistSong.__table__),
+        [{"playlist_id": playlist_id, "song_id": song_id, "order": key} for song_id, key in zip(song_ids, keys)]
+    )
+    return len(song_ids), tight
+
 @router.post("/", response_model=Playlist)
 def create_playlist(payload: PlaylistCreate, session: Session = Depends(get_session)):
     pl = Playlist(name=payload.name)
@@ -26,9 +209,177 @@ def create_playlist(payload: PlaylistCreate, session: Session = Depends(get_sess
     session.refresh(pl)
     return pl
 
-@router.get("/", response_model=List[Playlist])
+@router.get("/", response_model=List[PlaylistSummary])
 def get_playlists(session: Session = Depends(get_session)):
-    return session.exec(select(Playlist)).all()
+    """All playlists with song count, total duration and cover album ids, in one query."""
+    totals = (
+        select(
+            PlaylistSong.playlist_id,
+            func.count(Song.id).label("song_count"),
+            func.total(Song.duration).label("duration")
+        )
+        .join(Song, Song.id == PlaylistSong.song_id)
+        .group_by(PlaylistSong.playlist_id)
+        .subquery()
+    )
+    # Each album's first position per playlist, ranked, keeping the first few
+    firsts = (
+        select(PlaylistSong.playlist_id, Song.album_id, func.min(PlaylistSong.order).label("first_order"))
+        .join(Song, Song.id == PlaylistSong.song_id)
+        .where(Song.album_id.is_not(None))
+        .group_by(PlaylistSong.playlist_id, Song.album_id)
+        .subquery()
+    )
+    ranked = (
+        select(
+            firsts.c.playlist_id,
+            firsts.c.album_id,
+            func.row_number().over(partition_by=firsts.c.playlist_id, order_by=firsts.c.first_order).label("rank")
+        )
+        .subquery()
+    )
+    top = (
+        select(ranked.c.playlist_id, ranked.c.album_id)
+        .where(ranked.c.rank <= SUMMARY_COVERS)
+        .order_by(ranked.c.playlist_id, ranked.c.rank)
+        .subquery()
+    )
+    covers = (
+        select(top.c.playlist_id, func.group_concat(top.c.album_id).label("album_ids"))
+        .group_by(top.c.playlist_id)
+        .subquery()
+    )
+
+    rows = session.exec(
+        select(
+            Playlist.id,
+            Playlist.name,
+            func.coalesce(totals.c.song_count, 0),
+            func.coalesce(totals.c.duration, 0.0),
+            covers.c.album_ids
+        )
+        .outerjoin(totals, totals.c.playlist_id == Playlist.id)
+        .outerjoin(covers, covers.c.playlist_id == Playlist.id)
+        .order_by(Playlist.id)
+    ).all()
+    return [
+        PlaylistSummary(
+            id=pid,
+            name=name,
+            song_count=count,
+            duration=duration,
+            cover_album_ids=[int(a) for a in album_ids.split(",")] if album_ids else []
+        )
+        for pid, name, count, duration, album_ids in rows
+    ]
+
+@router.post("/import")
+def import_playlist(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    playlist_id: Optional[int] = Form(None),
+    name: Optional[str] = Form(None),
+    base_dir: Optional[str] = Form(None),
+    accept_fuzzy: bool = Form(False),
+    session: Session = Depends(get_session)
+):
+    """
+    Import an M3U/M3U8 file into `playlist_id`, or into a new playlist named
+    `name` (default: the file name). Entries are matched against the library
+    by full path (absolute, or relative to `base_dir`; case-insensitive) and
+    linked in one bulk insert. Relative entries that only match a unique
+    folder/file tail are reported as fuzzy and linked only with `accept_fuzzy`.
+    """
+    if playlist_id is not None:
+        pl = session.get(Playlist, playlist_id)
+        if not pl:
+            raise HTTPException(404, "Playlist not found")
+    else:
+        pl = Playlist(name=name or os.path.splitext(file.filename or "")[0] or "Imported Playlist")
+        session.add(pl)
+        session.flush()
+
+    # Stream rows into the index rather than materializing the result list
+    index = PathIndex(session.exec(select(Song.id, Song.path)))
+    song_ids = []
+    unresolved = []
+    unresolved_count = 0
+    fuzzy = []
+    fuzzy_count = 0
+    entries = 0
+    for entry in iter_entries(file.file):
+        entries += 1
+        song_id, exact = index.resolve(entry, base_dir)
+        if song_id is None:
+            unresolved_count += 1
+            if len(unresolved) < IMPORT_REPORT_LIMIT:
+                unresolved.append(entry)
+            continue
+        if not exact:
+            fuzzy_count += 1
+            if len(fuzzy) < IMPORT_REPORT_LIMIT:
+                fuzzy.append({"entry": entry, "song_id": song_id})
+            if not accept_fuzzy:
+                continue
+        song_ids.append(song_id)
+    del index
+
+    added, tight = _insert_songs(session, pl.id, song_ids)
+    session.commit()
+    if tight:
+        background_tasks.add_task(_rebalance_later, pl.id)
+    return {
+        "playlist_id": pl.id,
+        "name": pl.name,
+        "entries": entries,
+        "added": added,
+        "skipped": len(song_ids) - added,  # repeats or already in the playlist
+        "unresolved_count": unresolved_count,
+        "unresolved": unresolved,
+        # Tail-only matches: linked only when accept_fuzzy was set
+        "fuzzy_count": fuzzy_count,
+        "fuzzy": fuzzy,
+        "fuzzy_added": accept_fuzzy,
+    }
+
+def _export_chunks(playlist_id: int):
+    """Encoded M3U text, EXPORT_BATCH entries per chunk (each chunk is one threadpool hop)."""
+    # Own session: the response body is generated after the request's session closes
+    with Session(engine) as session:
+        buffer = ["#EXTM3U\n"]
+        stmt = (
+            select(Song.path, Song.duration, Song.artist, Song.title)
+            .join(PlaylistSong, PlaylistSong.song_id == Song.id)
+            .where(PlaylistSong.playlist_id == playlist_id)
+            .order_by(PlaylistSong.order, PlaylistSong.song_id)
+            .execution_options(yield_per=EXPORT_BATCH)
+        )
+        for path, duration, artist, title in session.exec(stmt):
+            buffer.append(render_entry(path, duration, artist, title))
+            if len(buffer) >= EXPORT_BATCH:
+                yield "".join(buffer).encode("utf-8")
+                buffer = []
+        if buffer:
+            yield "".join(buffer).encode("utf-8")
+
+@router.get("/{playlist_id}/export")
+def export_playlist(
+    playlist_id: int,
+    format: str = Query("m3u8", pattern="^(m3u|m3u8)$"),
+    session: Session = Depends(get_session)
+):
+    """Stream the playlist as an extended M3U file (UTF-8, absolute paths)."""
+    pl = session.get(Playlist, playlist_id)
+    if not pl:
+        raise HTTPException(404, "Playlist not found")
+
+    stem = UNSAFE_FILENAME_RE.sub("_", pl.name).strip() or "playlist"
+    filename = f"{stem}.{format}"
+    return StreamingResponse(
+        _export_chunks(playlist_id),
+        media_type=M3U_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}"}
+    )
 
 @router.get("/{playlist_id}", response_model=Playlist)
 def get_playlist(playlist_id: int, session: Session = Depends(get_session)):
@@ -46,35 +397,68 @@ def update_playlist(playlist_id: int, payload: PlaylistUpdate, session: Session
     session.refresh(pl)
     return pl
 
-@router.get("/{playlist_id}/songs", response_model=List[Song])
-def get_playlist_songs(playlist_id: int, session: Session = Depends(get_session)):
+@router.get("/{playlist_id}/songs", response_model=List[SongListItem])
+def get_playlist_songs(
+    playlist_id: int,
+    offset: int = 0,
+    limit: int = 5000,
+    session: Session = Depends(get_session)
+):
+    """A page of the playlist as list projections (no lyrics/comments), in playlist order."""
     stmt = (
-        select(Song)
-        .join(PlaylistSong)
+        select(*song_list_columns())
+        .join(PlaylistSong, PlaylistSong.song_id == Song.id)
         .where(PlaylistSong.playlist_id == playlist_id)
-        .order_by(PlaylistSong.order)
+        .order_by(PlaylistSong.order, PlaylistSong.song_id)
+        .offset(offset)
+        .limit(limit)
     )
-    return session.exec(stmt).all()
+    with user_data_buffer.reading():
+        songs = [dict(row._mapping) for row in session.exec(stmt).all()]
+        return user_data_buffer.overlay(songs)
 
 @router.post("/{playlist_id}/add")
-def add_songs_to_playlist(playlist_id: int, payload: PlaylistAdd, session: Session = Depends(get_session)):
+def add_songs_to_playlist(playlist_id: int, payload: PlaylistAdd, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+    """
+    Append songs, or insert them next to `after_song_id`/`before_song_id` or at
+    `position`. Songs already in the playlist are skipped.
+    """
     pl = session.get(Playlist, playlist_id)
     if not pl: raise HTTPException(404)
-    current_count = len(session.exec(select(PlaylistSong).where(PlaylistSong.playlist_id == playlist_id)).all())
-    for i, song_id in enumerate(payload.song_ids):
-        # We allow duplicates as per standard playlist behavior, but my reorder logic assumes we might want to be careful.
-        # For now, just add them.
-        link = PlaylistSong(playlist_id=playlist_id, song_id=song_id, order=current_count + i)
-        session.add(link)
+
+    added, tight = _insert_songs(session, playlist_id, payload.song_ids, payload.position,
+                                 after_song_id=payload.after_song_id, before_song_id=payload.before_song_id)
+    session.commit()
+    if tight:
+        background_tasks.add_task(_rebalance_later, playlist_id)
+    return {"message": "Songs added", "added": added}
+
+@router.post("/{playlist_id}/move")
+def move_playlist_song(playlist_id: int, payload: PlaylistMove, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+    """
+    Move one song next to an anchor song (or to an index). Writes a single row
+    unless the gap is exhausted.
+    """
+    link = session.get(PlaylistSong, (playlist_id, payload.song_id))
+    if not link:
+        raise HTTPException(status_code=404, detail="Song not found in playlist")
+    if payload.after_song_id is None and payload.before_song_id is None and payload.position is None:
+        raise HTTPException(status_code=400, detail="Give after_song_id, before_song_id or position")
+
+    keys, tight = _allocate(session, playlist_id, max(0, payload.position or 0), 1, exclude=payload.song_id,
+                            after_song_id=payload.after_song_id, before_song_id=payload.before_song_id)
+    link.order = keys[0]
+    session.add(link)
     session.commit()
-    return {"message": "Songs added"}
+    if tight:
+        background_tasks.add_task(_rebalance_later, playlist_id)
+    return {"message": "Song moved"}
 
 @router.delete("/{playlist_id}")
 def delete_playlist(playlist_id: int, session: Session = Depends(get_session)):
     pl = session.get(Playlist, playlist_id)
     if not pl: raise HTTPException(404)
-    links = session.exec(select(PlaylistSong).where(PlaylistSong.playlist_id == playlist_id)).all()
-    for link in links: session.delete(link)
+    session.exec(delete(PlaylistSong).where(PlaylistSong.playlist_id == playlist_id))
     session.delete(pl)
     session.commit()
     return {"message": "Deleted"}
@@ -82,53 +466,103 @@ def delete_playlist(playlist_id: int, session: Session = Depends(get_session)):
 @router.delete("/{playlist_id}/songs/{song_id}")
 def remove_song_from_playlist(playlist_id: int, song_id: int, session: Session = Depends(get_session)):
     """Remove a song from a playlist."""
-    # Removes ALL instances of this song in the playlist for now to simplify
-    links = session.exec(
-        select(PlaylistSong)
-        .where(PlaylistSong.playlist_id == playlist_id)
-        .where(PlaylistSong.song_id == song_id)
-    ).all()
-    
-    if not links:
+    link = session.get(PlaylistSong, (playlist_id, song_id))
+    if not link:
         raise HTTPException(status_code=404, detail="Song not found in playlist")
-        
-    for link in links:
-        session.delete(link)
+
+    session.delete(link)
     session.commit()
     return {"message": "Song removed"}
 
+@router.delete("/{playlist_id}/at/{position}")
+def remove_playlist_position(playlist_id: int, position: int, session: Session = Depends(get_session)):
+    """Remove the entry at an index."""
+    song_id = session.exec(
+        _ordered(playlist_id, PlaylistSong.song_id).offset(max(0, position)).limit(1)
+    ).first()
+    if song_id is None:
+        raise HTTPException(status_code=404, detail="Position out of range")
+    session.exec(
+        delete(PlaylistSong)
+        .where(PlaylistSong.playlist_id == playlist_id)
+        .where(PlaylistSong.song_id == song_id)
+    )
+    session.commit()
+    return {"message": "Song removed", "song_id": song_id}
+
+def _stable_run(keys: List[int]) -> set:
+    """Indexes of a longest strictly increasing run of `keys` (rows that can keep their key)."""
+    tail_keys = []  # tail_keys[k]: smallest key ending an increasing run of length k + 1
+    tails = []      # index of that key
+    parent = [-1] * len(keys)
+    for i, key in enumerate(keys):
+        k = bisect.bisect_left(tail_keys, key)
+        if k:
+            parent[i] = tails[k - 1]
+        if k == len(tails):
+            tail_keys.append(key)
+            tails.append(i)
+        else:
+            tail_keys[k] = key
+            tails[k] = i
+    run = set()
+    i = tails[-1] if tails else -1
+    while i != -1:
+        run.add(i)
+        i = parent[i]
+    return run
+
 @router.post("/{playlist_id}/reorder")
-def reorder_playlist(playlist_id: int, payload: PlaylistReorder, session: Session = Depends(get_session)):
-    """Reorder playlist based on a list of song IDs."""
+def reorder_playlist(playlist_id: int, payload: PlaylistReorder, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+    """
+    Reorder playlist based on a list of song IDs. The longest run of songs
+    already in order keeps its keys; only the moved rows are rewritten.
+    """
     pl = session.get(Playlist, playlist_id)
     if not pl:
         raise HTTPException(404, "Playlist not found")
-    
-    links = session.exec(
-        select(PlaylistSong).where(PlaylistSong.playlist_id == playlist_id)
-    ).all()
-    
-    # Map song_id to list of links to handle duplicates
-    link_map = {}
-    for link in links:
-        if link.song_id not in link_map:
-            link_map[link.song_id] = []
-        link_map[link.song_id].append(link)
-    
-    current_order = 0
-    for song_id in payload.song_ids:
-        if link_map.get(song_id):
-            link = link_map[song_id].pop(0)
-            link.order = current_order
-            session.add(link)
-            current_order += 1
-    
-    # Append any remaining links not in the new order
-    for remaining_links in link_map.values():
-        for link in remaining_links:
-            link.order = current_order
-            session.add(link)
-            current_order += 1
 
+    current = dict(session.exec(
+        select(PlaylistSong.song_id, PlaylistSong.order).where(PlaylistSong.playlist_id == playlist_id)
+    ).all())
+
+    # Songs in the requested order first, then any the payload left out
+    new_order = [song_id for song_id in dict.fromkeys(payload.song_ids) if song_id in current]
+    listed = set(new_order)
+    remaining = sorted((order, song_id) for song_id, order in current.items() if song_id not in listed)
+    new_order.extend(song_id for _, song_id in remaining)
+
+    keys = [current[song_id] for song_id in new_order]
+    stable = _stable_run(keys)
+    updates = []
+    tight = False
+    i = 0
+    while i < len(new_order):
+        if i in stable:
+            i += 1
+            continue
+        # A run of moved songs between two rows that keep their keys
+        end = i
+        while end < len(new_order) and end not in stable:
+            end += 1
+        before = keys[i - 1] if i else None
+        after = keys[end] if end < len(new_order) else None
+        run_keys, step = _keys_between(before, after, end - i)
+        if run_keys is None:
+            # No room somewhere: respace everything (rewrites only keys that differ)
+            updates = [
+                (song_id, (n + 1) * ORDER_GAP)
+                for n, song_id in enumerate(new_order)
+                if current[song_id] != (n + 1) * ORDER_GAP
+            ]
+            tight = False
+            break
+        tight = tight or step < REBALANCE_MIN_GAP
+        updates.extend(zip(new_order[i:end], run_keys))
+        i = end
+
+    _write_orders(session, playlist_id, updates)
     session.commit()
-    return {"message": "Playlist reordered"}
\ No newline at end of file
+    if tight:
+        background_tasks.add_task(_rebalance_later, playlist_id)
+    return {"message": "Playlist reordered", "moved": len(updates)}
@@ -0,0 +1,196 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import SQLModel, Session, select, delete, func
+from sqlalchemy import insert, literal
+from database import get_session
+from models import SmartPlaylist, SmartPlaylistSong, Song, SongListItem, song_list_columns
+from smart_rules import (
+    FIELDS, OPERATORS, RuleError, SmartRules, compile_rules, uses_buffered_fields, uses_relative_dates
+)
+from changelog import content_revision
+from user_data_buffer import user_data_buffer
+from typing import List, Optional, Any, Dict, Tuple
+import time
+
+router = APIRouter(prefix="/smart-playlists", tags=["Smart Playlists"])
+
+# Materialized rules with in_last/not_in_last are recomputed at least this often (seconds)
+RELATIVE_DATE_BUCKET = 3600
+
+class SmartPlaylistCreate(SQLModel):
+    name: str
+    rules: SmartRules
+    materialize: bool = False
+
+class SmartPlaylistUpdate(SQLModel):
+    name: Optional[str] = None
+    rules: Optional[SmartRules] = None
+    materialize: Optional[bool] = None
+
+class SmartPlaylistRead(SQLModel):
+    id: int
+    name: str
+    rules: Dict[str, Any]
+    materialize: bool
+    materialized_rev: Optional[int] = None
+
+def _read(sp: SmartPlaylist) -> SmartPlaylistRead:
+    return SmartPlaylistRead(
+        id=sp.id,
+        name=sp.name,
+        rules=SmartRules.model_validate_json(sp.rules).model_dump(exclude_none=True),
+        materialize=sp.materialize,
+        materialized_rev=sp.materialized_rev
+    )
+
+def _compile(rules: SmartRules, seed: int = 0):
+    try:
+        return compile_rules(rules, seed)
+    except RuleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _freshness(session: Session, rules: SmartRules) -> Tuple[int, Optional[int]]:
+    """
+    (revision, time bucket) the rules' results depend on. Play/rating flushes
+    only count for rules that read those fields; the bucket is None unless
+    a condition is relative to now.
+    """
+    buffered = uses_buffered_fields(rules)
+    if buffered:
+        # Persist pending plays/ratings first
+        user_data_buffer.flush()
+    revision = content_revision(session, include_user_data=buffered)
+    bucket = int(time.time() // RELATIVE_DATE_BUCKET) if uses_relative_dates(rules) else None
+    return revision, bucket
+
+def _page(session: Session, rules: SmartRules, revision: int, offset: int, limit: int):
+    """Run the compiled query directly, windowed to the rule set's own limit."""
+    where, order_by, rule_limit = _compile(rules, revision)
+    if rule_limit is not None:
+        limit = max(0, min(limit, rule_limit - offset))
+    stmt = select(*song_list_columns())
+    if where is not None:
+        stmt = stmt.where(where)
+    rows = session.exec(stmt.order_by(*order_by).offset(offset).limit(limit)).all()
+    return [dict(row._mapping) for row in rows]
+
+def _materialize(session: Session, sp: SmartPlaylist, rules: SmartRules, revision: int, bucket: Optional[int]):
+    """Recompute the stored result rows with a single INSERT ... SELECT."""
+    where, order_by, rule_limit = _compile(rules, revision)
+    source = select(
+        literal(sp.id),
+        func.row_number().over(order_by=order_by),
+        Song.id
+    )
+    if where is not None:
+        source = source.where(where)
+    source = source.order_by(*order_by)
+    if rule_limit is not None:
+        source = source.limit(rule_limit)
+
+    session.exec(delete(SmartPlaylistSong).where(SmartPlaylistSong.smart_playlist_id == sp.id))
+    session.connection().execute(
+        insert(SmartPlaylistSong.__table__).from_select(["smart_playlist_id", "position", "song_id"], source)
+    )
+    sp.materialized_rev = revision
+    sp.materialized_bucket = bucket
+    session.add(sp)
+    session.commit()
+
+@router.get("/fields")
+def get_rule_fields():
+    """Fields, their kinds and the operators each kind accepts (for rule editors)."""
+    return {
+        "fields": {name: kind for name, (_, kind) in FIELDS.items()},
+        "operators": OPERATORS,
+        "sort_by": list(FIELDS) + ["random"],
+    }
+
+@router.get("/", response_model=List[SmartPlaylistRead])
+def get_smart_playlists(session: Session = Depends(get_session)):
+    return [_read(sp) for sp in session.exec(select(SmartPlaylist)).all()]
+
+@router.post("/", response_model=SmartPlaylistRead)
+def create_smart_playlist(payload: SmartPlaylistCreate, session: Session = Depends(get_session)):
+    _compile(payload.rules)
+    sp = SmartPlaylist(name=payload.name, rules=payload.rules.model_dump_json(), materialize=payload.materialize)
+    session.add(sp)
+    session.commit()
+    session.refresh(sp)
+    return _read(sp)
+
+@router.post("/preview", response_model=List[SongListItem])
+def preview_smart_playlist(rules: SmartRules, offset: int = 0, limit: int = 500, session: Session = Depends(get_session)):
+    """Evaluate rules without saving them."""
+    revision, _ = _freshness(session, rules)
+    return _page(session, rules, revision, offset, limit)
+
+@router.get("/{smart_playlist_id}", response_model=SmartPlaylistRead)
+def get_smart_playlist(smart_playlist_id: int, session: Session = Depends(get_session)):
+    sp = session.get(SmartPlaylist, smart_playlist_id)
+    if not sp: raise HTTPException(404, "Smart playlist not found")
+    return _read(sp)
+
+@router.patch("/{smart_playlist_id}", response_model=SmartPlaylistRead)
+def update_smart_playlist(smart_playlist_id: int, payload: SmartPlaylistUpdate, session: Session = Depends(get_session)):
+    sp = session.get(SmartPlaylist, smart_playlist_id)
+    if not sp: raise HTTPException(404, "Smart playlist not found")
+    if payload.name is not None:
+        sp.name = payload.name
+    if payload.rules is not None:
+        _compile(payload.rules)
+        sp.rules = payload.rules.model_dump_json()
+        sp.materialized_rev = None
+    if payload.materialize is not None:
+        sp.materialize = payload.materialize
+        sp.materialized_rev = None
+        if not payload.materialize:
+            session.exec(delete(SmartPlaylistSong).where(SmartPlaylistSong.smart_playlist_id == sp.id))
+    session.add(sp)
+    session.commit()
+    session.refresh(sp)
+    return _read(sp)
+
+@router.delete("/{smart_playlist_id}")
+def delete_smart_playlist(smart_playlist_id: int, session: Session = Depends(get_session)):
+    sp = session.get(SmartPlaylist, smart_playlist_id)
+    if not sp: raise HTTPException(404, "Smart playlist not found")
+    session.exec(delete(SmartPlaylistSong).where(SmartPlaylistSong.smart_playlist_id == sp.id))
+    session.delete(sp)
+    session.commit()
+    return {"message": "Deleted"}
+
+@router.get("/{smart_playlist_id}/songs", response_model=List[SongListItem])
+def get_smart_playlist_songs(
+    smart_playlist_id: int,
+    offset: int = 0,
+    limit: int = 5000,
+    session: Session = Depends(get_session)
+):
+    """
+    Songs matching the rules, paged. Materialized playlists are recomputed
+    only when changes the rules depend on were recorded since the last
+    refresh (plays and ratings only for rules reading them), or when the
+    time bucket of an in_last/not_in_last rule has rolled over.
+    """
+    sp = session.get(SmartPlaylist, smart_playlist_id)
+    if not sp: raise HTTPException(404, "Smart playlist not found")
+    rules = SmartRules.model_validate_json(sp.rules)
+    revision, bucket = _freshness(session, rules)
+
+    if sp.materialize and (sp.materialized_rev, sp.materialized_bucket) != (revision, bucket):
+        _materialize(session, sp, rules, revision, bucket)
+
+    with user_data_buffer.reading():
+        if not sp.materialize:
+            songs = _page(session, rules, revision, offset, limit)
+        else:
+            rows = session.exec(
+                select(*song_list_columns())
+                .join(SmartPlaylistSong, SmartPlaylistSong.song_id == Song.id)
+                .where(SmartPlaylistSong.smart_playlist_id == smart_playlist_id)
+                .order_by(SmartPlaylistSong.position)
+                .offset(offset)
+                .limit(limit)
+            ).all()
+            songs = [dict(row._mapping) for row in rows]
+        return user_data_buffer.overlay(songs)
@@ -1,69 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from fastapi.responses import StreamingResponse
-from sqlmodel import Session
-from database import get_session
-from models import Song
-import os
-import mimetypes
-from streamer import range_generator
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from models import BatchRequest
+from stream_cache import stream_cache, prefetch
 
 router = APIRouter(prefix="/stream", tags=["Stream"])
 
-@router.get("/{song_id}")
-def stream_music(
-    song_id: int,
-    range: str = Header(None),
-    session: Session = Depends(get_session)
-):
-    # 1. Find the song in DB
-    song = session.get(Song, song_id)
-    if not song:
-        raise HTTPException(status_code=404, detail="Song not found")
-    
-    # 2. Verify file exists on disk
-    if not os.path.exists(song.path):
-        raise HTTPException(status_code=404, detail="File not found on disk")
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    # Weak comparison is fine for If-None-Match
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
 
-    file_size = os.path.getsize(song.path)
-    
-    # 3. Handle "Range" Header (Seeking)
-    start = 0
-    end = file_size - 1
-    
-    if range:
-        # Example header: "bytes=0-" or "bytes=1024-2048"
-        try:
-            start_str, end_str = range.replace("bytes=", "").split("-")
-            start = int(start_str)
-            if end_str:
-                end = int(end_str)
-        except ValueError:
-            pass # Fallback to full file if header is malformed
+@router.post("/prefetch", status_code=202)
+async def prefetch_queue(request: BatchRequest):
+    """
+    Warm the first few MB of the upcoming queue entries (next song ids, in
+    play order) so the next track starts without a cold read.
+    """
+    return {"queued": prefetch(request.ids)}
 
-    # Ensure valid range
-    if start >= file_size:
-        # If browser asks for a byte past the end, reset
-        start = 0
-        end = file_size - 1
+@router.api_route("/{song_id}", methods=["GET", "HEAD"])
+async def stream_music(song_id: int, request: Request):
+    """
+    Stream an audio file with HTTP Range support (seeking).
+    Path, size, mtime and MIME type come from the stream cache, so repeated
+    range requests for the playing track run on the event loop without a DB
+    query or stat. FileResponse handles single, suffix and multi-range
+    requests, If-Range against our ETag, 416 for unsatisfiable ranges and HEAD,
+    using zero-copy `pathsend` when the server supports it.
+    """
+    info = stream_cache.get(song_id)
+    if info is None:
+        info = await run_in_threadpool(stream_cache.load, song_id)
+        if info is None:
+            raise HTTPException(status_code=404, detail="Song not found")
 
-    # 4. Calculate Content-Length for this specific chunk
-    chunk_length = end - start + 1
-    
-    # 5. Guess MIME type (audio/mpeg, audio/flac, etc.)
-    mime_type, _ = mimetypes.guess_type(song.path)
-    if not mime_type:
-        mime_type = "audio/mpeg" # Default fallback
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and "range" not in request.headers and _etag_matches(if_none_match, info.etag):
+        return Response(status_code=304, headers=info.headers)
 
-    # 6. Return the 206 Partial Content response
-    headers = {
-        "Content-Range": f"bytes {start}-{end}/{file_size}",
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(chunk_length),
-        "Content-Type": mime_type,
-    }
-    
-    return StreamingResponse(
-        range_generator(song.path, start, end),
-        status_code=206,
-        headers=headers
-    )
\ No newline at end of file
+    return FileResponse(
+        info.path,
+        media_type=info.mime,
+        stat_result=info.stat_result,
+        headers=info.headers
+    )
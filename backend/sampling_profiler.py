@@ -0,0 +1,39 @@
+# Low-overhead sampling profiler for one running thread (collapsed-stack output)
+import os
+import sys
+import time
+from collections import Counter
+
+MAX_DEPTH = 64
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_thread(thread_id: int, duration: float, interval: float = 0.005) -> Counter:
+    """
+    Sample the stack of `thread_id` every `interval` seconds for up to
+    `duration` seconds (stops early if the thread exits). Returns a Counter of
+    "outer;...;inner" stacks -> samples, the folded format flame graph tools read.
+    """
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        stacks[";".join(reversed(labels))] += 1
+        # Drop the frame references before sleeping so the sampled thread is not kept alive
+        del frame
+        time.sleep(interval)
+    return stacks
+
+
+def render_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
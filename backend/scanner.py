@@ -1,13 +1,23 @@
 import os
+import threading
 from datetime import datetime
-from sqlmodel import Session, select
+from time import perf_counter
+from sqlmodel import Session, select, delete
 from mutagen import File as MutagenFile
 from mutagen.id3 import ID3
-from database import engine
-from models import Song, Album
+from database import engine, chunked
+from models import Song, Album, AlbumArt
 from scanner_progress import scanner_progress
+from search_index import suggestion_index
+from changelog import compact as compact_changelog
+from artwork import find_sidecar, has_embedded_art
+from cover_store import cover_cache
+from lyrics import parse_lrc, dumps as dump_timeline
+from stream_cache import stream_cache
 
 AUDIO_EXTENSIONS = {'.mp3', '.flac', '.m4a', '.wav', '.ogg', '.wma', '.aac', '.alac'}
+# Songs probed for embedded art per album and directory
+ART_PROBES_PER_ALBUM = 3
 
 def safe_get(audio, key, default=None):
     """Safely get a tag value, handling both single and multi-value tags."""
@@ -46,11 +56,89 @@ def clean_string(value):
     result = str(value).replace('\x00', '').strip()
     return result if result else ""
 
+def _index_directory_art(session, root, files, sidecar, candidates, embedded, changed, albums_by_id, art_stale_album_ids):
+    """
+    Record the best artwork source for albums found in one directory:
+    a sidecar image when the directory holds a single album, otherwise a
+    song whose embedded art was seen while it was parsed (`embedded`).
+    An album keeps a sidecar from another directory while that file exists,
+    so albums split across folders (CD1/, CD2/) don't flip between covers.
+    Songs are probed here only for albums that lost their sidecar, or whose
+    new/changed files (`changed`) skipped the parse-time probe because this
+    directory has a sidecar that turned out to be shared by several albums.
+    """
+    album_ids = [i for i in candidates if i in albums_by_id]
+
+    # Sidecars removed from this directory
+    listed = None
+    lost = set()
+    for album_id in album_ids:
+        album = albums_by_id[album_id]
+        if album.cover_path and os.path.dirname(album.cover_path) == root:
+            listed = listed if listed is not None else set(files)
+            if os.path.basename(album.cover_path) not in listed:
+                album.cover_path = None
+                session.add(album)
+                art_stale_album_ids.add(album_id)
+                lost.add(album_id)
+
+    if sidecar and len(album_ids) == 1:
+        album = albums_by_id[album_ids[0]]
+        if album.cover_path != sidecar and not (album.cover_path and os.path.isfile(album.cover_path)):
+            album.cover_path = sidecar
+            session.add(album)
+            art_stale_album_ids.add(album.id)
+        return
+
+    for album_id in album_ids:
+        album = albums_by_id[album_id]
+        if album.cover_path or album.cover_song_id:
+            continue
+        song = embedded.get(album_id)
+        if song is None and (album_id in lost or (sidecar and album_id in changed)):
+            # Not probed while parsed: it had (or its directory has) a sidecar
+            song = next(
+                (s for s in candidates[album_id][:ART_PROBES_PER_ALBUM] if has_embedded_art(s.path)), None
+            )
+        if song is not None:
+            if song.id is None:
+                session.flush()
+            album.cover_song_id = song.id
+            session.add(album)
+            art_stale_album_ids.add(album.id)
+
+def _timed_walk(root_directory, profile):
+    """os.walk, with the time spent listing directories charged to the "walk" phase."""
+    walker = os.walk(root_directory)
+    while True:
+        started = perf_counter()
+        entry = next(walker, None)
+        profile.add("walk", perf_counter() - started)
+        if entry is None:
+            return
+        yield entry
+
+def run_scan(root_directories):
+    """
+    Scan each library root in turn, then release the scanner lease.
+    The caller must have claimed it with scanner_progress.acquire().
+    """
+    if not scanner_progress.start():
+        # The lease lapsed before this task ran (and may belong to another scan now)
+        return
+    scanner_progress.thread_id = threading.get_ident()
+    try:
+        for root_directory in root_directories:
+            if not scanner_progress.is_scanning:
+                break
+            scan_directory(root_directory)
+    finally:
+        scanner_progress.finish()
+
 def scan_directory(root_directory: str):
     if not os.path.exists(root_directory): return
 
-    # Reset and start progress tracking
-    scanner_progress.reset()
+    profile = scanner_progress.profile
 
     try:
         with Session(engine) as session:
@@ -62,16 +150,28 @@ def scan_directory(root_directory: str):
             found_paths = set()
             existing_albums = session.exec(select(Album)).all()
             album_cache = {(a.title.lower(), a.artist.lower()): a for a in existing_albums}
+            albums_by_id = {a.id: a for a in existing_albums}
             
             new_songs_count = 0
             updated_songs_count = 0
             deleted_songs_count = 0
+            # Albums whose artwork must be re-resolved (source changed, file rewritten, album removed)
+            art_stale_album_ids = set()
 
-            for root, _, files in os.walk(root_directory):
+            for root, _, files in _timed_walk(root_directory, profile):
                 # Check cancellation
                 if not scanner_progress.is_scanning:
                     break
 
+                # Artwork indexing: sidecar from the listing we already have, the
+                # songs of each album in this directory, and (for albums without a
+                # source) the first new/changed song seen with embedded art
+                dir_sidecar = find_sidecar(root, files)
+                dir_art_candidates = {}
+                dir_art_found = {}
+                dir_art_probes = {}
+                dir_art_changed = set()
+
                 for file in files:
                     # Check cancellation
                     if not scanner_progress.is_scanning:
@@ -84,9 +184,11 @@ def scan_directory(root_directory: str):
                         
                         # Update current file being processed
                         scanner_progress.update(files=1, current=file)
+                        file_started = perf_counter()
                         
                         try:
                             file_size = os.path.getsize(full_path)
+                            profile.add("stat", perf_counter() - file_started)
                             
                             # Check if update is needed
                             existing_song = song_map.get(full_path)
@@ -94,10 +196,14 @@ def scan_directory(root_directory: str):
                                 # If file size hasn't changed, skip parsing (optimization)
                                 # BUT -> If missing lyrics, force re-scan to apply new robust extraction logic
                                 if existing_song.file_size == file_size and existing_song.has_lyrics:
+                                    dir_art_candidates.setdefault(existing_song.album_id, []).append(existing_song)
+                                    profile.count("files_skipped")
                                     continue
                             
                             # Parse Tags (for New OR Update)
+                            started = perf_counter()
                             audio = MutagenFile(full_path, easy=True)
+                            profile.add("parse", perf_counter() - started)
                             if audio is None:
                                 scanner_progress.update(errors=1)
                                 continue
@@ -109,6 +215,7 @@ def scan_directory(root_directory: str):
                             album_artist = clean_string(safe_get(audio, 'albumartist', artist)) or artist
                             
                             # --- ALBUM MANAGEMENT ---
+                            started = perf_counter()
                             album_key = (album_title.lower(), album_artist.lower())
                             if album_key not in album_cache:
                                 # Extract album-level metadata
@@ -125,8 +232,11 @@ def scan_directory(root_directory: str):
                                 session.commit()
                                 session.refresh(new_album)
                                 album_cache[album_key] = new_album
+                                albums_by_id[new_album.id] = new_album
+                                profile.count("albums_created")
                             
                             album_id = album_cache[album_key].id
+                            profile.add("album", perf_counter() - started)
 
                             # --- METADATA EXTRACTION ---
                             # People
@@ -163,7 +273,9 @@ def scan_directory(root_directory: str):
                             lyrics = clean_string(safe_get(audio, 'lyrics'))
                             
                             # Fallback for ID3 USLT if easy=True missed it
+                            audio_raw = None
                             if not lyrics and (ext == '.mp3' or ext == '.m4a'):
+                                started = perf_counter()
                                 try:
                                     audio_raw = MutagenFile(full_path)
                                     if audio_raw and hasattr(audio_raw, 'tags'):
@@ -179,8 +291,11 @@ def scan_directory(root_directory: str):
                                             lyrics = audio_raw['©lyr'][0]
                                 except:
                                     pass
+                                profile.add("lyrics", perf_counter() - started)
 
                             has_lyrics = lyrics is not None and len(lyrics) > 0
+                            # Parse LRC once here; plain lyrics have no timeline
+                            timeline = parse_lrc(lyrics) if has_lyrics else None
                             comment = clean_string(safe_get(audio, 'comment'))
                             description = clean_string(safe_get(audio, 'description'))
                             language = clean_string(safe_get(audio, 'language'))
@@ -200,8 +315,27 @@ def scan_directory(root_directory: str):
                             grouping = clean_string(safe_get(audio, 'grouping'))
                             subtitle = clean_string(safe_get(audio, 'subtitle'))
 
+                            # --- EMBEDDED ART (new/rewritten files of albums without a source, reusing this parse) ---
+                            # Unchanged files re-parsed for lyrics were probed when they were new;
+                            # a directory sidecar usually covers the album, so those files wait
+                            # for _index_directory_art to decide whether a probe is needed
+                            album = albums_by_id[album_id]
+                            has_art = False
+                            file_changed = existing_song is None or existing_song.file_size != file_size
+                            if file_changed and dir_sidecar:
+                                dir_art_changed.add(album_id)
+                            elif (file_changed and album_id not in dir_art_found
+                                    and not album.cover_path and not album.cover_song_id
+                                    and dir_art_probes.get(album_id, 0) < ART_PROBES_PER_ALBUM):
+                                started = perf_counter()
+                                dir_art_probes[album_id] = dir_art_probes.get(album_id, 0) + 1
+                                has_art = has_embedded_art(full_path, audio_raw if audio_raw is not None else audio)
+                                profile.add("art", perf_counter() - started)
+
                             if existing_song:
                                 # --- UPDATE EXISTING ---
+                                # Rewritten file may carry new embedded art
+                                size_changed = existing_song.file_size != file_size
                                 existing_song.title = title
                                 existing_song.artist = artist
                                 existing_song.album_id = album_id
@@ -231,9 +365,8 @@ def scan_directory(root_directory: str):
                                 existing_song.codec = codec
                                 existing_song.has_lyrics = has_lyrics
                                 existing_song.lyrics = lyrics
-                                # Simple detection: if lyrics contains [00:00 style timestamps, it might be synced
-                                if lyrics and '[' in lyrics and ']' in lyrics:
-                                    existing_song.synced_lyrics = lyrics
+                                existing_song.synced_lyrics = lyrics if timeline else None
+                                existing_song.lyrics_timeline = dump_timeline(timeline)
                                 existing_song.comment = comment
                                 existing_song.description = description
                                 existing_song.language = language
@@ -250,6 +383,11 @@ def scan_directory(root_directory: str):
                                 
                                 session.add(existing_song)
                                 updated_songs_count += 1
+                                if size_changed:
+                                    art_stale_album_ids.add(album_id)
+                                dir_art_candidates.setdefault(album_id, []).append(existing_song)
+                                if has_art:
+                                    dir_art_found[album_id] = existing_song
                             else:
                                 # --- INSERT NEW ---
                                 song = Song(
@@ -282,7 +420,8 @@ def scan_directory(root_directory: str):
                                     codec=codec,
                                     has_lyrics=has_lyrics,
                                     lyrics=lyrics,
-                                    synced_lyrics=lyrics if (lyrics and '[' in lyrics and ']' in lyrics) else None,
+                                    synced_lyrics=lyrics if timeline else None,
+                                    lyrics_timeline=dump_timeline(timeline),
                                     comment=comment,
                                     description=description,
                                     language=language,
@@ -300,10 +439,15 @@ def scan_directory(root_directory: str):
                                 )
                                 session.add(song)
                                 new_songs_count += 1
+                                dir_art_candidates.setdefault(album_id, []).append(song)
+                                if has_art:
+                                    dir_art_found[album_id] = song
                                 scanner_progress.update(songs=1)
 
                             if (new_songs_count + updated_songs_count) % 50 == 0:
+                                started = perf_counter()
                                 session.commit()
+                                profile.add("commit", perf_counter() - started)
                                 
                         except Exception as e:
                             # Track detailed error information
@@ -314,9 +458,22 @@ def scan_directory(root_directory: str):
                                 error_msg=error_msg
                             )
                             continue
+                        finally:
+                            profile.file_done(full_path, perf_counter() - file_started)
+
+                # --- ARTWORK SOURCES (per directory) ---
+                if dir_art_candidates:
+                    started = perf_counter()
+                    _index_directory_art(
+                        session, root, files, dir_sidecar, dir_art_candidates, dir_art_found, dir_art_changed,
+                        albums_by_id, art_stale_album_ids
+                    )
+                    profile.add("art", perf_counter() - started)
 
             # --- CLEANUP DELETED FILES ---
-            start_paths = [p for p in song_map.keys() if p.startswith(str(root_directory))]
+            started = perf_counter()
+            # A stopped scan never saw the rest of the tree: nothing unvisited is missing
+            start_paths = [p for p in song_map.keys() if p.startswith(str(root_directory))] if scanner_progress.is_scanning else []
             for path in start_paths:
                 if path not in found_paths:
                     song_to_delete = song_map[path]
@@ -329,13 +486,32 @@ def scan_directory(root_directory: str):
             all_albums = session.exec(select(Album)).all()
             for alb in all_albums:
                 if not session.exec(select(Song).where(Song.album_id == alb.id)).first():
+                    art_stale_album_ids.add(alb.id)
                     session.delete(alb)
+            
+            # Drop album -> artwork mappings so covers are re-resolved (and ids reused
+            # by new albums never inherit old artwork)
+            for chunk in chunked(list(art_stale_album_ids)):
+                session.exec(delete(AlbumArt).where(AlbumArt.album_id.in_(chunk)))
             session.commit()
             
+            # Delete cached covers no remaining album points to
+            if art_stale_album_ids:
+                cover_cache.prune_orphans(
+                    session.exec(select(AlbumArt.art_hash).where(AlbumArt.art_hash.is_not(None)).distinct()).all()
+                )
+            profile.add("cleanup", perf_counter() - started)
+            
+            # Refresh search suggestions and stream metadata only when the library actually changed
+            if new_songs_count or updated_songs_count or deleted_songs_count:
+                started = perf_counter()
+                suggestion_index.rebuild()
+                stream_cache.clear()
+                compact_changelog(session)
+                profile.add("finalize", perf_counter() - started)
+            
             print(f"Scan complete: {new_songs_count} new, {updated_songs_count} updated, {deleted_songs_count} deleted.")
             
     except Exception as e:
         print(f"Critical Scanner Error: {e}")
-        scanner_progress.update(errors=1, error_file="scanner", error_msg=f"Critical: {e}")
-    finally:
-        scanner_progress.finish()
\ No newline at end of file
+        scanner_progress.update(errors=1, error_file="scanner", error_msg=f"Critical: {e}")
\ No newline at end of file
@@ -1,8 +1,28 @@
-# Scanner progress tracking
+# Scanner progress tracking, shared across worker processes through the ScanState row
 from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional, Dict, Any, List
+import heapq
+import json
+import logging
+import os
 import threading
+import time
+import uuid
+from sqlalchemy import insert, update, select, or_
+from database import engine
+from models import ScanState
+
+# Scanner phases, in the order they run for a file / directory
+SCAN_PHASES = ("walk", "stat", "parse", "lyrics", "album", "art", "commit", "cleanup", "finalize")
+SLOWEST_FILES = 10
+
+# A lease not renewed for this long is free again (its worker died mid-scan)
+LEASE_SECONDS = 15
+# How often the scanning process publishes progress, renews the lease and checks for a stop request
+HEARTBEAT_INTERVAL = 0.5
+
+logger = logging.getLogger("tremors.scanner")
 
 @dataclass
 class ErrorDetail:
@@ -11,8 +31,56 @@ class ErrorDetail:
     error_message: str
     timestamp: str
 
+class ScanProfile:
+    """
+    Wall time and call counts per scanner phase plus the slowest files.
+    Written only by the scan thread (no locking); keys are fixed up front
+    so readers can copy it at any time.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(SCAN_PHASES, 0.0)
+        self.calls: Dict[str, int] = dict.fromkeys(SCAN_PHASES, 0)
+        self.counters: Dict[str, int] = dict.fromkeys(
+            ("files_skipped", "albums_created"), 0
+        )
+        # Min-heap of (seconds, path): the root is the fastest of the slowest
+        self._slowest: List[tuple] = []
+
+    def add(self, phase: str, seconds: float):
+        self.seconds[phase] += seconds
+        self.calls[phase] += 1
+
+    def count(self, counter: str, n: int = 1):
+        self.counters[counter] += n
+
+    def file_done(self, path: str, seconds: float):
+        if len(self._slowest) < SLOWEST_FILES:
+            heapq.heappush(self._slowest, (seconds, path))
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (seconds, path))
+
+    def to_dict(self):
+        return {
+            "phases": {
+                name: {"seconds": round(self.seconds[name], 4), "calls": self.calls[name]}
+                for name in SCAN_PHASES
+            },
+            "counters": dict(self.counters),
+            "slowest_files": [
+                {"file_path": path, "seconds": round(seconds, 4)}
+                for seconds, path in sorted(list(self._slowest), reverse=True)
+            ],
+        }
+
 @dataclass
 class ScanProgress:
+    """
+    Progress of the scan running in this process, plus the state every worker
+    shares: the single-scanner lease, stop requests, live status and the last
+    result live in the ScanState row, kept current by a heartbeat thread.
+    """
+    # True while this process's scan should keep going (cleared by a stop request)
     is_scanning: bool = False
     files_processed: int = 0
     songs_added: int = 0
@@ -22,11 +90,66 @@ class ScanProgress:
     
     # Track error details
     error_details: List[ErrorDetail] = field(default_factory=list)
-    
-    # Persistent last scan result
-    last_scan_result: Optional[Dict[str, Any]] = None
+
+    # Phase timings for the running scan, and the thread running it (for sampling)
+    profile: ScanProfile = field(default_factory=ScanProfile)
+    thread_id: Optional[int] = None
+
+    # Lease token while this process holds the scanner lease
+    owner: Optional[str] = None
+    _heartbeat_stop: Optional[threading.Event] = field(default=None, repr=False)
     
     _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def acquire(self) -> bool:
+        """
+        Claim the scanner lease for this process; False if a scan is running in
+        any worker. Nothing renews it until the scan calls start(), so a scan
+        that never begins frees the lease after LEASE_SECONDS.
+        """
+        owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        now = time.time()
+        with engine.begin() as conn:
+            conn.execute(insert(ScanState).prefix_with("OR IGNORE").values(id=1, cancel_requested=False))
+            claimed = conn.execute(
+                update(ScanState)
+                .where(ScanState.id == 1, or_(ScanState.owner.is_(None), ScanState.lease_expires < now))
+                .values(owner=owner, lease_expires=now + LEASE_SECONDS, cancel_requested=False, progress=None)
+            ).rowcount
+        if not claimed:
+            return False
+
+        self.reset()
+        with self._lock:
+            self.owner = owner
+        return True
+
+    def start(self) -> bool:
+        """
+        Called by the scan as it begins: renew the lease and keep renewing it
+        from a heartbeat thread. False if the lease lapsed and was taken over.
+        """
+        with self._lock:
+            owner = self.owner
+            if owner is None or self._heartbeat_stop is not None:
+                # Not claimed, or already started
+                return False
+        with engine.begin() as conn:
+            held = conn.execute(
+                update(ScanState)
+                .where(ScanState.id == 1, ScanState.owner == owner)
+                .values(lease_expires=time.time() + LEASE_SECONDS)
+            ).rowcount
+        stop = threading.Event()
+        with self._lock:
+            if not held or self.owner != owner:
+                if self.owner == owner:
+                    self.owner = None
+                    self.is_scanning = False
+                return False
+            self._heartbeat_stop = stop
+        threading.Thread(target=self._heartbeat, args=(owner, stop), name="scan-heartbeat", daemon=True).start()
+        return True
     
     def reset(self):
         with self._lock:
@@ -37,6 +160,7 @@ class ScanProgress:
             self.current_file = ""
             self.start_time = datetime.now().timestamp()
             self.error_details = []
+            self.profile = ScanProfile()
     
     def update(self, files: int = 0, songs: int = 0, errors: int = 0, current: str = "", error_file: str = "", error_msg: str = ""):
         with self._lock:
@@ -53,50 +177,121 @@ class ScanProgress:
                         error_message=error_msg,
                         timestamp=datetime.now().isoformat()
                     ))
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # Caller holds self._lock
+        return {
+            "files_processed": self.files_processed,
+            "songs_added": self.songs_added,
+            "errors": self.errors,
+            "current_file": self.current_file,
+            "start_time": self.start_time,
+            "error_details": [
+                {
+                    "file_path": e.file_path,
+                    "error_message": e.error_message,
+                    "timestamp": e.timestamp
+                }
+                for e in self.error_details
+            ],
+            **self.profile.to_dict()
+        }
+
+    def _heartbeat(self, owner: str, stop: threading.Event):
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            with self._lock:
+                snapshot = json.dumps(self._snapshot())
+            try:
+                with engine.begin() as conn:
+                    held = conn.execute(
+                        update(ScanState)
+                        .where(ScanState.id == 1, ScanState.owner == owner)
+                        .values(lease_expires=time.time() + LEASE_SECONDS, progress=snapshot)
+                    ).rowcount
+                    cancel = conn.execute(select(ScanState.cancel_requested).where(ScanState.id == 1)).scalar()
+            except Exception as e:
+                # Usually a busy database; the lease outlives several missed beats
+                logger.warning(f"Scan heartbeat failed: {e}")
+                continue
+            if not held or cancel:
+                # Stopped from some worker, or the lease lapsed and was taken over.
+                # A late beat of a finished scan must not stop the next one.
+                with self._lock:
+                    if self.owner == owner:
+                        self.is_scanning = False
+
+    def request_stop(self) -> bool:
+        """Ask the running scan, in whichever worker, to stop; False if none is running."""
+        with engine.begin() as conn:
+            owner = conn.execute(
+                select(ScanState.owner)
+                .where(ScanState.id == 1, ScanState.owner.is_not(None), ScanState.lease_expires >= time.time())
+            ).scalar()
+            if owner is not None:
+                conn.execute(
+                    update(ScanState).where(ScanState.id == 1, ScanState.owner == owner).values(cancel_requested=True)
+                )
+        if owner is None:
+            return False
+        with self._lock:
+            if self.owner == owner:
+                # Our own scan stops at the next file rather than the next heartbeat
+                self.is_scanning = False
+        return True
     
     def finish(self):
+        """Record the result and release the lease (the scan calls this when it ends)."""
         with self._lock:
-            # Save result before finishing
-            if self.start_time:
-                duration = datetime.now().timestamp() - self.start_time
-                self.last_scan_result = {
-                    "files_processed": self.files_processed,
-                    "songs_added": self.songs_added,
-                    "errors": self.errors,
-                    "duration": duration,
-                    "completed_at": datetime.now().isoformat(),
-                    "error_details": [
-                        {
-                            "file_path": e.file_path,
-                            "error_message": e.error_message,
-                            "timestamp": e.timestamp
-                        }
-                        for e in self.error_details
-                    ]
-                }
-            
+            owner, self.owner = self.owner, None
+            stop, self._heartbeat_stop = self._heartbeat_stop, None
+            last_scan_result = {
+                "files_processed": self.files_processed,
+                "songs_added": self.songs_added,
+                "errors": self.errors,
+                "duration": datetime.now().timestamp() - (self.start_time or datetime.now().timestamp()),
+                "completed_at": datetime.now().isoformat(),
+                "cancelled": not self.is_scanning,
+                "error_details": self._snapshot()["error_details"],
+                **self.profile.to_dict()
+            }
             self.is_scanning = False
             self.current_file = ""
+            self.thread_id = None
+        if stop is not None:
+            stop.set()
+        if owner is None:
+            return
+        with engine.begin() as conn:
+            conn.execute(
+                update(ScanState)
+                .where(ScanState.id == 1, ScanState.owner == owner)
+                .values(owner=None, lease_expires=None, cancel_requested=False, progress=None,
+                        last_scan_result=json.dumps(last_scan_result))
+            )
     
     def to_dict(self):
+        """Status as any worker sees it (this process's own scan is reported live)."""
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(ScanState.owner, ScanState.lease_expires, ScanState.cancel_requested,
+                       ScanState.progress, ScanState.last_scan_result)
+                .where(ScanState.id == 1)
+            ).first()
+        running = row is not None and row.owner is not None and (row.lease_expires or 0) >= time.time()
         with self._lock:
-            return {
-                "is_scanning": self.is_scanning,
-                "files_processed": self.files_processed,
-                "songs_added": self.songs_added,
-                "errors": self.errors,
-                "current_file": self.current_file,
-                "start_time": self.start_time,
-                "error_details": [
-                    {
-                        "file_path": e.file_path,
-                        "error_message": e.error_message,
-                        "timestamp": e.timestamp
-                    }
-                    for e in self.error_details
-                ],
-                "last_scan_result": self.last_scan_result
-            }
+            if running and row.owner == self.owner:
+                progress = self._snapshot()
+            elif running and row.progress:
+                progress = json.loads(row.progress)
+            else:
+                progress = ScanProgress()._snapshot()
+        return {
+            "is_scanning": running,
+            **progress,
+            "cancel_requested": running and bool(row.cancel_requested),
+            "worker": row.owner if running else None,
+            "last_scan_result": json.loads(row.last_scan_result) if row is not None and row.last_scan_result else None
+        }
 
-# Global scanner state
+# Per-process handle on the shared scanner state
 scanner_progress = ScanProgress()
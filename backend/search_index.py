@@ -0,0 +1,130 @@
+# In-memory prefix index for search-as-you-type suggestions
+import bisect
+import re
+import threading
+from typing import List, Tuple, Optional, Dict, Any
+from sqlmodel import Session, select
+from database import engine
+from models import Song, Album
+
+# Hard cap on indexed keys; word-start keys are dropped first when exceeded
+MAX_ENTRIES = 500_000
+# Only index the first few words of a label (keeps memory bounded for long titles)
+MAX_WORD_KEYS = 4
+# Entries inspected per query before ranking (bounds worst-case latency)
+SCAN_LIMIT = 400
+
+KIND_ORDER = {"song": 0, "artist": 1, "album": 2, "genre": 3}
+
+# (kind, label, ref_id, word_position)
+Entry = Tuple[str, str, Optional[int], int]
+
+
+def _word_starts(folded: str) -> List[int]:
+    """Offsets of each word after the first, e.g. 'the dark side' -> [4, 9]."""
+    return [m.start() for m in re.finditer(r'(?<=[\s\-/(&])\w', folded)][:MAX_WORD_KEYS - 1]
+
+
+class SuggestionIndex:
+    """
+    Sorted array of casefolded keys with a parallel entries list.
+    Lookups are a bisect plus a short forward scan; rebuilds swap both lists atomically.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._keys: List[str] = []
+        self._entries: List[Entry] = []
+        self._lock = threading.Lock()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._keys)
+
+    def clear(self):
+        with self._lock:
+            self._keys = []
+            self._entries = []
+
+    def rebuild(self):
+        """Rebuild the whole index from the database."""
+        with Session(engine) as session:
+            songs = session.exec(select(Song.id, Song.title, Song.artist, Song.genre)).all()
+            albums = session.exec(select(Album.id, Album.title, Album.artist)).all()
+
+        labels: List[Tuple[str, str, Optional[int]]] = []
+        artists = set()
+        genres = set()
+        for song_id, title, artist, genre in songs:
+            if title:
+                labels.append(("song", title, song_id))
+            if artist:
+                artists.add(artist)
+            if genre:
+                genres.update(g.strip() for g in re.split(r'[,;]', genre) if g.strip())
+        for album_id, title, artist in albums:
+            if title:
+                labels.append(("album", title, album_id))
+            if artist:
+                artists.add(artist)
+        labels.extend(("artist", name, None) for name in artists)
+        labels.extend(("genre", name, None) for name in genres)
+
+        # Full-label keys first so they survive the cap
+        pairs: List[Tuple[str, Entry]] = []
+        for kind, label, ref in labels:
+            pairs.append((label.casefold(), (kind, label, ref, 0)))
+        for kind, label, ref in labels:
+            if len(pairs) >= self.max_entries:
+                break
+            folded = label.casefold()
+            for pos in _word_starts(folded):
+                pairs.append((folded[pos:], (kind, label, ref, pos)))
+        del pairs[self.max_entries:]
+
+        pairs.sort(key=lambda p: p[0])
+        keys = [k for k, _ in pairs]
+        entries = [e for _, e in pairs]
+        with self._lock:
+            self._keys = keys
+            self._entries = entries
+            self.ready = True
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top-k completions for `prefix`, full-label matches ranked above word matches."""
+        folded = prefix.strip().casefold()
+        if not folded:
+            return []
+
+        with self._lock:
+            keys, entries = self._keys, self._entries
+
+        candidates = []
+        i = bisect.bisect_left(keys, folded)
+        end = min(len(keys), i + SCAN_LIMIT)
+        while i < end and keys[i].startswith(folded):
+            candidates.append(entries[i])
+            i += 1
+
+        candidates.sort(key=lambda e: (
+            e[3] != 0,
+            e[1].casefold() != folded,
+            KIND_ORDER.get(e[0], 9),
+            len(e[1])
+        ))
+
+        seen = set()
+        results = []
+        for kind, label, ref, _ in candidates:
+            key = (kind, label.casefold()) if ref is None else (kind, ref)
+            if key in seen:
+                continue
+            seen.add(key)
+            results.append({"type": kind, "text": label, "id": ref})
+            if len(results) >= limit:
+                break
+        return results
+
+
+# Global suggestion index
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,220 @@
+# Smart playlist rules: field/operator/value trees compiled to one SQL query
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, not_, func
+from models import Song
+
+# Rule field -> (Song column, kind). Kinds decide which operators apply.
+FIELDS = {
+    "title": (Song.title, "text"),
+    "artist": (Song.artist, "text"),
+    "genre": (Song.genre, "text"),
+    "composer": (Song.composer, "text"),
+    "mood": (Song.mood, "text"),
+    "language": (Song.language, "text"),
+    "initial_key": (Song.initial_key, "text"),
+    "format": (Song.format, "text"),
+    "codec": (Song.codec, "text"),
+    "media_type": (Song.media_type, "text"),
+    "path": (Song.path, "text"),
+    "year": (Song.year, "number"),
+    "bpm": (Song.bpm, "number"),
+    "rating": (Song.rating, "number"),
+    "play_count": (Song.play_count, "number"),
+    "duration": (Song.duration, "number"),
+    "bitrate": (Song.bitrate, "number"),
+    "sample_rate": (Song.sample_rate, "number"),
+    "bits_per_sample": (Song.bits_per_sample, "number"),
+    "channels": (Song.channels, "number"),
+    "track_number": (Song.track_number, "number"),
+    "disc_number": (Song.disc_number, "number"),
+    "file_size": (Song.file_size, "number"),
+    "album_id": (Song.album_id, "number"),
+    "last_played": (Song.last_played, "date"),
+    "date_added": (Song.date_added, "date"),
+    "has_lyrics": (Song.has_lyrics, "bool"),
+    "compilation": (Song.compilation, "bool"),
+}
+
+OPERATORS = {
+    "text": ("is", "is_not", "contains", "not_contains", "starts_with", "ends_with", "empty", "not_empty"),
+    "number": ("eq", "ne", "gt", "gte", "lt", "lte", "between", "empty", "not_empty"),
+    "date": ("in_last", "not_in_last", "before", "after", "empty", "not_empty"),
+    "bool": ("is",),
+}
+
+# Columns the write-behind buffer updates; rules using them need a flush first
+BUFFERED_FIELDS = {"rating", "play_count", "last_played"}
+
+# Operators whose result depends on the current time
+RELATIVE_DATE_OPS = {"in_last", "not_in_last"}
+
+MAX_DEPTH = 8
+MAX_LIMIT = 100000
+
+
+class RuleError(ValueError):
+    """Invalid rule tree (unknown field, operator or value)."""
+
+
+class RuleNode(BaseModel):
+    """Either a condition (field/op/value) or a group (match + rules)."""
+    field: Optional[str] = None
+    op: Optional[str] = None
+    value: Any = None
+    match: Optional[str] = None  # "all" | "any" | "none"
+    rules: Optional[List["RuleNode"]] = None
+
+
+class SmartRules(BaseModel):
+    match: str = "all"
+    rules: List[RuleNode] = []
+    sort_by: str = "title"  # any field, or "random"
+    order: str = "asc"
+    limit: Optional[int] = None
+
+
+RuleNode.model_rebuild()
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError(f"Expected a number, got {value!r}")
+    return value
+
+
+def _text(value):
+    if not isinstance(value, str):
+        raise RuleError(f"Expected a string, got {value!r}")
+    return value
+
+
+def _days_ago(value) -> str:
+    return (datetime.now() - timedelta(days=_number(value))).isoformat()
+
+
+def _condition(node: RuleNode):
+    if node.field not in FIELDS:
+        raise RuleError(f"Unknown field: {node.field!r}")
+    col, kind = FIELDS[node.field]
+    op, value = node.op, node.value
+    if op not in OPERATORS[kind]:
+        raise RuleError(f"Operator {op!r} does not apply to {kind} field {node.field!r}")
+
+    if op == "empty":
+        return or_(col.is_(None), col == "") if kind == "text" else col.is_(None)
+    if op == "not_empty":
+        return and_(col.is_not(None), col != "") if kind == "text" else col.is_not(None)
+
+    if kind == "text":
+        # LIKE is case-insensitive for ASCII in SQLite; equality is folded explicitly
+        if op == "is":
+            return func.lower(col) == _text(value).lower()
+        if op == "is_not":
+            return or_(col.is_(None), func.lower(col) != _text(value).lower())
+        if op == "contains":
+            return col.contains(_text(value), autoescape=True)
+        if op == "not_contains":
+            return or_(col.is_(None), not_(col.contains(_text(value), autoescape=True)))
+        if op == "starts_with":
+            return col.startswith(_text(value), autoescape=True)
+        return col.endswith(_text(value), autoescape=True)
+
+    if kind == "number":
+        if op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise RuleError("'between' expects [low, high]")
+            return col.between(_number(value[0]), _number(value[1]))
+        value = _number(value)
+        return {
+            "eq": col == value, "ne": col != value,
+            "gt": col > value, "gte": col >= value,
+            "lt": col < value, "lte": col <= value,
+        }[op]
+
+    if kind == "date":
+        # ISO timestamps compare correctly as strings
+        if op == "in_last":
+            return col >= _days_ago(value)
+        if op == "not_in_last":
+            return or_(col.is_(None), col < _days_ago(value))
+        if op == "before":
+            return col < _text(value)
+        return col > _text(value)
+
+    if not isinstance(value, bool):
+        raise RuleError(f"Expected true/false for {node.field!r}")
+    return col.is_(value)
+
+
+def _group(match: str, rules: List[RuleNode], depth: int):
+    if depth > MAX_DEPTH:
+        raise RuleError("Rules are nested too deeply")
+    clauses = [_node(rule, depth + 1) for rule in rules]
+    if not clauses:
+        return None
+    if match == "all":
+        return and_(*clauses)
+    if match == "any":
+        return or_(*clauses)
+    if match == "none":
+        return not_(or_(*clauses))
+    raise RuleError(f"Unknown match mode: {match!r}")
+
+
+def _node(node: RuleNode, depth: int):
+    if node.rules is not None:
+        clause = _group(node.match or "all", node.rules, depth)
+        if clause is None:
+            raise RuleError("Empty rule group")
+        return clause
+    return _condition(node)
+
+
+def compile_rules(rules: SmartRules, seed: int = 0):
+    """
+    Compile a rule set into (where clause or None, ORDER BY list, limit).
+    `seed` drives "random" order deterministically, so pages stay consistent
+    until the seed (the library revision) changes.
+    """
+    where = _group(rules.match, rules.rules, 0)
+
+    if rules.sort_by == "random":
+        # Multiplicative hash of the id: a stable shuffle per seed
+        sort_col = (Song.id * 2654435761 + seed * 40503) % 4294967291
+    elif rules.sort_by in FIELDS:
+        sort_col = FIELDS[rules.sort_by][0]
+        if FIELDS[rules.sort_by][1] == "text":
+            sort_col = func.lower(sort_col)
+    else:
+        raise RuleError(f"Unknown sort field: {rules.sort_by!r}")
+    if rules.order not in ("asc", "desc"):
+        raise RuleError(f"Unknown order: {rules.order!r}")
+    order_by = [sort_col.desc() if rules.order == "desc" else sort_col.asc(), Song.id.asc()]
+
+    limit = rules.limit
+    if limit is not None and not 0 < limit <= MAX_LIMIT:
+        raise RuleError(f"limit must be between 1 and {MAX_LIMIT}")
+    return where, order_by, limit
+
+
+def _conditions(rules: SmartRules):
+    stack = list(rules.rules)
+    while stack:
+        node = stack.pop()
+        if node.field is not None:
+            yield node
+        stack.extend(node.rules or [])
+
+
+def uses_buffered_fields(rules: SmartRules) -> bool:
+    """True if results depend on play counts/ratings that may still be buffered."""
+    if rules.sort_by in BUFFERED_FIELDS:
+        return True
+    return any(node.field in BUFFERED_FIELDS for node in _conditions(rules))
+
+
+def uses_relative_dates(rules: SmartRules) -> bool:
+    """True if results change with time alone (in_last / not_in_last conditions)."""
+    return any(node.op in RELATIVE_DATE_OPS for node in _conditions(rules))
@@ -0,0 +1,165 @@
+# Per-song stream metadata cache (path, size, mtime, MIME type, validators)
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import formatdate
+from typing import Dict, Iterable, Optional
+from sqlmodel import Session, select
+from database import engine
+from models import Song
+
+# Entries are re-validated against the file after this many seconds
+STREAM_CACHE_TTL = 60.0
+STREAM_CACHE_SIZE = 2048
+
+# Read-ahead for upcoming queue entries: how many tracks, and how much of each
+PREFETCH_MAX_SONGS = 5
+PREFETCH_BYTES = 4 * 1024 * 1024
+PREFETCH_CHUNK = 256 * 1024
+# Don't warm the same file again within this window
+PREFETCH_COOLDOWN = 300.0
+
+# One thread: prefetch is best-effort and must not compete with playback I/O
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+
+@dataclass
+class StreamInfo:
+    path: str
+    size: int
+    mtime: float
+    mime: str
+    etag: str
+    stat_result: os.stat_result
+    headers: Dict[str, str]
+    expires: float
+
+
+class StreamInfoCache:
+    """
+    LRU of song id -> StreamInfo so seeks and range requests are answered
+    without a DB query, stat or MIME lookup. Scans clear it; the TTL bounds how
+    long an edit made outside a scan can go unnoticed.
+    """
+
+    def __init__(self, max_entries: int = STREAM_CACHE_SIZE, ttl: float = STREAM_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items: "OrderedDict[int, StreamInfo]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, song_id: int) -> Optional[StreamInfo]:
+        """Fresh cached entry, or None (never touches the DB or disk)."""
+        with self._lock:
+            info = self._items.get(song_id)
+            if info is None:
+                return None
+            if info.expires < time.monotonic():
+                del self._items[song_id]
+                return None
+            self._items.move_to_end(song_id)
+            return info
+
+    def load(self, song_id: int) -> Optional[StreamInfo]:
+        """Look the song up and stat its file. None if either is missing."""
+        with Session(engine) as session:
+            path = session.exec(select(Song.path).where(Song.id == song_id)).first()
+        if not path:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        # Guess MIME type (audio/mpeg, audio/flac, etc.)
+        mime, _ = mimetypes.guess_type(path)
+        etag = f'"{song_id:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+        info = StreamInfo(
+            path=path,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            mime=mime or "audio/mpeg",
+            etag=etag,
+            stat_result=st,
+            headers={
+                "Accept-Ranges": "bytes",
+                "ETag": etag,
+                "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+            },
+            expires=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            self._items[song_id] = info
+            self._items.move_to_end(song_id)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return info
+
+    def invalidate(self, song_id: int):
+        with self._lock:
+            self._items.pop(song_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# Global stream metadata cache
+stream_cache = StreamInfoCache()
+
+# (path, mtime) -> monotonic time it was last warmed
+_warmed: Dict[tuple, float] = {}
+_warmed_lock = threading.Lock()
+
+
+def _warm_head(path: str, size: int):
+    """Pull the start of a file into the OS page cache."""
+    length = min(size, PREFETCH_BYTES)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            # Asynchronous kernel read-ahead; returns immediately
+            os.posix_fadvise(f.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+            return
+        # Windows/macOS: read and discard, the OS keeps the pages cached
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(PREFETCH_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+
+def _prefetch(song_ids):
+    for song_id in song_ids:
+        # Also warms the metadata cache, so the first range request is a hit
+        info = stream_cache.get(song_id) or stream_cache.load(song_id)
+        if info is None:
+            continue
+        key = (info.path, info.mtime)
+        now = time.monotonic()
+        with _warmed_lock:
+            if now - _warmed.get(key, -PREFETCH_COOLDOWN) < PREFETCH_COOLDOWN:
+                continue
+            _warmed[key] = now
+            if len(_warmed) > STREAM_CACHE_SIZE:
+                for stale in [k for k, t in _warmed.items() if now - t >= PREFETCH_COOLDOWN]:
+                    del _warmed[stale]
+        try:
+            _warm_head(info.path, info.size)
+        except OSError:
+            stream_cache.invalidate(song_id)
+
+
+def prefetch(song_ids: Iterable[int]) -> int:
+    """
+    Queue read-ahead for the next tracks in the play queue (in play order).
+    Returns the number of songs queued; the work happens in the background.
+    """
+    ids = list(dict.fromkeys(song_ids))[:PREFETCH_MAX_SONGS]
+    if ids:
+        _prefetch_executor.submit(_prefetch, ids)
+    return len(ids)
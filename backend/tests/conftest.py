@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a scratch data directory before anything imports `database`
+os.environ["TREMORS_DATA_DIR"] = tempfile.mkdtemp(prefix="tremors-test-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+from database import engine  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """App client on an empty library (tables are recreated for every test)."""
+    SQLModel.metadata.drop_all(engine)
+    from main import app
+    with TestClient(app) as c:
+        yield c
@@ -0,0 +1,17 @@
+from sqlmodel import Session
+from database import engine
+from models import Song
+
+
+def test_hard_reset_is_reported_to_clients_past_the_reset_revision(client):
+    with Session(engine) as session:
+        session.add_all([Song(title=f"Track {i}", artist="Band", path=f"/music/{i}.mp3") for i in range(5)])
+        session.commit()
+    since = client.get("/library/changes").json()["revision"]
+    assert since >= 5
+
+    client.delete("/library/reset", params={"hard": True})
+
+    changes = client.get("/library/changes", params={"since": since}).json()
+    assert changes["reset"] is True
+    assert changes["revision"] > since
@@ -0,0 +1,51 @@
+import os
+
+from PIL import Image
+from sqlmodel import Session
+
+from database import engine
+from models import Album
+from router import media
+
+
+def add_album(cover_path):
+    with Session(engine) as session:
+        album = Album(title="Kind of Blue", artist="Miles Davis", cover_path=str(cover_path))
+        session.add(album)
+        session.commit()
+        return album.id
+
+
+def test_undecodable_art_is_served_as_found(client, tmp_path):
+    cover = tmp_path / "cover.jpg"
+    cover.write_bytes(b"not really a jpeg")
+    album_id = add_album(cover)
+
+    response = client.get(f"/covers/{album_id}")
+    assert response.status_code == 200
+    assert response.content == b"not really a jpeg"
+
+
+def test_rendition_evicted_while_being_served(client, tmp_path, monkeypatch):
+    cover = tmp_path / "cover.jpg"
+    Image.new("RGB", (800, 800), (0, 90, 200)).save(cover)
+    album_id = add_album(cover)
+    # Above the hot cache's thumbnail size, so every request goes to disk
+    params = {"size": "600", "format": "jpeg"}
+    rendered = client.get(f"/covers/{album_id}", params=params).content
+
+    def open_then_evict(path):
+        f = open(path, "rb")
+        os.remove(path)
+        return f
+
+    monkeypatch.setattr(media, "_open_rendition", open_then_evict)
+    response = client.get(f"/covers/{album_id}", params=params)
+    assert response.status_code == 200
+    assert response.content == rendered
+
+    # Gone from disk now: rendered again instead of failing
+    monkeypatch.undo()
+    response = client.get(f"/covers/{album_id}", params=params)
+    assert response.status_code == 200
+    assert response.content == rendered
@@ -0,0 +1,61 @@
+import os
+
+import pytest
+from mutagen.id3 import ID3, TALB, TIT2, TPE1
+from PIL import Image
+from sqlmodel import Session, select
+
+import scanner
+from database import engine
+from models import Album, AlbumArt
+from scanner_progress import scanner_progress
+
+
+def make_mp3(path, title, album):
+    with open(path, "wb") as f:
+        f.write((b"\xff\xfb\x90\x64" + b"\x00" * 413) * 40)
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text="Band"))
+    tags.add(TALB(encoding=3, text=album))
+    tags.save(path)
+
+
+def scan(root):
+    assert scanner_progress.acquire()
+    scanner.run_scan([root])
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    calls = []
+    original = scanner.has_embedded_art
+
+    def spy(path, *args):
+        calls.append(path)
+        return original(path, *args)
+
+    monkeypatch.setattr(scanner, "has_embedded_art", spy)
+    return calls
+
+
+def test_album_split_across_folders_keeps_its_cover_on_rescan(client, tmp_path, probes):
+    for disc in ("CD1", "CD2"):
+        os.makedirs(tmp_path / disc)
+        Image.new("RGB", (64, 64), (200, 0, 0)).save(tmp_path / disc / "cover.jpg")
+        for i in range(2):
+            make_mp3(str(tmp_path / disc / f"{i}.mp3"), f"{disc} {i}", "Double")
+
+    scan(str(tmp_path))
+    with Session(engine) as session:
+        album = session.exec(select(Album)).one()
+    cover_path = album.cover_path
+    assert os.path.dirname(cover_path) in (str(tmp_path / "CD1"), str(tmp_path / "CD2"))
+    # A sidecar covers the album, so no song was opened again for embedded art
+    assert probes == []
+    assert client.get(f"/covers/{album.id}").status_code == 200
+
+    scan(str(tmp_path))
+    with Session(engine) as session:
+        assert session.exec(select(Album)).one().cover_path == cover_path
+        assert session.exec(select(AlbumArt).where(AlbumArt.album_id == album.id)).first() is not None
@@ -0,0 +1,54 @@
+import threading
+
+from sqlmodel import Session, select
+
+from database import engine
+from models import Song
+from user_data_buffer import user_data_buffer
+
+
+def add_song(**fields):
+    with Session(engine) as session:
+        song = Song(title="Blue Train", artist="Coltrane", path="/music/blue.mp3", **fields)
+        session.add(song)
+        session.commit()
+        return song.id
+
+
+def stored_play_count(song_id):
+    with Session(engine) as session:
+        return session.exec(select(Song.play_count).where(Song.id == song_id)).one()
+
+
+def test_unflushed_plays_show_in_search_genre_and_recent(client):
+    song_id = add_song(genre="Jazz")
+    client.post(f"/library/songs/{song_id}/play")
+    client.post(f"/library/songs/{song_id}/favorite")
+    assert stored_play_count(song_id) == 0
+
+    for songs in (
+        client.get("/library/search", params={"q": "blue"}).json()["songs"],
+        client.get("/library/genres/songs", params={"name": "Jazz"}).json(),
+        client.get("/library/smart-playlists/recently-added").json(),
+    ):
+        assert [(s["id"], s["play_count"], s["rating"]) for s in songs] == [(song_id, 1, 5)]
+
+
+def test_flush_waits_for_reads_in_progress(client):
+    song_id = add_song()
+    user_data_buffer.record_play(song_id, 0)
+
+    with user_data_buffer.reading():
+        with Session(engine) as session:
+            song = session.get(Song, song_id)
+            session.expunge(song)
+        flusher = threading.Thread(target=user_data_buffer.flush)
+        flusher.start()
+        flusher.join(timeout=0.5)
+        # Not committed while this read is in progress, so the delta still applies
+        assert flusher.is_alive()
+        assert user_data_buffer.overlay([song])[0].play_count == 1
+
+    flusher.join()
+    assert stored_play_count(song_id) == 1
+    assert client.get(f"/library/songs/{song_id}").json()["play_count"] == 1
@@ -0,0 +1,207 @@
+# Write-behind buffer for play counts, last_played and favorite toggles
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import update, bindparam
+from sqlmodel import Session
+from database import engine
+from models import Song
+from changelog import record_changes
+
+# Seconds between background flushes
+FLUSH_INTERVAL = 5.0
+
+
+class UserDataBuffer:
+    """
+    Accumulates play and rating events in memory and writes them in one
+    transaction per interval (and at shutdown) instead of a commit per event.
+    Pending values stay visible to readers through `overlay` until committed;
+    reads that overlay rows hold `reading()` so a flush never commits between
+    a row being read and its overlay.
+
+    The buffer is per process: with several workers, each holds its own
+    unflushed events, and other workers see them only once flushed (within
+    FLUSH_INTERVAL). Every worker flushes on shutdown; a worker killed
+    outright loses at most one interval of events.
+    """
+
+    def __init__(self, interval: float = FLUSH_INTERVAL):
+        self.interval = interval
+        # song_id -> (play delta, last_played)
+        self._plays: Dict[int, Tuple[int, str]] = {}
+        # song_id -> rating
+        self._ratings: Dict[int, int] = {}
+        # Snapshot being written by flush(); still overlaid until commit
+        self._inflight_plays: Dict[int, Tuple[int, str]] = {}
+        self._inflight_ratings: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Readers inside reading(); a flush commits only when there are none
+        self._gate = threading.Condition()
+        self._readers = 0
+        self._committing = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._exit_hook = False
+
+    # --- EVENTS ---
+    def record_play(self, song_id: int, stored_count: int) -> int:
+        """Queue one play; returns the play count readers will now see."""
+        now = datetime.now().isoformat()
+        with self._lock:
+            delta, _ = self._plays.get(song_id, (0, now))
+            self._plays[song_id] = (delta + 1, now)
+            return (stored_count or 0) + self._pending_plays(song_id)
+
+    def set_rating(self, song_id: int, rating: int):
+        with self._lock:
+            self._ratings[song_id] = rating
+
+    def rating(self, song_id: int, stored_rating: Optional[int]) -> Optional[int]:
+        """Latest rating for a song, pending toggles included."""
+        with self._lock:
+            if song_id in self._ratings:
+                return self._ratings[song_id]
+            return self._inflight_ratings.get(song_id, stored_rating)
+
+    def _pending_plays(self, song_id: int) -> int:
+        return self._plays.get(song_id, (0, None))[0] + self._inflight_plays.get(song_id, (0, None))[0]
+
+    # --- READS ---
+    @contextmanager
+    def reading(self):
+        """
+        Hold around a read of play/rating columns and the overlay of its rows
+        (or record_play/rating calls based on it). Without it, a row read just
+        before a flush commits could be overlaid after the in-flight deltas
+        were dropped. Reads only: a write here would wait on the flush.
+        """
+        with self._gate:
+            while self._committing:
+                self._gate.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._readers -= 1
+                if not self._readers:
+                    self._gate.notify_all()
+
+    def overlay(self, items):
+        """
+        Patch play_count / last_played / rating on songs (dicts or detached
+        objects) with values not yet flushed. Returns `items` for chaining.
+        """
+        with self._lock:
+            if not (self._plays or self._ratings or self._inflight_plays or self._inflight_ratings):
+                return items
+            for item in items:
+                is_dict = isinstance(item, dict)
+                song_id = item["id"] if is_dict else item.id
+                delta = self._pending_plays(song_id)
+                played = (self._plays.get(song_id) or self._inflight_plays.get(song_id) or (0, None))[1]
+                rating = self._ratings.get(song_id, self._inflight_ratings.get(song_id))
+                if is_dict:
+                    if delta:
+                        item["play_count"] = (item.get("play_count") or 0) + delta
+                        if "last_played" in item:
+                            item["last_played"] = played
+                    if rating is not None and "rating" in item:
+                        item["rating"] = rating
+                else:
+                    if delta:
+                        item.play_count = (item.play_count or 0) + delta
+                        item.last_played = played
+                    if rating is not None:
+                        item.rating = rating
+        return items
+
+    # --- PERSISTENCE ---
+    def flush(self):
+        """Write all pending events in a single transaction."""
+        with self._flush_lock:
+            with self._lock:
+                if not (self._plays or self._ratings):
+                    return
+                self._inflight_plays, self._plays = self._plays, {}
+                self._inflight_ratings, self._ratings = self._ratings, {}
+            try:
+                with Session(engine) as session:
+                    conn = session.connection()
+                    if self._inflight_plays:
+                        conn.execute(
+                            update(Song.__table__)
+                            .where(Song.__table__.c.id == bindparam("song_id"))
+                            .values(
+                                play_count=Song.__table__.c.play_count + bindparam("delta"),
+                                last_played=bindparam("played")
+                            ),
+                            [{"song_id": i, "delta": d, "played": p} for i, (d, p) in self._inflight_plays.items()]
+                        )
+                    if self._inflight_ratings:
+                        conn.execute(
+                            update(Song.__table__)
+                            .where(Song.__table__.c.id == bindparam("song_id"))
+                            .values(rating=bindparam("new_rating")),
+                            [{"song_id": i, "new_rating": r} for i, r in self._inflight_ratings.items()]
+                        )
+                    record_changes(session, "song", set(self._inflight_plays) | set(self._inflight_ratings), user_data=True)
+                    # Commit and drop the overlay in one step, with no read in
+                    # progress: every reader sees either the old rows plus the
+                    # in-flight deltas or the new rows without them
+                    with self._gate:
+                        self._committing = True
+                        while self._readers:
+                            self._gate.wait()
+                    try:
+                        with self._lock:
+                            session.commit()
+                            self._inflight_plays = {}
+                            self._inflight_ratings = {}
+                    finally:
+                        with self._gate:
+                            self._committing = False
+                            self._gate.notify_all()
+            except Exception as e:
+                logging.error(f"User data flush failed, will retry: {e}")
+                # Put the events back (newer events win for ratings, plays add up)
+                with self._lock:
+                    for song_id, (delta, played) in self._inflight_plays.items():
+                        newer, newer_played = self._plays.get(song_id, (0, played))
+                        self._plays[song_id] = (delta + newer, newer_played)
+                    for song_id, rating in self._inflight_ratings.items():
+                        self._ratings.setdefault(song_id, rating)
+                    self._inflight_plays = {}
+                    self._inflight_ratings = {}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="user-data-flush", daemon=True)
+        self._thread.start()
+        if not self._exit_hook:
+            # Workers that exit without running the lifespan shutdown still flush
+            atexit.register(self.flush)
+            self._exit_hook = True
+
+    def stop(self):
+        """Stop the background writer and flush whatever is left."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        self.flush()
+
+
+# Global write-behind buffer
+user_data_buffer = UserDataBuffer()
@@ -33,6 +33,7 @@ export function AddToPlaylistModal({ songIds, onClose }: Props) {
   const handleAdd = async (playlistId: number) => {
     try {
       await addToPlaylist(playlistId, songIds);
+      queryClient.invalidateQueries({ queryKey: ['playlists'] });
       addToast('Songs added to playlist'); // <--- Toast
       onClose();
     } catch {
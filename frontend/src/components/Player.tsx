@@ -1,6 +1,6 @@
 import { useEffect, useRef, useState } from 'react';
 import { usePlayerStore } from '../stores/playerStore';
-import { getStreamUrl, getCoverUrl, incrementPlayCount } from '../lib/api';
+import { getStreamUrl, getCoverUrl, incrementPlayCount, prefetchStreams } from '../lib/api';
 import { formatTime, cn } from '../lib/utils';
 import { Play, Pause, SkipBack, SkipForward, Volume2, VolumeX, Disc, ChevronUp, Shuffle, Repeat, Repeat1, ListMusic } from 'lucide-react';
 import { FullScreenPlayer } from './FullScreenPlayer';
@@ -11,7 +11,7 @@ import { ArtistLink } from './ContextMenu';
 export function Player() {
   const {
     currentSong, isPlaying, volume, togglePlay, playNext, playPrev,
-    setVolume, setIsPlaying, repeatMode, toggleRepeat, isShuffle, toggleShuffle
+    setVolume, setIsPlaying, repeatMode, toggleRepeat, isShuffle, toggleShuffle, queue
   } = usePlayerStore();
 
   const audioRef = useRef<HTMLAudioElement>(null);
@@ -38,6 +38,15 @@ export function Player() {
     }
   }, [currentSong]);
 
+  // Warm the next tracks in the queue so transitions start without a cold read
+  useEffect(() => {
+    if (!currentSong) return;
+    const idx = queue.findIndex(s => s.id === currentSong.id);
+    if (idx === -1) return;
+    const upcoming = queue.slice(idx + 1, idx + 3).map(s => s.id);
+    prefetchStreams(upcoming).catch(() => { });
+  }, [currentSong, queue]);
+
   // Sync Play/Pause
   useEffect(() => {
     if (audioRef.current) {
@@ -2,6 +2,7 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 import { useQueryClient } from '@tanstack/react-query';
 import { RefreshCw, StopCircle, CheckCircle, AlertCircle, Clock, ChevronDown, ChevronUp } from 'lucide-react';
+import axios from 'axios';
 import api from '../../lib/api';
 import { Card } from '../common/Card';
 import { Button } from '../common/Button';
@@ -138,6 +139,11 @@ export function ScannerControl() {
             await api.post('/library/scan');
             startPolling();
         } catch (e: unknown) {
+            if (axios.isAxiosError(e) && e.response?.status === 409) {
+                // Already running (possibly started from another window): follow it
+                startPolling();
+                return;
+            }
             console.error('Failed to start scan:', e);
             const errorMessage = e instanceof Error ? e.message : 'Failed to start scan';
             setError(errorMessage);
@@ -147,8 +153,8 @@ export function ScannerControl() {
 
     const handleStopScan = async () => {
         try {
-            stopPolling();
-            setIsScanning(false);
+            // Keep polling: the scan stops after its current file and reports the final result
+            await api.post('/library/scan/stop');
         } catch (e) {
             console.error('Failed to stop scan:', e);
         }
@@ -24,12 +24,48 @@ export const getSong = async (id: number) => {
   return response.data;
 };
 
+export interface BatchResult<T> {
+  items: T[];
+  missing: number[];
+}
+
+export const getSongsBatch = async (ids: number[], projection: 'list' | 'full' = 'list') => {
+  const response = await api.post<BatchResult<Song>>('/library/songs/batch', { ids }, { params: { projection } });
+  return response.data;
+};
+
 export const searchLibrary = async (query: string) => {
   if (!query) return [];
   const response = await api.get<Song[]>(`/library/search?q=${encodeURIComponent(query)}`);
   return response.data;
 };
 
+export interface Suggestion {
+  type: 'song' | 'album' | 'artist' | 'genre';
+  text: string;
+  id: number | null;
+}
+
+export const getSuggestions = async (query: string, limit = 10) => {
+  if (!query) return [];
+  const response = await api.get<Suggestion[]>('/library/suggest', { params: { q: query, limit } });
+  return Array.isArray(response.data) ? response.data : [];
+};
+
+export interface LibraryChanges {
+  revision: number;
+  reset: boolean;
+  has_more: boolean;
+  songs?: { upserted: Song[]; deleted: number[] };
+  albums?: { upserted: Album[]; deleted: number[] };
+}
+
+// Omit `since` to get the current revision (reset=true) before a full load
+export const getLibraryChanges = async (since?: number, limit = 5000) => {
+  const response = await api.get<LibraryChanges>('/library/changes', { params: { since, limit } });
+  return response.data;
+};
+
 // --- ALBUMS ---
 export const getAlbums = async (offset = 0, limit = 50) => {
   const response = await api.get<Album[]>(`/library/albums?offset=${offset}&limit=${limit}`);
@@ -41,19 +77,43 @@ export const getAlbum = async (id: number) => {
   return response.data;
 };
 
+export const getAlbumsBatch = async (ids: number[]) => {
+  const response = await api.post<BatchResult<Album>>('/library/albums/batch', { ids });
+  return response.data;
+};
+
 export const getAlbumSongs = async (id: number) => {
   const response = await api.get<Song[]>(`/library/albums/${id}/songs`);
   return Array.isArray(response.data) ? response.data : [];
 };
 
-export const getCoverUrl = (albumId: number, size: 'small' | 'full' = 'small') => {
-  return `${API_BASE}/covers/${albumId}?v=2&size=${size}`;
+// Passing the album's art_hash makes the URL immutable (cached without revalidation)
+export const getCoverUrl = (albumId: number, size: 'small' | 'full' = 'small', artHash?: string | null) => {
+  const hash = artHash ? `&h=${artHash}` : '';
+  return `${API_BASE}/covers/${albumId}?v=2&size=${size}${hash}`;
+};
+
+export interface CoverAtlasLayout {
+  tile: number;
+  columns: number;
+  tiles: Record<string, [number, number, number, number]>; // album_id -> [x, y, w, h]
+}
+
+// One request for a whole grid of covers: returns an object URL plus the tile offsets
+export const getCoverAtlas = async (albumIds: number[], size = 150, columns = 8) => {
+  const response = await api.get<Blob>('/covers/atlas', {
+    params: { ids: albumIds.join(','), size, columns },
+    responseType: 'blob',
+  });
+  const layout: CoverAtlasLayout = JSON.parse(response.headers['x-atlas-layout'] || '{"tile":0,"columns":0,"tiles":{}}');
+  return { url: URL.createObjectURL(response.data), layout };
 };
 
 // --- ARTISTS ---
 export interface Artist {
   name: string;
   album_count: number;
+  song_count?: number;
   cover_example: number;
 }
 
@@ -105,6 +165,51 @@ export const getMostPlayed = async (limit = 50) => {
   return Array.isArray(response.data) ? response.data : [];
 };
 
+// Rule node: a condition ({ field, op, value }) or a group ({ match, rules })
+export interface SmartRuleNode {
+  field?: string;
+  op?: string;
+  value?: unknown;
+  match?: 'all' | 'any' | 'none';
+  rules?: SmartRuleNode[];
+}
+
+export interface SmartRules {
+  match?: 'all' | 'any' | 'none';
+  rules: SmartRuleNode[];
+  sort_by?: string;
+  order?: 'asc' | 'desc';
+  limit?: number;
+}
+
+export interface SmartPlaylist {
+  id: number;
+  name: string;
+  rules: SmartRules;
+  materialize: boolean;
+  materialized_rev?: number | null;
+}
+
+export const getSmartPlaylists = async () => {
+  const response = await api.get<SmartPlaylist[]>('/smart-playlists');
+  return Array.isArray(response.data) ? response.data : [];
+};
+
+export const createSmartPlaylist = async (name: string, rules: SmartRules, materialize = false) => {
+  const response = await api.post<SmartPlaylist>('/smart-playlists', { name, rules, materialize });
+  return response.data;
+};
+
+export const getSmartPlaylistSongs = async (id: number, offset = 0, limit = 5000) => {
+  const response = await api.get<Song[]>(`/smart-playlists/${id}/songs`, { params: { offset, limit } });
+  return Array.isArray(response.data) ? response.data : [];
+};
+
+export const previewSmartPlaylist = async (rules: SmartRules, limit = 500) => {
+  const response = await api.post<Song[]>('/smart-playlists/preview', rules, { params: { limit } });
+  return Array.isArray(response.data) ? response.data : [];
+};
+
 export const incrementPlayCount = async (songId: number) => {
   const response = await api.post<{ play_count: number }>(`/library/songs/${songId}/play`);
   return response.data;
@@ -118,6 +223,9 @@ export const toggleFavorite = async (songId: number) => {
 export interface Playlist {
   id: number;
   name: string;
+  song_count?: number;
+  duration?: number;
+  cover_album_ids?: number[];
 }
 
 export const getPlaylists = async () => {
@@ -130,8 +238,18 @@ export const createPlaylist = async (name: string) => {
   return response.data;
 };
 
-export const addToPlaylist = async (playlistId: number, songIds: number[]) => {
-  await api.post(`/playlists/${playlistId}/add`, { song_ids: songIds });
+export const addToPlaylist = async (playlistId: number, songIds: number[], position?: number) => {
+  await api.post(`/playlists/${playlistId}/add`, { song_ids: songIds, position });
+};
+
+// Move a song right after `afterSongId` (null = to the top), without touching other rows
+export const movePlaylistSong = async (playlistId: number, songId: number, afterSongId: number | null, beforeSongId: number | null) => {
+  await api.post(`/playlists/${playlistId}/move`, {
+    song_id: songId,
+    after_song_id: afterSongId ?? undefined,
+    before_song_id: afterSongId === null ? beforeSongId ?? undefined : undefined,
+    position: afterSongId === null && beforeSongId === null ? 0 : undefined,
+  });
 };
 
 export const removeSongFromPlaylist = async (playlistId: number, songId: number) => {
@@ -142,9 +260,47 @@ export const reorderPlaylist = async (playlistId: number, songIds: number[]) =>
   await api.post(`/playlists/${playlistId}/reorder`, { song_ids: songIds });
 };
 
+const PLAYLIST_PAGE_SIZE = 5000;
+
 export const getPlaylistSongs = async (id: string) => {
-  const response = await api.get<Song[]>(`/playlists/${id}/songs`);
-  return Array.isArray(response.data) ? response.data : [];
+  // Songs come back in pages; keep fetching until a short page
+  const songs: Song[] = [];
+  for (let offset = 0; ; offset += PLAYLIST_PAGE_SIZE) {
+    const response = await api.get<Song[]>(`/playlists/${id}/songs`, {
+      params: { offset, limit: PLAYLIST_PAGE_SIZE }
+    });
+    const page = Array.isArray(response.data) ? response.data : [];
+    songs.push(...page);
+    if (page.length < PLAYLIST_PAGE_SIZE) return songs;
+  }
+};
+
+export interface PlaylistImportReport {
+  playlist_id: number;
+  name: string;
+  entries: number;
+  added: number;
+  skipped: number;
+  unresolved_count: number;
+  unresolved: string[];
+  // Entries matched only by a folder/file tail
+  fuzzy_count: number;
+  fuzzy: { entry: string; song_id: number }[];
+  fuzzy_added: boolean;
+}
+
+// Import an .m3u/.m3u8 file into a new playlist, or into `playlistId`
+export const importPlaylist = async (file: File, playlistId?: number, acceptFuzzy = false) => {
+  const form = new FormData();
+  form.append('file', file);
+  if (playlistId !== undefined) form.append('playlist_id', String(playlistId));
+  if (acceptFuzzy) form.append('accept_fuzzy', 'true');
+  const response = await api.post<PlaylistImportReport>('/playlists/import', form);
+  return response.data;
+};
+
+export const getPlaylistExportUrl = (id: number, format: 'm3u' | 'm3u8' = 'm3u8') => {
+  return `${API_BASE}/playlists/${id}/export?format=${format}`;
 };
 
 export const deletePlaylist = async (id: number) => {
@@ -172,8 +328,19 @@ export const getLyrics = async (songId: number) => {
   return response.data;
 };
 
+export const getLyricsBatch = async (songIds: number[]) => {
+  const response = await api.post('/lyrics/batch', { ids: songIds });
+  return response.data;
+};
+
 export const getStreamUrl = (songId: number) => {
   return `${API_BASE}/stream/${songId}`;
 };
 
+// Ask the backend to warm the start of upcoming tracks (best effort)
+export const prefetchStreams = async (songIds: number[]) => {
+  if (songIds.length === 0) return;
+  await api.post('/stream/prefetch', { ids: songIds });
+};
+
 export default api;
\ No newline at end of file
@@ -43,15 +43,14 @@ function PlaylistCard({ playlist }: { playlist: Playlist }) {
   const queryClient = useQueryClient();
   const [showMenu, setShowMenu] = useState(false);
 
-  // Fetch first song to get cover art
-  const { data: songs } = useQuery({
-    queryKey: ['playlist-songs', playlist.id],
-    queryFn: () => getPlaylistSongs(playlist.id.toString()),
-  });
-
-  const handlePlay = (e: React.MouseEvent) => {
+  const handlePlay = async (e: React.MouseEvent) => {
     e.stopPropagation();
-    if (songs && songs.length > 0) {
+    // Songs are only needed to play; the card itself renders from the summary
+    const songs = await queryClient.fetchQuery({
+      queryKey: ['playlist-songs', playlist.id],
+      queryFn: () => getPlaylistSongs(playlist.id.toString()),
+    });
+    if (songs.length > 0) {
       setQueue(songs);
       playSong(songs[0]);
     } else {
@@ -88,7 +87,7 @@ function PlaylistCard({ playlist }: { playlist: Playlist }) {
   };
 
   // Determine Cover Art (First song's album)
-  const coverArtId = songs?.[0]?.album_id;
+  const coverArtId = playlist.cover_album_ids?.[0];
 
   return (
     <div
@@ -145,7 +144,7 @@ function PlaylistCard({ playlist }: { playlist: Playlist }) {
       {/* Text Info */}
       <div className="mt-3">
         <h3 className="font-medium text-apple-text truncate">{playlist.name}</h3>
-        <p className="text-xs text-apple-subtext">{songs?.length || 0} Songs</p>
+        <p className="text-xs text-apple-subtext">{playlist.song_count || 0} Songs</p>
       </div>
     </div>
   );
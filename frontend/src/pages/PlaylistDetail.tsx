@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useQuery, useQueryClient } from '@tanstack/react-query';
-import { getPlaylistSongs, getPlaylists, deletePlaylist, getCoverUrl, removeSongFromPlaylist, reorderPlaylist } from '../lib/api';
+import { getPlaylistSongs, getPlaylists, deletePlaylist, getCoverUrl, removeSongFromPlaylist, movePlaylistSong } from '../lib/api';
 import { usePlayerStore } from '../stores/playerStore';
 import { useThemeStore } from '../stores/themeStore';
 import { useToastStore } from '../stores/toastStore';
@@ -176,8 +176,11 @@ export function PlaylistDetail() {
         const newIndex = items.findIndex((i) => i.uniqueId === over.id);
         const newItems = arrayMove(items, oldIndex, newIndex);
 
-        // Optimistic update
-        reorderPlaylist(Number(id), newItems.map(i => i.id)).catch(() => {
+        // Optimistic update; the server only rewrites the moved row
+        const moved = newItems[newIndex];
+        const prev = newItems[newIndex - 1];
+        const next = newItems[newIndex + 1];
+        movePlaylistSong(Number(id), moved.id, prev ? prev.id : null, next ? next.id : null).catch(() => {
           addToast('Failed to save order', 'error');
           queryClient.invalidateQueries({ queryKey: ['playlist-songs', id] });
         });
@@ -195,6 +198,7 @@ export function PlaylistDetail() {
 
     try {
       await removeSongFromPlaylist(Number(id), songId);
+      queryClient.invalidateQueries({ queryKey: ['playlists'] });
       // addToast('Song removed'); // Optional toast, maybe too noisy
     } catch {
       addToast('Failed to remove song', 'error');
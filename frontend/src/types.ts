@@ -14,6 +14,7 @@ export interface Album {
   barcode?: string;
   catalog_number?: string;
   song_count?: number;
+  art_hash?: string | null;
 }
 
 export interface Song {